@@ -0,0 +1,46 @@
+"""
+@Desc: Writes files atomically. The data goes to a temporary file next to the target,
+       which is synced and then renamed over it, so a crash (or the app being killed)
+       mid-write leaves either the old file or the new one, never half of one.
+"""
+
+import os
+
+TEMP_SUFFIX = '.part'
+
+
+"""
+@desc: Renames src over dst, replacing dst if it exists.
+"""
+def replace_file(src, dst):
+    replace = getattr(os, 'replace', None)
+    if replace is not None:
+        replace(src, dst)
+        return
+
+    # Python 2 has no os.replace. rename replaces atomically on posix (android included),
+    # but fails on windows if dst exists.
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+"""
+@desc: Atomically replaces the file at path with data.
+@param: data - the whole file as bytes.
+@raise: IOError/OSError if it couldn't be written. (The old file is left alone)
+"""
+def write_file(path, data):
+    temp_path = path + TEMP_SUFFIX
+    try:
+        with open(temp_path, 'wb') as stream:
+            stream.write(data)
+            stream.flush()
+            os.fsync(stream.fileno())
+        replace_file(temp_path, path)
+    except (IOError, OSError):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,443 @@
+"""
+@Desc: Autosaves the machine being edited, so it can be recovered after a crash
+       (or the os killing the app). Rather than rewriting the whole machine every
+       time it changes, every undo handler action is appended to a journal. Every
+       so often the journal is compacted: a snapshot of the whole machine is written
+       and the journal started again. Both go through atomic renames, and all of the
+       file io happens on a background thread, so editing never waits on the disk.
+       (The guis are only captured when the whole machine is replaced, on the next frame,
+       as the undo handler is reset before the new machine has been loaded into them)
+
+       temp/autosave.snapshot - the machine when the journal was last compacted, as json.
+       temp/autosave.journal  - the actions done since, as length prefixed json.
+
+       Actions are journaled as the plain data ops they do to the machine (see
+       MachineAction.get_journal_ops), never as the action objects, so nothing in the
+       temp directory is unpickled and renaming an action class can't break recovery.
+       The writer thread applies the ops to its own plain copy of the machine as it
+       journals them, so compacting writes that copy out rather than walking the guis.
+
+       Snapshots and journals carry a generation number. A journal is only replayed
+       on top of the snapshot with the same generation, so dying between writing a
+       snapshot and starting the new journal can't replay actions twice.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import struct
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from kivy.clock import Clock
+
+from atomicfile import write_file
+
+SNAPSHOT_FILE = 'autosave.snapshot'
+JOURNAL_FILE = 'autosave.journal'
+
+JOURNAL_MAGIC = b'TMJ\x01'
+# magic, generation
+JOURNAL_HEADER = struct.Struct('<4sI')
+RECORD_LENGTH = struct.Struct('<I')
+
+
+
+"""
+@desc: Copies everything needed to rebuild the machine out of the guis, as plain data.
+       Unlike TuringMachine.from_gui this keeps the unique ids, which the journaled actions refer to.
+       (As they are, not get_unique_id's strings, as transitions are looked up by the raw id)
+       The tape is the one the user set, not wherever a run in run mode has got it to.
+"""
+def capture_machine(tm_gui, tape_gui):
+    states = []
+    for state in tm_gui.states:
+        states.append((state.name, (state.pos[0], state.pos[1]), state.final_state,
+                       state is tm_gui.start_state, state.unique_id))
+
+    transitions = []
+    for transition in tm_gui.transitions:
+        transitions.append((transition.from_state.name, transition.to_state.name,
+                            (transition.anchor_offset[0], transition.anchor_offset[1]), transition.direction,
+                            transition.read_sym, transition.write_sym, transition.unique_id))
+
+    return {'tape': tape_gui.initial_tape or '', 'unique_id': tm_gui.unique_id,
+            'states': states, 'transitions': transitions}
+
+
+"""
+@desc: Replaces the machine in the guis with one from capture_machine.
+"""
+def restore_machine(snapshot, tm_gui, tape_gui):
+    tm_gui.create_new_machine()
+    tape_gui.set_initial_tape(snapshot['tape'])
+
+    tm_gui.begin_batch()
+    try:
+        for name, pos, final, start, unique_id in snapshot['states']:
+            state = tm_gui.add_state(pos, True, name, True, unique_id)
+            if final:
+                state.set_final_state(True)
+            if start:
+                state.set_start_state(True)
+                tm_gui.start_state = state
+
+        for from_name, to_name, anchor_offset, direction, read_sym, write_sym, unique_id in snapshot['transitions']:
+            tm_gui.add_transition(tm_gui.get_state_by_name(from_name), tm_gui.get_state_by_name(to_name),
+                                  anchor_offset, direction, read_sym, write_sym, unique_id, True)
+    finally:
+        tm_gui.end_batch()
+
+    # New objects must not reuse the restored ids.
+    tm_gui.unique_id = max(tm_gui.unique_id, snapshot['unique_id'])
+
+
+"""
+@desc: Copies a machine from capture_machine (or read back from json) into the lists apply_ops changes.
+"""
+def copy_machine(snapshot):
+    states = [[name, (pos[0], pos[1]), final, start, unique_id]
+              for name, pos, final, start, unique_id in snapshot['states']]
+    transitions = [[from_name, to_name, (anchor_offset[0], anchor_offset[1]), direction, read_sym, write_sym, unique_id]
+                   for from_name, to_name, anchor_offset, direction, read_sym, write_sym, unique_id
+                   in snapshot['transitions']]
+    return {'tape': snapshot['tape'], 'unique_id': int(snapshot['unique_id']),
+            'states': states, 'transitions': transitions}
+
+
+"""
+@desc: Does journaled ops (see MachineAction.get_journal_ops) to a machine from copy_machine, the way
+       their actions do them to the guis. Ops on states or transitions which aren't there are skipped.
+"""
+def apply_ops(machine, ops):
+    states = machine['states']
+    transitions = machine['transitions']
+
+    for op in ops:
+        kind = op[0]
+        if kind == 'add_state':
+            name, pos, final, start, unique_id = op[1:]
+            states.append([name, (pos[0], pos[1]), final, start, unique_id])
+            machine['unique_id'] = max(machine['unique_id'], int(unique_id))
+
+        elif kind == 'delete_state':
+            state = find_state(states, op[1])
+            if state is not None:
+                states.remove(state)
+                # Deleting a state deletes its transitions.
+                transitions[:] = [transition for transition in transitions
+                                  if transition[0] != op[1] and transition[1] != op[1]]
+
+        elif kind == 'add_transition':
+            from_name, to_name, anchor_offset, direction, read_sym, write_sym, unique_id = op[1:]
+            transitions.append([from_name, to_name, (anchor_offset[0], anchor_offset[1]), direction,
+                                read_sym, write_sym, unique_id])
+            machine['unique_id'] = max(machine['unique_id'], int(unique_id))
+
+        elif kind == 'delete_transition':
+            transition = find_by_id(transitions, op[2], 6)
+            if transition is not None and transition[0] == op[1]:
+                transitions.remove(transition)
+
+        elif kind == 'rename_state':
+            state = find_state(states, op[1])
+            if state is not None:
+                state[0] = op[2]
+                for transition in transitions:
+                    if transition[0] == op[1]:
+                        transition[0] = op[2]
+                    if transition[1] == op[1]:
+                        transition[1] = op[2]
+
+        elif kind == 'set_final' or kind == 'set_start':
+            state = find_state(states, op[1])
+            if state is not None:
+                state[2 if kind == 'set_final' else 3] = op[2]
+
+        elif kind == 'move':
+            # States move their position, transitions their anchor.
+            state = find_by_id(states, op[1], 4)
+            if state is not None:
+                state[1] = (op[2][0], op[2][1])
+            else:
+                transition = find_by_id(transitions, op[1], 6)
+                if transition is not None:
+                    transition[2] = (op[2][0], op[2][1])
+
+        elif kind == 'set_transition':
+            transition = find_by_id(transitions, op[1], 6)
+            if transition is not None:
+                # Like update_transition_vals, None leaves a value as it is.
+                for index, value in ((3, op[2]), (4, op[3]), (5, op[4])):
+                    if value:
+                        transition[index] = value
+
+        elif kind == 'set_tape':
+            machine['tape'] = op[1]
+
+        else:
+            raise ValueError('Unknown journal op: ' + str(kind))
+
+
+# The first state with the name, as tm_gui.get_state_by_name.
+def find_state(states, name):
+    for state in states:
+        if state[0] == name:
+            return state
+    return None
+
+
+# Ids are compared as get_unique_id's strings, as some actions keep the raw id and some the string.
+def find_by_id(objects, unique_id, id_index):
+    unique_id = str(unique_id)
+    for obj in objects:
+        if str(obj[id_index]) == unique_id:
+            return obj
+    return None
+
+
+class AutoSaver:
+
+    """
+    @param: directory - where to keep the snapshot and journal (main.py uses its temp directory)
+    @param: compact_after - the number of journaled actions before the journal is compacted.
+    """
+
+    def __init__(self, directory, compact_after=200):
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.compact_after = compact_after
+
+        self.tm_gui = None
+        self.tape_gui = None
+
+        self.generation = 0
+        self.records = 0
+        self.capture_pending = False
+
+        # Work for the writer thread: (compact, generation, capture or None), (record, ops) or None to stop.
+        self.jobs = queue.Queue()
+        self.writer = None
+        self.journal = None
+        # The writer's copy of the machine (see copy_machine), which only the writer thread touches.
+        self.machine = None
+
+    """
+    @desc: Starts autosaving the machine in the guis, beginning with a snapshot of it.
+    """
+    def start(self, tm_gui, tape_gui):
+        self.tm_gui = tm_gui
+        self.tape_gui = tape_gui
+
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.run_writer)
+            self.writer.daemon = True
+            self.writer.start()
+        self.capture()
+
+    """
+    @desc: Stops the writer thread once everything queued so far has been written.
+    """
+    def stop(self, timeout=5):
+        if self.writer is not None:
+            self.jobs.put(None)
+            self.writer.join(timeout)
+            self.writer = None
+
+    # ------------------------ CALLED BY THE UNDO HANDLER ----------------------- #
+
+    def add_action(self, action):
+        self.record(action, True)
+
+    def undo_action(self, action):
+        self.record(action, False)
+
+    def redo_action(self, action):
+        self.record(action, True)
+
+    """
+    @desc: The undo handler was reset, so the whole machine has been replaced (a load or a new machine)
+    """
+    def reset(self):
+        self.request_capture()
+
+    """
+    @desc: Queues the ops an action did (or undid) for the journal.
+    """
+    def record(self, action, redo):
+        if self.writer is None:
+            return
+
+        ops = action.get_journal_ops()
+        if ops is None:
+            # The capture has everything the action did anyway.
+            print('Could not journal ' + type(action).__name__ + ', capturing the machine instead')
+            self.request_capture()
+            return
+
+        self.jobs.put(('record', ops[0] if redo else ops[1]))
+        self.records += 1
+        if self.records >= self.compact_after:
+            self.compact()
+
+    """
+    @desc: Captures the machine from the guis on the next frame, once whatever is being done to it has finished.
+    """
+    def request_capture(self):
+        if self.writer is not None and not self.capture_pending:
+            self.capture_pending = True
+            Clock.schedule_once(self.capture_scheduled)
+
+    def capture_scheduled(self, dt):
+        if self.capture_pending:
+            self.capture()
+
+    """
+    @desc: Replaces the writer's copy of the machine with the one in the guis, and compacts.
+           This walks every state and transition, so is only done when the whole machine changes.
+           Only call this between edits (see request_capture)
+    """
+    def capture(self):
+        if self.writer is None:
+            return
+
+        self.capture_pending = False
+        self.generation += 1
+        self.records = 0
+        self.jobs.put(('compact', self.generation, capture_machine(self.tm_gui, self.tape_gui)))
+
+    """
+    @desc: Queues a snapshot of the writer's copy of the machine, which the journal then starts again from.
+           Costs nothing on this thread, so is fine to call from on_pause.
+    """
+    def compact(self):
+        if self.writer is None:
+            return
+
+        self.generation += 1
+        self.records = 0
+        self.jobs.put(('compact', self.generation, None))
+
+    # ------------------------ WRITER THREAD ----------------------- #
+
+    def run_writer(self):
+        running = True
+        while running:
+            jobs = [self.jobs.get()]
+            # Write everything that has built up in one go, then sync once.
+            try:
+                while True:
+                    jobs.append(self.jobs.get_nowait())
+            except queue.Empty:
+                pass
+
+            for job in jobs:
+                if job is None:
+                    running = False
+                    break
+                try:
+                    if job[0] == 'compact':
+                        if job[2] is not None:
+                            self.machine = copy_machine(job[2])
+                        self.write_snapshot(job[1])
+                    else:
+                        apply_ops(self.machine, job[1])
+                        if self.journal is not None:
+                            data = json.dumps(job[1]).encode('utf-8')
+                            self.journal.write(RECORD_LENGTH.pack(len(data)) + data)
+                except (IOError, OSError, TypeError, ValueError) as error:
+                    print('Autosave failed: ' + str(error))
+                    self.close_journal()
+
+            try:
+                if self.journal is not None:
+                    self.journal.flush()
+                    os.fsync(self.journal.fileno())
+            except (IOError, OSError) as error:
+                print('Autosave failed: ' + str(error))
+                self.close_journal()
+
+        self.close_journal()
+
+    """
+    @desc: Atomically replaces the snapshot with the writer's copy of the machine,
+           then starts a new empty journal for it.
+    """
+    def write_snapshot(self, generation):
+        self.close_journal()
+
+        write_file(self.snapshot_path, json.dumps([generation, self.machine]).encode('utf-8'))
+        write_file(self.journal_path, JOURNAL_HEADER.pack(JOURNAL_MAGIC, generation))
+        self.journal = open(self.journal_path, 'ab')
+
+    def close_journal(self):
+        if self.journal is not None:
+            try:
+                self.journal.close()
+            except (IOError, OSError):
+                pass
+            self.journal = None
+
+    # ------------------------ RECOVERY ----------------------- #
+
+    """
+    @desc: Reads the last autosaved machine, with the journal replayed on top of the snapshot.
+           Only json is read, so a corrupt or planted file can't do more than fail to load.
+    @return: the machine (see copy_machine), or None if there is nothing to recover.
+    """
+    def read_autosave(self):
+        try:
+            with open(self.snapshot_path, 'rb') as stream:
+                generation, snapshot = json.loads(stream.read().decode('utf-8'))
+            machine = copy_machine(snapshot)
+        except (IOError, OSError, ValueError, TypeError, KeyError, AttributeError):
+            return None
+
+        try:
+            with open(self.journal_path, 'rb') as stream:
+                data = stream.read()
+        except (IOError, OSError):
+            return machine
+
+        if len(data) < JOURNAL_HEADER.size:
+            return machine
+        magic, journal_generation = JOURNAL_HEADER.unpack_from(data, 0)
+        if magic != JOURNAL_MAGIC or journal_generation != generation:
+            return machine
+
+        offset = JOURNAL_HEADER.size
+        while offset + RECORD_LENGTH.size <= len(data):
+            length = RECORD_LENGTH.unpack_from(data, offset)[0]
+            offset += RECORD_LENGTH.size
+            # A record cut short by a crash, and so everything after it, is dropped.
+            if offset + length > len(data):
+                break
+            try:
+                apply_ops(machine, json.loads(data[offset:offset + length].decode('utf-8')))
+            except (ValueError, TypeError, KeyError, IndexError):
+                print('Could not replay the autosave journal, stopping recovery there')
+                break
+            offset += length
+
+        return machine
+
+    """
+    @desc: Loads the last autosaved machine into the guis. Call this before start().
+    @return: True if a machine was recovered.
+    """
+    def recover(self, tm_gui, tape_gui):
+        machine = self.read_autosave()
+        if machine is None:
+            return False
+
+        if not machine['states'] and not machine['tape']:
+            return False
+
+        restore_machine(machine, tm_gui, tape_gui)
+        tm_gui.undo_handler.reset()
+        return True
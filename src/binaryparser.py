@@ -0,0 +1,215 @@
+"""
+@Desc: Loads and saves turing machines in a compact binary format (.tmb),
+       as an alternative to the XML .tm format. (Both go through turingmachine.TuringMachine,
+       so a machine round trips between them)
+
+       Layout, all little endian:
+           header      - see HEADER below.
+           strings     - string_count strings, each a uint32 byte length then utf-8 bytes.
+                         Names, symbols, the alphabet and the initial tape are all
+                         referred to by their index in here.
+           states      - state_count STATE records.
+           transitions - transition_count TRANSITION records, grouped by from state
+                         in the order they were added.
+
+       Positions and control points are stored as int16 (the XML format stores whole
+       numbers too), so anything outside +-32767 is clamped.
+       Files are read through mmap, so only the records are ever unpacked.
+
+       python binaryparser.py machine.tm machine.tmb (converts either way)
+"""
+
+from __future__ import print_function
+
+import mmap
+import struct
+import sys
+
+from atomicfile import write_file
+from turingmachine import TuringMachine
+
+TMB_EXTENSION = '.tmb'
+TMB_MAGIC = b'TMB\x00'
+# Bump this when the layout changes. Files newer than this can't be read.
+TMB_VERSION = 1
+
+# magic, version, flags, string_count, state_count, transition_count,
+# alphabet, blank, initial tape (string indices), start state index (-1 for none)
+HEADER = struct.Struct('<4sHHIIIIIIi')
+# name (string index), x, y, flags
+STATE = struct.Struct('<IhhB')
+# from state, to state, read, write, move (string indices), ctlx, ctly
+TRANSITION = struct.Struct('<IIIIIhh')
+STRING_LENGTH = struct.Struct('<I')
+
+STATE_FINAL = 1
+
+
+def clamp_int16(value):
+    return max(-32768, min(32767, int(value)))
+
+
+class BinaryParser:
+
+    """
+    STATIC METHOD
+    @desc: Returns true if the path is for a binary machine file.
+    """
+    def is_binary_path(path):
+        return path.lower().endswith(TMB_EXTENSION)
+
+    is_binary_path = staticmethod(is_binary_path)
+
+    """
+    STATIC METHOD
+    @desc: Loads a .tmb file.
+    @param: path - path of a .tmb file.
+    @return: the TuringMachine (see turingmachine.py), or None if the file couldn't be read.
+    """
+    def parse_machine(path):
+        try:
+            with open(path, 'rb') as stream:
+                try:
+                    data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty files can't be mapped.
+                    print('Invalid tmb file: ' + str(path))
+                    return None
+        except (IOError, OSError):
+            print('Invalid path:' + str(path))
+            return None
+
+        try:
+            return BinaryParser.unpack_machine(data)
+        except (struct.error, IndexError, ValueError):
+            print('Invalid tmb file: ' + str(path))
+            return None
+        finally:
+            data.close()
+
+    parse_machine = staticmethod(parse_machine)
+
+    """
+    STATIC METHOD
+    @desc: Reads a machine out of a buffer holding a whole .tmb file.
+    """
+    def unpack_machine(data):
+        (magic, version, flags, string_count, state_count, transition_count,
+         alphabet, blank, initial_tape, start_index) = HEADER.unpack_from(data, 0)
+        if magic != TMB_MAGIC:
+            raise ValueError('Not a tmb file')
+        if version > TMB_VERSION:
+            raise ValueError('Unsupported tmb version: ' + str(version))
+        offset = HEADER.size
+
+        strings = []
+        for i in range(string_count):
+            length = STRING_LENGTH.unpack_from(data, offset)[0]
+            offset += STRING_LENGTH.size
+            if offset + length > len(data):
+                raise ValueError('String past the end of the file')
+            strings.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+
+        machine = TuringMachine(strings[alphabet], strings[blank], strings[initial_tape])
+
+        states = []
+        for i in range(state_count):
+            name, x, y, state_flags = STATE.unpack_from(data, offset)
+            offset += STATE.size
+            state = machine.add_state(strings[name], (x, y))
+            state.set_final_state(bool(state_flags & STATE_FINAL))
+            states.append(state)
+
+        if start_index >= 0:
+            machine.set_start_state(states[start_index])
+
+        for i in range(transition_count):
+            from_state, to_state, read_sym, write_sym, move, ctlx, ctly = TRANSITION.unpack_from(data, offset)
+            offset += TRANSITION.size
+            machine.add_transition(states[from_state], states[to_state], strings[move], strings[read_sym],
+                                   strings[write_sym], (ctlx, ctly))
+
+        return machine
+
+    unpack_machine = staticmethod(unpack_machine)
+
+    """
+    STATIC METHOD
+    @desc: Saves a TuringMachine as a .tmb file.
+    @param: path - path to save the machine at.
+    @param: machine - the TuringMachine to save.
+    """
+    def write_machine(path, machine):
+        try:
+            write_file(path, BinaryParser.pack_machine(machine))
+        except (IOError, OSError):
+            print('Invalid path:' + str(path))
+            return False
+        return True
+
+    write_machine = staticmethod(write_machine)
+
+    """
+    STATIC METHOD
+    @return: the whole .tmb file for a machine as bytes.
+    """
+    def pack_machine(machine):
+        strings = []
+        string_ids = {}
+
+        def add_string(string):
+            string = string or ''
+            string_id = string_ids.get(string)
+            if string_id is None:
+                string_id = len(strings)
+                string_ids[string] = string_id
+                strings.append(string)
+            return string_id
+
+        alphabet = add_string(machine.alphabet)
+        blank = add_string(machine.blank_char)
+        initial_tape = add_string(machine.initial_tape)
+
+        state_ids = {}
+        state_records = []
+        for state in machine.states:
+            state_ids[state] = len(state_ids)
+            state_flags = STATE_FINAL if state.final_state else 0
+            state_records.append(STATE.pack(add_string(state.name), clamp_int16(state.pos[0]),
+                                            clamp_int16(state.pos[1]), state_flags))
+
+        transition_records = []
+        for state in machine.states:
+            for transition in state.out_transitions:
+                transition_records.append(TRANSITION.pack(
+                    state_ids[state], state_ids[transition.to_state], add_string(transition.read_sym),
+                    add_string(transition.write_sym), add_string(transition.direction),
+                    clamp_int16(transition.anchor_offset[0]), clamp_int16(transition.anchor_offset[1])))
+
+        start_index = state_ids[machine.start_state] if machine.start_state else -1
+        header = HEADER.pack(TMB_MAGIC, TMB_VERSION, 0, len(strings), len(state_records),
+                             len(transition_records), alphabet, blank, initial_tape, start_index)
+
+        parts = [header]
+        for string in strings:
+            encoded = string.encode('utf-8')
+            parts.append(STRING_LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+        parts.extend(state_records)
+        parts.extend(transition_records)
+        return b''.join(parts)
+
+    pack_machine = staticmethod(pack_machine)
+
+
+if __name__ == '__main__':
+    from xmlparser import XmlParser
+
+    if len(sys.argv) != 3:
+        print('Usage: python binaryparser.py source.(tm|tmb) dest.(tm|tmb)')
+        sys.exit(1)
+
+    machine = XmlParser.read_machine_file(sys.argv[1])
+    if machine is None or not XmlParser.write_machine_file(sys.argv[2], machine):
+        sys.exit(1)
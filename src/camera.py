@@ -0,0 +1,90 @@
+"""
+@Desc: The view MachineScreen shows the machine through. Holds the pan and zoom as a scale and
+       an offset (screen = world * scale + offset), so converting a point is a multiply and an add
+       either way, rather than a 4x4 matrix product (and an inversion going to world space).
+       The kivy Matrix for the fbo is only built when the fbo next needs it.
+       Screen positions here are relative to the MachineScreen, not the window.
+"""
+
+from kivy.graphics.transformation import Matrix
+
+
+class Camera:
+
+    def __init__(self):
+        self.scale = 1.0
+        self.inverse_scale = 1.0
+        # Where the world origin is on screen.
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+
+        # Built by get_matrix, forgotten whenever the camera moves.
+        self.matrix = None
+
+    """
+    @desc: Moves the view so the world moves by delta on screen. (delta in world units)
+    """
+    def pan(self, delta):
+        self.offset_x += delta[0] * self.scale
+        self.offset_y += delta[1] * self.scale
+        self.matrix = None
+
+    """
+    @desc: Scales the view by factor about a world point, which stays where it is on screen.
+    """
+    def zoom(self, origin, factor):
+        self.zoom_to(origin, self.scale * factor)
+
+    """
+    @desc: Sets the scale of the view, keeping the world point origin where it is on screen.
+    """
+    def zoom_to(self, origin, scale):
+        self.offset_x += origin[0] * (self.scale - scale)
+        self.offset_y += origin[1] * (self.scale - scale)
+        self.scale = scale
+        self.inverse_scale = 1.0 / scale
+        self.matrix = None
+
+    """
+    @return: the view as a kivy Matrix, for the fbo's MatrixInstruction.
+    """
+    def get_matrix(self):
+        if self.matrix is None:
+            self.matrix = Matrix().translate(self.offset_x, self.offset_y, 0).multiply(
+                Matrix().scale(self.scale, self.scale, self.scale))
+        return self.matrix
+
+    def to_world(self, pos):
+        return ((pos[0] - self.offset_x) * self.inverse_scale, (pos[1] - self.offset_y) * self.inverse_scale)
+
+    def to_screen(self, pos):
+        return (pos[0] * self.scale + self.offset_x, pos[1] * self.scale + self.offset_y)
+
+    """
+    @desc: Converts many screen points to world space at once. (Cheaper than to_world for each)
+    @param: points - a list of (x, y)
+    @return: a list of (x, y)
+    """
+    def to_world_points(self, points):
+        inverse_scale = self.inverse_scale
+        offset_x = self.offset_x
+        offset_y = self.offset_y
+        return [((x - offset_x) * inverse_scale, (y - offset_y) * inverse_scale) for x, y in points]
+
+    """
+    @desc: Converts many world points to screen space at once.
+    @param: points - a list of (x, y)
+    @return: a list of (x, y)
+    """
+    def to_screen_points(self, points):
+        scale = self.scale
+        offset_x = self.offset_x
+        offset_y = self.offset_y
+        return [(x * scale + offset_x, y * scale + offset_y) for x, y in points]
+
+    """
+    @return: the world area (left, bottom, right, top) seen on a screen of the given size.
+    """
+    def get_view_bounds(self, size):
+        (left, bottom), (right, top) = self.to_world_points([(0, 0), size])
+        return (left, bottom, right, top)
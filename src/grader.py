@@ -0,0 +1,186 @@
+"""
+@Desc: Batch grades .tm files from the command line, without kivy.
+       Every machine in a directory is run against every tape in a tape file
+       (one tape per line, an empty line is an empty tape) on a process pool,
+       and a CSV or JSON report is written with the halt status, final tape,
+       steps and wall time of each run. A run which raises an error (a machine
+       which can't be loaded, too many tape symbols etc) is reported with the
+       error status and message, and grading carries on.
+
+       python grader.py submissions/ tapes.txt -o report.csv --steps 1000000 --timeout 5
+       python grader.py submissions/ tapes.txt --macro 32 (runs on the macro step engine)
+"""
+
+from __future__ import print_function
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from xmlparser import XmlParser
+from turingengine import CompiledMachine, TuringEngine, HALT_STEP_LIMIT
+from macroengine import MacroEngine
+
+# Statuses for runs which didn't get a halt reason from the engine.
+STATUS_TIMEOUT = 'timeout'
+STATUS_ERROR = 'error'
+
+REPORT_FIELDS = ['machine', 'tape', 'status', 'final_tape', 'steps', 'time', 'error']
+
+
+"""
+@desc: Loads a .tm or .tmb file as a TuringMachine (see turingmachine.py)
+@return: the machine, or None if it couldn't be loaded.
+"""
+def load_model(path):
+    try:
+        return XmlParser.read_machine_file(path)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        print('Invalid machine: ' + str(path), file=sys.stderr)
+        return None
+
+
+"""
+@desc: Runs one machine against every tape. (Called on the pool's worker processes)
+@param: job - (path, tapes, max_steps, timeout, block_size). The timeout is per tape, and is checked
+              between chunks of steps, so a run may go over it by one chunk.
+              block_size runs on a MacroEngine (see macroengine.py) with blocks of that size, or None
+              for the plain engine.
+@return: a list of report rows, one per tape.
+"""
+def grade_machine(job):
+    path, tapes, max_steps, timeout, block_size = job
+    name = os.path.basename(path)
+    rows = []
+
+    # Any error loading or compiling the machine fails every tape.
+    try:
+        model = load_model(path)
+        if model is None:
+            raise ValueError('invalid machine')
+        if model.start_state is None:
+            raise ValueError('no start state')
+
+        machine = CompiledMachine(model.states, model.start_state, model.blank_char)
+        if block_size:
+            engine = MacroEngine(machine, '', block_size=block_size)
+        else:
+            engine = TuringEngine(machine, '')
+    except Exception as error:
+        for tape_str in tapes:
+            rows.append([name, tape_str, STATUS_ERROR, '', 0, 0.0, describe_error(error)])
+        return rows
+
+    for tape_str in tapes:
+        start_time = time.time()
+        try:
+            status = run_tape(engine, tape_str, max_steps, timeout, start_time)
+            rows.append([name, tape_str, status, engine.get_tape_str(), engine.steps,
+                         round(time.time() - start_time, 6), ''])
+        except Exception as error:
+            rows.append([name, tape_str, STATUS_ERROR, '', 0, round(time.time() - start_time, 6),
+                         describe_error(error)])
+
+    return rows
+
+
+"""
+@desc: Runs the engine on a tape until it halts, or runs out of steps or time. (See grade_machine)
+@return: the halt reason, HALT_STEP_LIMIT or STATUS_TIMEOUT.
+"""
+def run_tape(engine, tape_str, max_steps, timeout, start_time):
+    engine.set_tape(tape_str)
+    status = HALT_STEP_LIMIT
+    chunk = 50000
+
+    while True:
+        steps = chunk
+        if max_steps is not None:
+            steps = min(steps, max_steps - engine.steps)
+            if steps <= 0:
+                break
+        status = engine.run(steps)
+        if status != HALT_STEP_LIMIT:
+            break
+        if timeout is not None and time.time() - start_time > timeout:
+            status = STATUS_TIMEOUT
+            break
+
+    return status
+
+
+def describe_error(error):
+    return type(error).__name__ + ': ' + str(error)
+
+
+"""
+@desc: Grades every .tm (and .tmb) file in a directory against every tape.
+@param: processes - the pool size, or None for one per cpu.
+@param: block_size - run with macro steps of this many cells, or None. (see grade_machine)
+@return: the report rows, sorted by machine then in tape order.
+"""
+def grade(machine_dir, tapes, max_steps=1000000, timeout=10.0, processes=None, block_size=None):
+    paths = sorted(os.path.join(machine_dir, file_name) for file_name in os.listdir(machine_dir)
+                   if file_name.endswith('.tm') or file_name.endswith('.tmb'))
+    jobs = [(path, tapes, max_steps, timeout, block_size) for path in paths]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(grade_machine, jobs, chunksize=max(1, len(jobs) // (4 * (processes or multiprocessing.cpu_count()))))
+    finally:
+        pool.close()
+        pool.join()
+
+    return [row for rows in results for row in rows]
+
+
+def read_tapes(path):
+    with open(path) as stream:
+        return [line.rstrip('\r\n') for line in stream]
+
+
+def write_report(path, rows, report_format=None):
+    if report_format is None:
+        report_format = 'json' if path.endswith('.json') else 'csv'
+
+    if report_format == 'json':
+        with open(path, 'w') as stream:
+            json.dump([dict(zip(REPORT_FIELDS, row)) for row in rows], stream, indent=1)
+    else:
+        # The csv module wants binary files on python 2 and no newline translation on python 3.
+        if sys.version_info[0] < 3:
+            stream = open(path, 'wb')
+        else:
+            stream = open(path, 'w', newline='')
+        with stream:
+            writer = csv.writer(stream)
+            writer.writerow(REPORT_FIELDS)
+            writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs every .tm file in a directory against a list of tapes.')
+    parser.add_argument('machines', help='directory of .tm/.tmb files')
+    parser.add_argument('tapes', help='file of input tapes, one per line')
+    parser.add_argument('-o', '--output', default='report.csv', help='report path (.csv or .json)')
+    parser.add_argument('--format', choices=['csv', 'json'], help='report format (default: from the output path)')
+    parser.add_argument('--steps', type=int, default=1000000, help='step limit per tape (0 for none)')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds per tape (0 for none)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: one per cpu)')
+    parser.add_argument('--macro', type=int, default=0, metavar='CELLS',
+                        help='run blocks of CELLS tape cells at a time (faster on sweeping machines)')
+    args = parser.parse_args(argv)
+
+    rows = grade(args.machines, read_tapes(args.tapes), args.steps or None, args.timeout or None, args.jobs,
+                 args.macro or None)
+    write_report(args.output, rows, args.format)
+    print('Graded ' + str(len(rows)) + ' runs into ' + args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
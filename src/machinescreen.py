@@ -3,14 +3,18 @@ import math
 # import random
 
 from kivy.uix.widget import Widget
+from kivy.clock import Clock
+from kivy.config import Config
 from kivy.vector import Vector
 from kivy.graphics import *
 from kivy.properties import *
-from kivy.graphics.transformation import Matrix
 
 from turingstate import TuringState
 from turingtransition import TuringTransition
 from temptransitionline import TempTransitionLine
+from spatialgrid import SpatialGrid
+from camera import Camera
+from statemesh import StateMesh
 from undohandler import *
 
 kivy.require('1.9.0')
@@ -41,6 +45,41 @@ class MachineScreen(Widget):
         self.states = []
         self.transitions = []
 
+        # Hit tests go through these rather than looping over every state/transition.
+        self.state_grid = SpatialGrid()
+        self.transition_grid = SpatialGrid()
+
+        # Lookups for the undo handler and loading. Names map to a list of states, as loaded
+        # files can have clashing names (get_state_by_name gives the first one added).
+        # Ids are get_unique_id's strings, shared between states and transitions.
+        self.states_by_name = {}
+        self.objects_by_id = {}
+
+        # Only states/transitions near the screen have their groups in the fbo. (See update_culling)
+        self.displayed_objects = set()
+        # The world area (left, bottom, right, top) culled for. Holds a margin around the screen,
+        # so small pans don't need a recull.
+        self.cull_bounds = None
+        # Below this zoom, states and transitions are drawn without labels.
+        self.detail_scale = .5
+        self.low_detail = False
+
+        # See begin_batch. Batches can nest, nothing happens until the outermost ends.
+        self.batch_depth = 0
+        self.batch_actions = []
+
+        # Changes to the fbo are redrawn once a frame. (See request_redraw)
+        self.redraw_pending = False
+        self.matrix_changed = False
+        # How many redraws were asked for, and how many were actually done.
+        self.redraw_requests = 0
+        self.redraw_count = 0
+
+        # Draws every state's shapes in a few meshes (see statemesh.py) when 'state_mesh = 1'
+        # is in the [turing] section of the kivy config. Made along with the fbo.
+        self.use_state_mesh = Config.getdefaultint('turing', 'state_mesh', 0) == 1
+        self.state_mesh = None
+
         self.handled_touches = []
 
         # TODO: DON'T HARD CODE THIS
@@ -65,9 +104,12 @@ class MachineScreen(Widget):
         # Initial distance between two touches.
         self.initial_dist = 1
         self.multitouch = False
-        self.previous_scale = 1
+        # The camera's scale when the pinch started.
         self.temp_scale = 1
 
+        # The pan and zoom of the fbo. (See camera.py)
+        self.camera = Camera()
+
         # We check the simulator to see if its running when handling touches.
         self.turing_simulator = None
 
@@ -90,8 +132,6 @@ class MachineScreen(Widget):
     def create_new_machine(self):
 
         # Removing visual components
-        self.fbo.bind()
-        self.fbo.clear_buffer()
         for state in self.states:
 
             invalid_transitions = state.delete()
@@ -100,13 +140,51 @@ class MachineScreen(Widget):
             for transition in invalid_transitions:
                 self.transition_group.remove_group(transition.get_unique_id())
 
-        self.fbo.release()
+        if self.state_mesh is not None:
+            self.state_mesh.clear()
+
+        self.request_redraw()
 
         self.undo_handler.reset()
 
         self.states = []
         self.transitions = []
         self.start_state = None
+        self.state_grid.clear()
+        self.transition_grid.clear()
+        self.states_by_name = {}
+        self.objects_by_id = {}
+        self.displayed_objects = set()
+
+    """
+    Desc: Starts a batch of changes (such as loading a machine). Until end_batch, states and
+          transitions aren't culled one by one or put in the fbo, and undo actions are held back.
+          Everything is then done in one go at the end.
+    """
+    def begin_batch(self):
+        self.batch_depth += 1
+
+    """
+    Desc: Ends a batch. Adds the held back undo actions and attaches the groups of everything
+          on screen in a single fbo update.
+    """
+    def end_batch(self):
+        self.batch_depth -= 1
+        if self.batch_depth > 0:
+            return
+
+        actions = self.batch_actions
+        self.batch_actions = []
+        for action in actions:
+            self.undo_handler.add_action(action)
+
+        self.update_culling(True)
+
+    def add_undo_action(self, action):
+        if self.batch_depth:
+            self.batch_actions.append(action)
+        else:
+            self.undo_handler.add_action(action)
 
     # ------------------------ GRAPHICS ----------------------- #
     """
@@ -115,8 +193,6 @@ class MachineScreen(Widget):
           Also sets up our transformation matricies that we use for scaling and translations.
     """ 
     def initialise_canvas(self, size):
-        self.matrix = Matrix()
-
         with self.canvas:
             self.fbo = Fbo(size=size)
             Color(1, 1, 1, 1)
@@ -125,10 +201,22 @@ class MachineScreen(Widget):
             self.canvas_created = True
         with self.fbo:
             self.matrix_instruction = MatrixInstruction()
-            self.matrix_instruction.matrix = self.matrix
+            self.matrix_instruction.matrix = self.camera.get_matrix()
 
         self.fbo.add(self.transition_group)
+
+        if self.use_state_mesh:
+            state_mesh = StateMesh(self.request_redraw)
+            if state_mesh.ready:
+                self.state_mesh = state_mesh
+                self.fbo.add(state_mesh.context)
+                for state in self.states:
+                    state.set_state_mesh(state_mesh)
+            else:
+                print('State mesh shader failed, drawing states separately')
+
         self.fbo.add(self.state_group)
+        self.request_redraw()
 
     """
     Desc: Bound in the root class, updates the widget size when app size is adjusted.
@@ -137,85 +225,207 @@ class MachineScreen(Widget):
         if not self.canvas_created:
             self.initialise_canvas(size)
         self.bg.size = size
+        self.update_culling(True)
     """
     Desc: Adds an instruction group at given index.
     WARNING: Don't add at multiple index's without first clearing the
     original instruction group from the display list.
     """
     def add_at_index(self, ins, index):
-        self.fbo.bind()
-        self.fbo.clear_buffer()
         self.fbo.insert(index, ins)
-        self.fbo.release()
+        self.request_redraw()
     """
     Desc: Moves an instruction group to the top of another instruction group.
     EG. Moving a state to the top of the state display list.
     The ins must already be in the ins_group or an exception will be raised.
     """
     def add_to_top(self, ins_group, ins, ins_uid):
-        self.fbo.bind()
-        self.fbo.clear_buffer()
         ins_group.remove_group(ins_uid)
         ins_group.add(ins)
-        self.fbo.release()
-        self.fbo.ask_update()
+        self.request_redraw()
 
     """
-    Desc: Updates the screen after the change of a graphic instruction.
-    If the graphic instruction doesn't change, this will clear the screen.
+    Desc: Calls ins (something changing a graphic instruction) and has the screen redrawn
+    on the next frame. Returns whatever ins returns.
     """
     def update_graphic_ins(self, ins, args):
-        self.fbo.bind()
-        self.fbo.clear_buffer()
         return_value = ins(*args)
-        self.fbo.release()
-        self.fbo.ask_update()
+        self.request_redraw()
         return return_value
+
     """
-    Desc: Pans the main fbo by a vector delta.
+    Desc: Asks for the fbo to be redrawn. However often this is called in a frame, the fbo is only
+    cleared and redrawn once, just before the frame is drawn. (Timeout -1 callbacks run after the
+    frame's touches have been handled)
     """
-    def pan(self, delta):
-        self.matrix = self.matrix.multiply(
-            Matrix().translate(delta[0], delta[1], 0))
+    def request_redraw(self):
+        self.redraw_requests += 1
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            Clock.schedule_once(self.flush_redraw, -1)
+
+    """
+    Desc: Does the redraw asked for by request_redraw. Can be called early to redraw straight away.
+    """
+    def flush_redraw(self, dt=None):
+        if not self.redraw_pending:
+            return
+        self.redraw_pending = False
+        # Nothing to draw into yet. initialise_canvas asks again once there is.
+        if not self.canvas_created:
+            return
+        self.redraw_count += 1
+
+        if self.state_mesh is not None:
+            self.state_mesh.flush()
 
         self.fbo.bind()
         self.fbo.clear_buffer()
-        self.matrix_instruction.matrix = self.matrix
+        if self.matrix_changed:
+            self.matrix_instruction.matrix = self.camera.get_matrix()
+            self.matrix_changed = False
         self.fbo.release()
+        self.fbo.ask_update()
+
+    """
+    Desc: Returns (redraws asked for, redraws done, redraws saved) since the app started.
+    """
+    def get_redraw_stats(self):
+        return (self.redraw_requests, self.redraw_count, self.redraw_requests - self.redraw_count)
+    """
+    Desc: Pans the main fbo by a vector delta.
+    """
+    def pan(self, delta):
+        self.camera.pan(delta)
+        self.camera_moved()
 
     """
     Desc: Zooms the fbo at a world point by a factor. Keeps the screen centred on the zoom.
     """
     def zoom(self, origin, factor):
-        self.matrix = self.matrix.multiply(
-            Matrix().translate(origin[0], origin[1], 0))
-        self.matrix = self.matrix.multiply(
-            Matrix().scale(factor, factor, factor))
-        self.matrix = self.matrix.multiply(
-            Matrix().translate(-origin[0], -origin[1], 0))
+        self.camera.zoom(origin, factor)
+        self.camera_moved()
 
-        self.fbo.bind()
-        self.fbo.clear_buffer()
-        self.matrix_instruction.matrix = self.matrix
-        self.fbo.release()
+    """
+    Desc: Hands the camera's new matrix to the fbo on the next redraw, and reculls if needed.
+    """
+    def camera_moved(self):
+        self.matrix_changed = True
+        self.request_redraw()
+        self.update_culling()
+
+    # ------------------------ CULLING ----------------------- #
+    """
+    Desc: Returns the world area (left, bottom, right, top) currently on screen.
+    """
+    def get_view_bounds(self):
+        return self.camera.get_view_bounds(self.bg.size)
+
+    """
+    Desc: Attaches the groups of states/transitions near the screen to the fbo and detaches the rest,
+          and switches them to low detail when zoomed out. Everything is only looked at again when the
+          screen leaves the area last culled for (or the detail changes), so most pans cost nothing.
+    @param: force - recull even if the screen hasn't gone far.
+    """
+    def update_culling(self, force=False):
+        if not self.canvas_created:
+            return
+
+        # The screen's corners, and the corners of the area culled for (half a screen more all round).
+        width, height = self.bg.size
+        view_min, view_max, cull_min, cull_max = self.camera.to_world_points(
+            [(0, 0), (width, height), (-width / 2.0, -height / 2.0), (width * 1.5, height * 1.5)])
+
+        low_detail = self.camera.scale < self.detail_scale
+        cull_bounds = self.cull_bounds
+        if not force and low_detail == self.low_detail and cull_bounds is not None and \
+                cull_bounds[0] <= view_min[0] and cull_bounds[1] <= view_min[1] and \
+                cull_bounds[2] >= view_max[0] and cull_bounds[3] >= view_max[1]:
+            return
+
+        self.cull_bounds = (cull_min[0], cull_min[1], cull_max[0], cull_max[1])
+        self.low_detail = low_detail
+
+        for state in self.states:
+            self.update_visibility(state)
+        for transition in self.transitions:
+            self.update_visibility(transition)
+        self.request_redraw()
+
+    """
+    Desc: Attaches or detaches a single state/transition's group depending on whether it is in the culled area.
+          Selected and grabbed objects are always shown. (Follow with request_redraw)
+    """
+    def update_visibility(self, obj):
+        # The held state lives straight in the fbo while a transition is being made.
+        if obj is self.held_state:
+            return
+
+        visible = True
+        if self.cull_bounds is not None and obj is not self.grabbed_object and \
+                obj is not self.selected_state and obj is not self.selected_transition:
+            bounds = obj.get_draw_bounds()
+            cull_bounds = self.cull_bounds
+            visible = bounds[0] < cull_bounds[2] and bounds[2] > cull_bounds[0] and \
+                bounds[1] < cull_bounds[3] and bounds[3] > cull_bounds[1]
+
+        if obj.type == 'state':
+            group = self.state_group
+        else:
+            group = self.transition_group
+
+        if visible:
+            obj.set_detail(self.low_detail)
+            if obj not in self.displayed_objects:
+                group.add(obj.get_instruction_group())
+                self.displayed_objects.add(obj)
+        elif obj in self.displayed_objects:
+            group.remove_group(obj.get_unique_id())
+            self.displayed_objects.discard(obj)
+
+    """
+    Desc: Rechecks the visibility of an object which has moved (and of a state's transitions, which move with it).
+    """
+    def refresh_visibility(self, obj):
+        # Batches recull everything at the end.
+        if self.batch_depth:
+            return
+
+        self.update_visibility(obj)
+        if obj.type == 'state':
+            for transition in obj.out_transitions + obj.in_transitions:
+                self.update_visibility(transition)
+        self.request_redraw()
 
     # -------------------- COORDINATE FUNCTIONS --------------------- #
     """
-    Desc: Uses the transformation matrix we are using on the fbo to transfer a point on the root screen
+    Desc: Uses the camera we are using on the fbo to transfer a point on the root screen
     to world space. (Used for adding transitions etc.)
     """
     def screen_to_world(self, screenPos):
-        worldPos = self.matrix.inverse().transform_point(
-            screenPos[0], screenPos[1] - self.parent.y, 0)
-        return worldPos
+        return self.camera.to_world((screenPos[0], screenPos[1] - self.parent.y))
     """
-    Desc: Uses the transformation matrix we are using on the fbo to transfer a point on our world screen to
+    Desc: Uses the camera we are using on the fbo to transfer a point on our world screen to
     the root app screen. (Used for getting the proper point to put state/transition menus at)
     """
     def world_to_screen(self, objPos):
-        screenPos = self.matrix.transform_point(objPos[0], objPos[1], 0)
+        screenPos = self.camera.to_screen(objPos)
         return (screenPos[0], screenPos[1] + self.parent.y, 0)
 
+    """
+    Desc: screen_to_world for a list of points at once.
+    """
+    def screen_to_world_points(self, points):
+        parent_y = self.parent.y
+        return self.camera.to_world_points([(x, y - parent_y) for x, y in points])
+
+    """
+    Desc: world_to_screen for a list of points at once. Returns (x, y) points.
+    """
+    def world_to_screen_points(self, points):
+        parent_y = self.parent.y
+        return [(x, y + parent_y) for x, y in self.camera.to_screen_points(points)]
+
     # -------------------- TOUCH EVENT HANDLERS ---------------------- #
     """
     Desc: Handles a touch onto the gui. All touches are stored for later use (with multitouch functionality) and 
@@ -247,7 +457,7 @@ class MachineScreen(Widget):
                     self.initial_dist = Vector(self.handled_touches[0].pos).distance(
                         Vector(self.handled_touches[1].pos))
                     # Remember the current scale before more scaling.
-                    self.temp_scale = self.previous_scale
+                    self.temp_scale = self.camera.scale
     """
     Desc: Handles a touch up (no matter where it happened, or even if we're tracking it)
     If we are tracking the touch, various things can happen. If its a zoom we stop zooming,
@@ -295,37 +505,35 @@ class MachineScreen(Widget):
     """
     def handle_click(self, instance, click_triggered):
         if click_triggered and not self.turing_simulator.run_mode:
-            world_pos = self.screen_to_world(instance.initial_touch.opos)
-            for state in self.states:
-                if Vector(world_pos).distance(Vector(state.pos)) < state.radius:
+            world_pos, state, transition = self.get_objects_at([instance.initial_touch.opos])[0]
+            if state:
 
-                    if self.selected_transition:
-                        self.deselect_objects()
-                        self.close_menus = True
+                if self.selected_transition:
+                    self.deselect_objects()
+                    self.close_menus = True
 
-                    if self.selected_state and state is not self.selected_state:
-                        self.deselect_objects()
+                if self.selected_state and state is not self.selected_state:
+                    self.deselect_objects()
 
-                    self.update_graphic_ins(state.set_highlight, (0, 1, 1))
-                    # Brings the selected state to the top of the display list.
-                    self.add_to_top(self.state_group, state.get_instruction_group(), state.get_unique_id())
-                    self.selected_state = state
-                    return
+                self.update_graphic_ins(state.set_highlight, (0, 1, 1))
+                # Brings the selected state to the top of the display list.
+                self.add_to_top(self.state_group, state.get_instruction_group(), state.get_unique_id())
+                self.selected_state = state
+                return
 
-            for transition in self.transitions:
-                if transition.collide_point(world_pos):
+            if transition:
 
-                    if self.selected_state:
-                        self.deselect_objects()
-                        self.close_menus = True
+                if self.selected_state:
+                    self.deselect_objects()
+                    self.close_menus = True
 
-                    if self.selected_transition and transition is not self.selected_transition:
-                        self.deselect_objects()
+                if self.selected_transition and transition is not self.selected_transition:
+                    self.deselect_objects()
 
-                    self.update_graphic_ins(transition.set_highlight, (0, 1, 1))
-                    self.add_to_top(self.transition_group, transition.get_instruction_group(), transition.get_unique_id())
-                    self.selected_transition = transition
-                    return
+                self.update_graphic_ins(transition.set_highlight, (0, 1, 1))
+                self.add_to_top(self.transition_group, transition.get_instruction_group(), transition.get_unique_id())
+                self.selected_transition = transition
+                return
 
             # If we're at this point we know that no states/transitions have
             # been selected.
@@ -336,21 +544,19 @@ class MachineScreen(Widget):
     """
     def handle_hold(self, instance, hold_triggered):
         if hold_triggered and not self.turing_simulator.run_mode:
-            world_pos = self.screen_to_world(instance.initial_touch.opos)
-            for state in self.states:
-                if Vector(world_pos).distance(Vector(state.pos)) < state.radius:
-                    self.update_graphic_ins(state.set_highlight, (1, 1, 0))
-                    self.held_state = state
+            world_pos, state, transition = self.get_objects_at([instance.initial_touch.opos])[0]
+            if state:
+                self.update_graphic_ins(state.set_highlight, (1, 1, 0))
+                self.held_state = state
     """
     Desc: Listens to the touchhandler for a double_triggered event. If the double tap is on empty space
     a new state will be created.
     """
     def handle_double_touch(self, instance, double_triggered):
         if double_triggered and not self.turing_simulator.run_mode:
-            world_pos = self.screen_to_world(instance.initial_touch.opos)
-            for state in self.states:
-                if Vector(world_pos).distance(Vector(state.pos)) < state.radius:
-                    return
+            world_pos, state, transition = self.get_objects_at([instance.initial_touch.opos])[0]
+            if state:
+                return
             self.add_state(instance.initial_touch.opos, False)
 
     # --------------------------  MACHINE FUNCTIONS ------------------------ #
@@ -360,19 +566,15 @@ class MachineScreen(Widget):
     # Background selected: Pan's camera
     # State selected: Move state
     def handle_initial_grab(self, pos):
-        world_pos = self.screen_to_world(pos)
+        world_pos, state, transition = self.get_objects_at([pos])[0]
         self.grabPt = (world_pos[0], world_pos[1])
         if not self.turing_simulator.run_mode:
-            for state in self.states:
-                if Vector(world_pos).distance(Vector(state.pos)) < state.radius:
-                    self.grabbed_object = state
-                    self.add_to_top(self.state_group, state.get_instruction_group(), state.get_unique_id())
-                    break
-            for transition in self.transitions:
-                if transition.collide_point(world_pos):
-                    self.grabbed_object = transition
-                    self.add_to_top(self.transition_group, transition.get_instruction_group(), transition.get_unique_id())
-                    break
+            if state:
+                self.grabbed_object = state
+                self.add_to_top(self.state_group, state.get_instruction_group(), state.get_unique_id())
+            if transition:
+                self.grabbed_object = transition
+                self.add_to_top(self.transition_group, transition.get_instruction_group(), transition.get_unique_id())
         if self.grabbed_object:
             self.initial_grab_pt = self.grabbed_object.get_position()
         else:
@@ -383,6 +585,7 @@ class MachineScreen(Widget):
         if self.grabbed_object:
             self.update_graphic_ins(
                 self.grabbed_object.set_position, [world_pos])
+            self.refresh_visibility(self.grabbed_object)
         elif self.bgGrabbed:
             # pan by the delta position
             self.pan(
@@ -404,9 +607,15 @@ class MachineScreen(Widget):
                                                 world_pos, False)
                 # Need to remove the held state and re-add it
                 self.update_graphic_ins(self.state_group.remove_group, [self.held_state.get_unique_id()])
-                self.add_at_index(
-                    self.transitionline.get_instruction_group(), 3)
-                self.add_at_index(self.held_state.get_instruction_group(), 4)
+                if self.state_mesh is None:
+                    self.add_at_index(
+                        self.transitionline.get_instruction_group(), 3)
+                    self.add_at_index(self.held_state.get_instruction_group(), 4)
+                else:
+                    # The held state's circle is in the mesh, so the line goes under all the states.
+                    self.add_at_index(
+                        self.transitionline.get_instruction_group(), 2)
+                    self.add_at_index(self.held_state.get_instruction_group(), 5)
                 self.transitionline.displayed = True
 
     def handle_scale(self):
@@ -415,18 +624,21 @@ class MachineScreen(Widget):
                 Vector(self.handled_touches[1].pos))
             new_scale = (new_dist / self.initial_dist) * self.temp_scale
 
-            if new_scale < .8:
-                new_scale = .8
+            # Zoomed out past detail_scale, labels are dropped. (see update_culling)
+            if new_scale < .2:
+                new_scale = .2
             if new_scale > 3:
                 new_scale = 3
 
-            pivot_pt = self.screen_to_world((
-                Vector(self.handled_touches[0].pos) +
-                Vector(self.handled_touches[1].pos)) / 2)
+            # Both touches of a pinch report their moves, so the second often changes nothing.
+            if new_scale == self.camera.scale:
+                return
 
-            self.zoom(pivot_pt, new_scale / self.previous_scale)
+            touch_pts = self.screen_to_world_points([self.handled_touches[0].pos, self.handled_touches[1].pos])
+            pivot_pt = ((touch_pts[0][0] + touch_pts[1][0]) / 2, (touch_pts[0][1] + touch_pts[1][1]) / 2)
 
-            self.previous_scale = new_scale
+            self.camera.zoom_to(pivot_pt, new_scale)
+            self.camera_moved()
 
     # If any states/transitions are selected removes the highlight and forgets
     # the object.
@@ -449,12 +661,10 @@ class MachineScreen(Widget):
     def unhold_state(self, pos):
         if self.transitionline.displayed:
             if pos:
-                world_pos = self.screen_to_world(pos)
-                for state in self.states:
-                    if Vector(world_pos).distance(Vector(state.pos)) < state.radius:
-                        # Create a new transition.
-                        self.add_transition(self.held_state, state, None, 'L', self.blank_char, self.blank_char)
-                        break
+                world_pos, state, transition = self.get_objects_at([pos])[0]
+                if state:
+                    # Create a new transition.
+                    self.add_transition(self.held_state, state, None, 'L', self.blank_char, self.blank_char)
             # Remove the state from the main buffer
             self.update_graphic_ins(
                 self.fbo.remove_group, [self.held_state.get_unique_id()])
@@ -485,21 +695,27 @@ class MachineScreen(Widget):
         new_transition = TuringTransition(from_state, to_state, anchor_offset, direction, read_sym, write_sym, u_id)
             
         self.transitions.append(new_transition)
+        self.register_id(new_transition)
+        new_transition.set_spatial_grid(self.transition_grid)
         from_state.add_out_transition(new_transition)
 
         if from_state is not to_state:
             to_state.add_in_transition(new_transition)
 
         if not from_undo:
-            self.undo_handler.add_action(Action_AddTransition(new_transition))
+            self.add_undo_action(Action_AddTransition(new_transition))
 
-        self.update_graphic_ins(self.transition_group.add, [new_transition.get_instruction_group()])
+        if not self.batch_depth:
+            self.update_graphic_ins(self.update_visibility, [new_transition])
 
     def delete_transition(self, transition, from_undo = False):
         if not from_undo:
-            self.undo_handler.add_action(Action_DeleteTransition(transition))
+            self.add_undo_action(Action_DeleteTransition(transition))
 
         self.update_graphic_ins(self.transition_group.remove_group, [transition.get_unique_id()])
+        self.displayed_objects.discard(transition)
+        transition.set_spatial_grid(None)
+        self.unregister_id(transition)
         transition.delete()
         self.transitions.remove(transition)
         
@@ -527,11 +743,16 @@ class MachineScreen(Widget):
 
         new_state = TuringState(world_pos, state_name, u_id)
         self.states.append(new_state)
+        self.register_name(new_state)
+        self.register_id(new_state)
+        new_state.set_spatial_grid(self.state_grid)
+        new_state.set_state_mesh(self.state_mesh)
 
-        self.update_graphic_ins(self.state_group.add, [new_state.get_instruction_group()])
+        if not self.batch_depth:
+            self.update_graphic_ins(self.update_visibility, [new_state])
 
         if not from_undo:
-            self.undo_handler.add_action(Action_AddState(state_name, world_pos, new_state.get_unique_id()))
+            self.add_undo_action(Action_AddState(state_name, world_pos, new_state.get_unique_id()))
 
         return new_state
 
@@ -539,7 +760,7 @@ class MachineScreen(Widget):
         # Create the undo action now (before transitions are lost etc)
         if not from_undo:
             print('handle meh')
-            self.undo_handler.add_action(Action_DeleteState(state.name, state.pos, state.final_state, state.start_state, state.out_transitions, state.in_transitions, state.get_unique_id()))
+            self.add_undo_action(Action_DeleteState(state.name, state.pos, state.final_state, state.start_state, state.out_transitions, state.in_transitions, state.get_unique_id()))
         # Makes sure we remove all references of the state
         if state == self.start_state:
             self.start_state = None
@@ -547,36 +768,94 @@ class MachineScreen(Widget):
         # Remove connected transitions
         invalid_transitions = state.delete()
 
-        # Prepare the fbo for a redraw.
-        self.fbo.bind()
-        self.fbo.clear_buffer()
-
         # Remove invalid transitions from display and local storage.
         for transition in invalid_transitions:
             self.transition_group.remove_group(transition.get_unique_id())
             self.transitions.remove(transition)
+            self.unregister_id(transition)
+            self.displayed_objects.discard(transition)
+            transition.set_spatial_grid(None)
 
         # Remove from the display list
         self.state_group.remove_group(state.get_unique_id())
 
         # Remove from the state list
         self.states.remove(state)
+        self.unregister_name(state)
+        self.unregister_id(state)
+        self.displayed_objects.discard(state)
+        state.set_spatial_grid(None)
+        state.set_state_mesh(None)
 
-        self.fbo.release()
+        self.request_redraw()
 
-    def get_state_by_name(self, name):
-        for state in self.states:
-            if state.name == name:
+    """
+    Desc: Finds the state under a world position through the state grid.
+    Returns: the state, or None if there isn't one.
+    """
+    def get_state_at(self, world_pos):
+        for state in self.state_grid.query(world_pos):
+            if state.collide_point(world_pos):
                 return state
         return None
 
-    def get_obj_by_id(self, unique_id):
-        for state in self.states:
-            if state.get_unique_id() == unique_id:
-                return state
-        for transition in self.transitions:
-            if transition.get_unique_id() == unique_id:
+    """
+    Desc: Hit tests screen points (such as touch positions), converting them to world space together.
+    Returns: a list of (world_pos, state, transition) for each point, with None where nothing was hit.
+    """
+    def get_objects_at(self, screen_points):
+        return [(world_pos, self.get_state_at(world_pos), self.get_transition_at(world_pos))
+                for world_pos in self.screen_to_world_points(screen_points)]
+
+    """
+    Desc: Finds the transition (label) under a world position through the transition grid.
+    Returns: the transition, or None if there isn't one.
+    """
+    def get_transition_at(self, world_pos):
+        for transition in self.transition_grid.query(world_pos):
+            if transition.collide_point(world_pos):
                 return transition
         return None
 
+    """
+    Desc: Renames a state, keeping the name lookup up to date. Always rename states through here
+          rather than with state.change_name.
+    """
+    def rename_state(self, state, new_name):
+        self.unregister_name(state)
+        self.update_graphic_ins(state.change_name, [new_name])
+        self.register_name(state)
+
+    def get_state_by_name(self, name):
+        states = self.states_by_name.get(name)
+        if states:
+            return states[0]
+        return None
+
+    def get_obj_by_id(self, unique_id):
+        return self.objects_by_id.get(unique_id)
+
+    def register_name(self, state):
+        states = self.states_by_name.get(state.name)
+        if states is None:
+            self.states_by_name[state.name] = [state]
+        else:
+            states.append(state)
+
+    def unregister_name(self, state):
+        states = self.states_by_name.get(state.name)
+        if states and state in states:
+            states.remove(state)
+            if not states:
+                del self.states_by_name[state.name]
+
+    # Where ids clash the object registered first keeps the id.
+    def register_id(self, obj):
+        if obj.get_unique_id() not in self.objects_by_id:
+            self.objects_by_id[obj.get_unique_id()] = obj
+
+    def unregister_id(self, obj):
+        if self.objects_by_id.get(obj.get_unique_id()) is obj:
+            del self.objects_by_id[obj.get_unique_id()]
+
 
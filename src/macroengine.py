@@ -0,0 +1,213 @@
+"""
+@Desc: An accelerated engine for long runs. The tape is split into fixed size blocks
+       and the engine runs a whole block at a time, caching the result as a
+       "macro transition": (state, block contents, entry position) ->
+       (new block contents, new state, exit position, steps taken).
+       Sweeps over runs of the same cells then cost a dict lookup per block rather
+       than a step per cell. Step counts and tapes are exactly the same as
+       TuringEngine's (and so the simulator's), only single steps are skipped over.
+"""
+
+from turingengine import TuringEngine, HALT_ACCEPT, HALT_REJECT, HALT_STEP_LIMIT
+from turingengine import HALT_CONFIG_REPEAT
+
+
+class MacroEngine(TuringEngine):
+
+    """
+    @param: machine, tape_str, tape - the same as TuringEngine.
+    @param: block_size - the number of cells in a block. Bigger blocks skip more steps at a
+                         time but there are more different blocks to work out.
+    """
+
+    def __init__(self, machine, tape_str, tape=None, block_size=32):
+        self.block_size = block_size
+
+        # Blocks which run for longer than this without leaving are run a step at a time,
+        # as the machine may never leave.
+        self.block_step_limit = 64 * block_size
+        # The cache is thrown away when it gets this big.
+        self.cache_limit = 1 << 16
+        self.cache = {}
+
+        # Read these to see how well the cache is doing.
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        TuringEngine.__init__(self, machine, tape_str, tape)
+
+    def set_tape(self, tape_str, tape=None):
+        stride = self.machine.stride
+        TuringEngine.set_tape(self, tape_str, tape)
+        # Adding symbols rebuilds the tables, so the cached blocks might be out of date.
+        if stride != self.machine.stride:
+            self.cache = {}
+
+    def run_fast(self, max_steps):
+        return self.run_blocks(max_steps, False)
+
+    def run_detecting(self, max_steps):
+        if not self.detector.detect_repeats:
+            return TuringEngine.run_detecting(self, max_steps)
+        return self.run_blocks(max_steps, True)
+
+    """
+    @desc: Runs the machine a block at a time. Runs which need stopping part way through
+           a block (a step limit or the cell ceiling) finish that block on the plain engine.
+    @param: check_repeats - check for repeated configurations after each block.
+                            (Translated cycles need every step, so aren't checked for)
+    """
+    def run_blocks(self, max_steps, check_repeats):
+        machine = self.machine
+        final = machine.final
+        tape = self.tape
+        size = self.block_size
+        cache = self.cache
+        cell_limit = self.cell_ceiling if self.cell_ceiling is not None else float('inf')
+        steps_left = -1 if max_steps is None else max_steps
+
+        cells = tape.cells
+        head = tape.head
+        origin = tape.origin
+        state_id = self.state
+        steps_done = 0
+        halt_reason = HALT_STEP_LIMIT
+
+        while steps_left != 0:
+            block_start = origin + (head - origin) // size * size
+            if block_start < 1 or block_start + size >= len(cells):
+                tape.head = head
+                block_start = self.get_block_start((head - origin) // size)
+                cells = tape.cells
+                head = tape.head
+                origin = tape.origin
+
+            key = (state_id, bytes(cells[block_start:block_start + size]), head - block_start)
+            result = cache.get(key)
+            if result is None:
+                result = self.run_block(*key)
+                if result is not None:
+                    if len(cache) >= self.cache_limit:
+                        cache.clear()
+                    cache[key] = result
+                    self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+
+            if result is not None:
+                new_block, new_state, exit_offset, steps, lo, hi, halted = result
+                new_start = min(tape.start, block_start + lo)
+                new_end = max(tape.end, block_start + hi + 1)
+
+                # The run has to stop part way through this block, so leave it to the plain engine.
+                # (It only notices a halt on the step after, so a halt right on the limit is left too)
+                if (steps_left >= 0 and steps + halted > steps_left) or new_end - new_start > cell_limit:
+                    if steps_left >= 0:
+                        steps = min(steps, steps_left)
+                    result = None
+            else:
+                # Stuck in the block for now, so take the steps one by one.
+                steps = self.block_step_limit
+                if steps_left >= 0:
+                    steps = min(steps, steps_left)
+
+            if result is None:
+                tape.head = head
+                self.state = state_id
+                self.steps += steps_done
+                steps_done = 0
+                halt_reason = self.run_steps(steps)
+                if halt_reason != HALT_STEP_LIMIT:
+                    return halt_reason
+                cells = tape.cells
+                head = tape.head
+                origin = tape.origin
+                state_id = self.state
+                if steps_left >= 0:
+                    steps_left -= steps
+                continue
+
+            cells[block_start:block_start + size] = new_block
+            head = block_start + exit_offset
+            tape.start = new_start
+            tape.end = new_end
+            state_id = new_state
+            steps_done += steps
+            if steps_left >= 0:
+                steps_left -= steps
+
+            if halted:
+                self.halted = True
+                halt_reason = HALT_ACCEPT if final[new_state] else HALT_REJECT
+                self.halt_reason = halt_reason
+                break
+
+            if check_repeats:
+                tape.head = head
+                if self.detector.check_repeat(state_id, tape):
+                    self.halted = True
+                    halt_reason = self.halt_reason = HALT_CONFIG_REPEAT
+                    break
+
+        tape.head = head
+        self.state = state_id
+        self.steps += steps_done
+        return halt_reason
+
+    # Runs steps on the plain engine.
+    def run_steps(self, steps):
+        return TuringEngine.run_fast(self, steps)
+
+    """
+    @desc: Makes sure a block (and the cells either side of it) are in the tape's buffer.
+    @return: the buffer index of the first cell of the block.
+    """
+    def get_block_start(self, block_no):
+        tape = self.tape
+        size = self.block_size
+        while tape.origin + block_no * size < 1:
+            tape.grow_left()
+        while tape.origin + (block_no + 1) * size >= len(tape.cells):
+            tape.grow_right()
+        return tape.origin + block_no * size
+
+    """
+    @desc: Runs a block on its own from the given state and entry offset.
+    @return: (new block, new state, exit offset, steps, lowest offset visited, highest offset visited, halted).
+             The exit offset is -1 or block_size if the head left the block.
+             None if it didn't leave within block_step_limit steps.
+    """
+    def run_block(self, state_id, block, offset):
+        machine = self.machine
+        table = machine.table
+        stride = machine.stride
+        write = machine.trans_write
+        move = machine.trans_move
+        next_row = machine.trans_next_row
+
+        cells = bytearray(block)
+        size = self.block_size
+        row = state_id * stride
+        lo = hi = offset
+        steps = 0
+        halted = False
+
+        while 0 <= offset < size:
+            trans_id = table[row + cells[offset]]
+            if trans_id < 0:
+                halted = True
+                break
+            if steps == self.block_step_limit:
+                return None
+
+            cells[offset] = write[trans_id]
+            offset += move[trans_id]
+            row = next_row[trans_id]
+            steps += 1
+
+            if offset < lo:
+                lo = offset
+            elif offset > hi:
+                hi = offset
+
+        return (bytes(cells), row // stride, offset, steps, lo, hi, halted)
@@ -14,7 +14,10 @@ from machinescreen import MachineScreen
 from turingtape import TuringTape
 from touchhandler import TouchHandler
 from turingsimulator import TuringSimulator
+from turingengine import HALT_CONFIG_REPEAT, HALT_TRANSLATED_CYCLE, HALT_STEP_CEILING, HALT_MEMORY_CEILING
 from xmlparser import XmlParser
+from binaryparser import BinaryParser, TMB_EXTENSION
+from autosave import AutoSaver
 from undohandler import *
 
 from kivy.vector import Vector
@@ -127,6 +130,9 @@ class Main(FloatLayout):
 
         self.create_directories()
 
+        # Journals edits to the temp directory, started once the guis are ready.
+        self.autosaver = AutoSaver(self.temp_path)
+
         self.intent_ready = False
         self.tape_resized = False
         self.tm_resized = False
@@ -229,6 +235,7 @@ class Main(FloatLayout):
         self.turing_simulator = TuringSimulator(self.tm_gui, self.tape_gui)
         self.turing_simulator.bind(machine_halted=self.open_halt_notifier)
         self.turing_simulator.bind(curr_step=self.update_step_slider)
+        self.turing_simulator.bind(background_steps=self.update_background_steps)
         self.update_sim_speed(None, self.speed_slider.value)
 
         # Run menu buttons/slider
@@ -285,13 +292,20 @@ class Main(FloatLayout):
 
     """
     Desc: Once both of the gui's have been initialised (this happens on the second frame)
-          we can load the file given in the intent.
+          we can load the file given in the intent. Without one, the last autosaved machine
+          is recovered instead. Autosaving starts from whichever machine ends up loaded.
     """
     def use_intent(self, instance, intent_ready):
         if intent_ready:
             Logger.info(str(self.intent_file))
             if self.intent_file:
                 self.load_machine_uri(self.intent_file)
+            elif self.autosaver.recover(self.tm_gui, self.tape_gui):
+                Logger.info('Autosave: recovered the last machine')
+
+            if self.undo_handler.autosaver is None:
+                self.undo_handler.autosaver = self.autosaver
+                self.autosaver.start(self.tm_gui, self.tape_gui)
 
     """
     Desc: Resizes the turing machine gui (pretty buggy on desktop) android will only resize once.
@@ -417,8 +431,8 @@ class Main(FloatLayout):
     """
     def main_menu_share_machine(self, instance):
         if instance.collide_point(*instance.last_touch.pos):
-            # Creating the temp machine file.
-            temp_path = self.temp_save_machine()
+            # Creating the temp machine file. Shared machines are sent in the smaller binary format.
+            temp_path = self.temp_save_machine(binary=True)
             if temp_path:
                 email.send(text='Check out this Turing Machine', file_path=temp_path)
 
@@ -427,12 +441,13 @@ class Main(FloatLayout):
 
     """
     Desc: Given the proper path and file name, saves a .tm file (which is just xml)
+          or a .tmb file (binary, see binaryparser.py) if the name ends in .tmb.
           Any path/file combo can be given here, any issues will be caught by the xml class.
     """
     def save_machine(self, file_path, file_name):
         file_name = file_name.strip()
         if file_name != '':
-            if file_name[-3:] != '.tm':
+            if file_name[-3:] != '.tm' and not BinaryParser.is_binary_path(file_name):
                 file_name = file_name + '.tm'
             full_path = os.path.join(file_path, file_name)
             io_success = XmlParser.save_machine(full_path, self.tm_gui, self.tape_gui)
@@ -444,10 +459,14 @@ class Main(FloatLayout):
 
     """
     Desc: Saves the current machine to the temp.tm file in the temporary directory (see self.temp_path)
+    @param: binary - save it as a .tmb file instead.
     Returns: The path of the temp file.
     """
-    def temp_save_machine(self):
-        full_path = os.path.join(self.temp_path, self.curr_machine_name)
+    def temp_save_machine(self, binary=False):
+        file_name = self.curr_machine_name
+        if binary and not BinaryParser.is_binary_path(file_name):
+            file_name = os.path.splitext(file_name)[0] + TMB_EXTENSION
+        full_path = os.path.join(self.temp_path, file_name)
         io_success = XmlParser.save_machine(full_path, self.tm_gui, self.tape_gui)
         if io_success:
             return full_path
@@ -606,6 +625,13 @@ class Main(FloatLayout):
                     val_norm = 1
                 self.run_menu_slider.value_normalized = val_norm
     """
+    Desc: Shows how many steps a turbo run has got through on the pause button.
+    """
+    def update_background_steps(self, instance, steps):
+        if self.turing_simulator.running and self.turing_simulator.worker:
+            self.run_menu_play_pause_btn.text = 'Pause\n' + str(steps)
+
+    """
     Desc: Handles the user moving the slider to step through the machine.
           Pass the simulator a value between 0-1 and the simulator will find the proper step to skip to.
     """
@@ -635,6 +661,8 @@ class Main(FloatLayout):
         # 1 = 1 movement per second
         # 60 = 60 movements per second (way too fast)
         self.turing_simulator.run_speed = .5 + (speed/200)*(speed/200)*(speed/200)*60
+        # Maxing out the slider runs the machine as fast as possible (see run_machine_background)
+        self.turing_simulator.turbo = speed >= self.speed_slider.max
     """
     Desc: The notifier which opens when the machine has halted.
           TODO: REPLACE THIS WITH KIVY POPUP CLASS.
@@ -643,8 +671,17 @@ class Main(FloatLayout):
         if halted:
             self.run_menu_play_pause_btn.disabled = True
             self.run_menu_disable_buttons()
+            halt_reason = self.turing_simulator.halt_reason
             if self.turing_simulator.halt_successful:
                 self.open_halt_notifier_str('Machine Stopped: Halt Successful!')
+            elif halt_reason == HALT_CONFIG_REPEAT:
+                self.open_halt_notifier_str('Machine Stopped: Stuck in a loop!')
+            elif halt_reason == HALT_TRANSLATED_CYCLE:
+                self.open_halt_notifier_str('Machine Stopped: Repeating forever along the tape!')
+            elif halt_reason == HALT_STEP_CEILING:
+                self.open_halt_notifier_str('Machine Stopped: Step limit reached!')
+            elif halt_reason == HALT_MEMORY_CEILING:
+                self.open_halt_notifier_str('Machine Stopped: Tape limit reached!')
             else:
                 self.open_halt_notifier_str('Machine Stopped: Halt Failed!')
 
@@ -726,7 +763,7 @@ class Main(FloatLayout):
                 self.state_menu.pos = (
                     self.state_menu.pos[0], self.height - self.state_menu.height - 5)
             if self.state_menu.pos[0] + self.state_menu.width > self.width:
-                scaled_radius = self.tm_gui.previous_scale * \
+                scaled_radius = self.tm_gui.camera.scale * \
                     (state.radius + 3)
                 self.state_menu.pos = (self.state_menu.pos[
                                        0] - self.state_menu.width - 2 * (scaled_radius), self.state_menu.pos[1])
@@ -761,8 +798,7 @@ class Main(FloatLayout):
             # We don't want states with the same names. (Need to add a notifier here)
             if self.selected_state.name == text or not self.tm_gui.get_state_by_name(text):
                 self.undo_handler.add_action(Action_ChangeStateName(self.selected_state.name, text))
-                self.tm_gui.update_graphic_ins(self.selected_state.change_name,
-                                                      [text])
+                self.tm_gui.rename_state(self.selected_state, text)
                 self.state_menu_name_btn.text = text
                 self._popup.dismiss()
     """
@@ -821,7 +857,7 @@ class Main(FloatLayout):
                 self.trans_menu.pos = (
                     self.trans_menu.pos[0], self.height - self.trans_menu.height - 5)
             if self.trans_menu.pos[0] + self.trans_menu.width > self.width:
-                scaled_width = self.tm_gui.previous_scale * \
+                scaled_width = self.tm_gui.camera.scale * \
                     (transition.tb_size[0] + 10)
                 self.trans_menu.pos = (self.trans_menu.pos[
                                        0] - self.trans_menu.width - scaled_width, self.trans_menu.pos[1])
@@ -922,8 +958,13 @@ class MainApp(App):
         return root
 
     def on_pause(self):
+        # We may be killed while paused, so get the journal down to a snapshot.
+        self.root.autosaver.compact()
         return True
 
+    def on_stop(self):
+        self.root.autosaver.stop()
+
     def on_resume(self):
         pass
 
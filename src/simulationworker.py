@@ -0,0 +1,131 @@
+"""
+@Desc: Runs a machine on a background thread so long runs don't block the kivy main loop.
+       The worker gets its own compiled machine and a copy of the tape, and posts its
+       progress back to the main thread through Clock.schedule_once.
+"""
+
+import threading
+import time
+
+from kivy.clock import Clock
+
+from turingengine import TuringEngine, HALT_STEP_LIMIT
+from macroengine import MacroEngine
+
+# Reported as the halt reason when a run is cancelled.
+HALT_CANCELLED = 'cancelled'
+
+
+class SimulationWorker(threading.Thread):
+
+    """
+    @param: machine - a CompiledMachine used only by this worker.
+    @param: tape_snapshot - (tape_str, tape_index) to start from. (see turingtape_array.TuringTape.snapshot)
+    @param: state_id - the state to start in.
+    @param: max_steps - the most steps to run for, or None to run until halting.
+    @param: on_progress - called on the main thread with this worker every progress_interval seconds.
+    @param: on_finish - called on the main thread with this worker once it stops.
+    @param: block_size - run on a MacroEngine with blocks of this size, or None for the plain engine.
+    """
+
+    def __init__(self, machine, tape_snapshot, state_id, max_steps=None, on_progress=None, on_finish=None,
+                 block_size=None):
+        super(SimulationWorker, self).__init__()
+        self.daemon = True
+
+        if block_size:
+            self.engine = MacroEngine(machine, tape_snapshot[0], block_size=block_size)
+        else:
+            self.engine = TuringEngine(machine, tape_snapshot[0])
+        self.engine.tape.tape_index = tape_snapshot[1]
+        self.engine.state = state_id
+
+        self.max_steps = max_steps
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+
+        # Steps run between checking for pauses, cancels and progress.
+        self.chunk = 100000
+        self.progress_interval = .25
+
+        self.cancelled = False
+        # Cleared while paused.
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+
+        # Read these from the callbacks.
+        self.steps = 0
+        self.head = 0
+        self.state_id = state_id
+        self.halt_reason = ''
+        # The cells around the head at the last progress, as a list of characters. (see set_window)
+        self.window = None
+        self.window_before = 0
+        self.window_size = 0
+
+    """
+    @desc: Copies window_size cells of the tape, starting window_before cells left of the head,
+           into window whenever progress is posted. (So the tape can be shown while it runs)
+    """
+    def set_window(self, window_before, window_size):
+        self.window_before = window_before
+        self.window_size = window_size
+
+    def pause(self):
+        self.resume_event.clear()
+
+    def resume(self):
+        self.resume_event.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self.resume_event.set()
+
+    def run(self):
+        engine = self.engine
+        next_progress = time.time() + self.progress_interval
+        halt_reason = HALT_STEP_LIMIT
+
+        while halt_reason == HALT_STEP_LIMIT:
+            self.resume_event.wait()
+            if self.cancelled:
+                halt_reason = HALT_CANCELLED
+                break
+
+            chunk = self.chunk
+            if self.max_steps is not None:
+                chunk = min(chunk, self.max_steps - engine.steps)
+                if chunk <= 0:
+                    break
+
+            halt_reason = engine.run(chunk)
+            self.update_progress()
+
+            if self.on_progress and time.time() >= next_progress:
+                next_progress = time.time() + self.progress_interval
+                if self.window_size:
+                    self.window = engine.tape.get_characters(engine.tape.tape_index - self.window_before,
+                                                             self.window_size)
+                Clock.schedule_once(self.post_progress)
+
+        self.halt_reason = halt_reason
+        self.update_progress()
+        if self.on_finish:
+            Clock.schedule_once(self.post_finish)
+
+    def update_progress(self):
+        self.steps = self.engine.steps
+        self.head = self.engine.get_head_position()
+        self.state_id = self.engine.state
+
+    def post_progress(self, dt):
+        self.on_progress(self)
+
+    def post_finish(self, dt):
+        self.on_finish(self)
+
+    """
+    @return: (tape_str, tape_index) of the tape. Only call this once the worker has finished.
+    """
+    def get_tape_snapshot(self):
+        return self.engine.tape.snapshot()
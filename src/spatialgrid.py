@@ -0,0 +1,82 @@
+"""
+@Desc: A uniform grid over world positions, used by MachineScreen to find the states and
+       transitions under a touch without looping over all of them.
+       Objects are put in every cell their bounding box overlaps, so a point only has to be
+       checked against the objects in its own cell. With cells bigger than the objects
+       that is a handful at most, however big the machine gets.
+"""
+
+
+class SpatialGrid:
+
+    """
+    @param: cell_size - the width and height of a cell in world units. Best kept a bit
+                        bigger than the objects going in.
+    """
+
+    def __init__(self, cell_size=100):
+        self.cell_size = float(cell_size)
+        # (cell x, cell y) -> list of objects overlapping the cell.
+        self.cells = {}
+        # object -> (first cell x, first cell y, last cell x, last cell y)
+        self.object_cells = {}
+
+    def clear(self):
+        self.cells = {}
+        self.object_cells = {}
+
+    def __len__(self):
+        return len(self.object_cells)
+
+    def __contains__(self, obj):
+        return obj in self.object_cells
+
+    def get_cell_range(self, bounds):
+        size = self.cell_size
+        return (int(bounds[0] // size), int(bounds[1] // size),
+                int(bounds[2] // size), int(bounds[3] // size))
+
+    """
+    @desc: Adds an object, or moves it if it is already in the grid.
+           Moves within the same cells (most of the frames of a drag) cost nothing.
+    @param: bounds - (left, bottom, right, top) in world space.
+    """
+    def update(self, obj, bounds):
+        cell_range = self.get_cell_range(bounds)
+        prev_range = self.object_cells.get(obj)
+        if prev_range == cell_range:
+            return
+        if prev_range is not None:
+            self.remove_from_cells(obj, prev_range)
+
+        self.object_cells[obj] = cell_range
+        cells = self.cells
+        for cell_x in range(cell_range[0], cell_range[2] + 1):
+            for cell_y in range(cell_range[1], cell_range[3] + 1):
+                cell = cells.get((cell_x, cell_y))
+                if cell is None:
+                    cells[(cell_x, cell_y)] = [obj]
+                else:
+                    cell.append(obj)
+
+    def remove(self, obj):
+        cell_range = self.object_cells.pop(obj, None)
+        if cell_range is not None:
+            self.remove_from_cells(obj, cell_range)
+
+    def remove_from_cells(self, obj, cell_range):
+        cells = self.cells
+        for cell_x in range(cell_range[0], cell_range[2] + 1):
+            for cell_y in range(cell_range[1], cell_range[3] + 1):
+                cell = cells[(cell_x, cell_y)]
+                cell.remove(obj)
+                if not cell:
+                    del cells[(cell_x, cell_y)]
+
+    """
+    @return: the objects whose cells cover pos, in the order they were put there.
+             (Candidates only, the caller does the exact hit test)
+    """
+    def query(self, pos):
+        size = self.cell_size
+        return self.cells.get((int(pos[0] // size), int(pos[1] // size)), ())
@@ -0,0 +1,301 @@
+"""
+@Desc: An optional renderer which draws every state's circle, highlight outline, final ring and
+       start arrow as triangles in a few shared Meshes, rather than as half a dozen instructions
+       per state. Each vertex carries its own colour (through the small shader below), so
+       highlighting a state only rewrites the colours of its outline.
+       States keep their own instruction group for their label. (See TuringState.set_state_mesh)
+
+       Every state gets a fixed size slot of vertices in a chunk. Parts which aren't shown (the final
+       ring of a non final state etc) are collapsed to a point. Chunks hold at most 65535 vertices,
+       as that is all a Mesh's indices can address, and are only re-uploaded once a frame when changed.
+"""
+
+from __future__ import print_function
+
+import math
+
+from kivy.graphics import RenderContext, Mesh
+
+VERTEX_FORMAT = [(b'vPosition', 2, 'float'), (b'vColor', 4, 'float')]
+VERTEX_SIZE = 6
+
+SHADER_VS = '''
+$HEADER$
+attribute vec4 vColor;
+
+void main(void) {
+    frag_color = vColor;
+    gl_Position = projection_mat * modelview_mat * vec4(vPosition.xy, 0.0, 1.0);
+}
+'''
+
+SHADER_FS = '''
+$HEADER$
+
+void main(void) {
+    gl_FragColor = frag_color;
+}
+'''
+
+CIRCLE_SEGMENTS = 32
+
+# Vertices in each part of a state's slot, in order.
+FILL_VERTICES = CIRCLE_SEGMENTS + 1
+RING_VERTICES = CIRCLE_SEGMENTS * 2
+# Two strokes for the arrow head and one for the tail.
+ARROW_VERTICES = 3 * 4
+
+OUTLINE_START = FILL_VERTICES
+FINAL_START = OUTLINE_START + RING_VERTICES
+ARROW_START = FINAL_START + RING_VERTICES
+SLOT_VERTICES = ARROW_START + ARROW_VERTICES
+
+MAX_SLOTS = 65535 // SLOT_VERTICES
+FIRST_CHUNK_SLOTS = 16
+
+# Colours and line widths (half the stroke) matching TuringState's instructions.
+FILL_COLOR = (.5, .5, .5, 1)
+LINE_COLOR = (1, 1, 1, 1)
+HIGHLIGHT_COLOR = (.8, .8, .8)
+OUTLINE_WIDTH = 1.5
+FINAL_WIDTH = 1.2
+ARROW_WIDTH = 1.8
+
+UNIT_CIRCLE = [(math.cos(2 * math.pi * i / CIRCLE_SEGMENTS), math.sin(2 * math.pi * i / CIRCLE_SEGMENTS))
+               for i in range(CIRCLE_SEGMENTS)]
+
+
+"""
+@return: the triangle indices for the first slot. (Other slots are the same, offset by their first vertex)
+"""
+def get_slot_indices():
+    indices = []
+    for i in range(CIRCLE_SEGMENTS):
+        indices.extend((0, 1 + i, 1 + (i + 1) % CIRCLE_SEGMENTS))
+
+    for ring in (OUTLINE_START, FINAL_START):
+        for i in range(CIRCLE_SEGMENTS):
+            j = (i + 1) % CIRCLE_SEGMENTS
+            inner, outer = ring + i * 2, ring + i * 2 + 1
+            next_inner, next_outer = ring + j * 2, ring + j * 2 + 1
+            indices.extend((inner, outer, next_inner, outer, next_outer, next_inner))
+
+    for stroke in range(3):
+        quad = ARROW_START + stroke * 4
+        indices.extend((quad, quad + 1, quad + 2, quad, quad + 2, quad + 3))
+    return indices
+
+SLOT_INDICES = get_slot_indices()
+
+
+def add_ring(vertices, x, y, radius, width, color):
+    r, g, b, a = color
+    inner = radius - width
+    outer = radius + width
+    for cos, sin in UNIT_CIRCLE:
+        vertices.extend((x + cos * inner, y + sin * inner, r, g, b, a,
+                         x + cos * outer, y + sin * outer, r, g, b, a))
+
+
+def add_stroke(vertices, x1, y1, x2, y2, width, color):
+    r, g, b, a = color
+    dx = x2 - x1
+    dy = y2 - y1
+    length = math.sqrt(dx * dx + dy * dy) or 1.0
+    # Along and across the stroke, half a stroke wide. (Ends squared off rather than rounded)
+    ax = dx / length * width
+    ay = dy / length * width
+    nx = -ay
+    ny = ax
+    vertices.extend((x1 - ax + nx, y1 - ay + ny, r, g, b, a,
+                     x1 - ax - nx, y1 - ay - ny, r, g, b, a,
+                     x2 + ax - nx, y2 + ay - ny, r, g, b, a,
+                     x2 + ax + nx, y2 + ay + ny, r, g, b, a))
+
+
+"""
+@desc: Adds count vertices all at (x, y) and transparent, so their triangles draw nothing.
+"""
+def add_collapsed(vertices, x, y, count):
+    vertices.extend((x, y, 0, 0, 0, 0) * count)
+
+
+"""
+@return: the vertices for a state's slot as a flat list.
+"""
+def get_state_vertices(state, highlight):
+    x, y = state.pos
+    radius = state.radius
+    detailed = not state.low_detail
+
+    vertices = list((x, y) + FILL_COLOR)
+    r, g, b, a = FILL_COLOR
+    for cos, sin in UNIT_CIRCLE:
+        vertices.extend((x + cos * radius, y + sin * radius, r, g, b, a))
+
+    add_ring(vertices, x, y, radius, OUTLINE_WIDTH, highlight + (1,))
+
+    if detailed and state.final_state:
+        add_ring(vertices, x, y, radius - 5, FINAL_WIDTH, LINE_COLOR)
+    else:
+        add_collapsed(vertices, x, y, RING_VERTICES)
+
+    if detailed and state.start_state:
+        top = y + radius
+        add_stroke(vertices, x - 7, top + 10, x, top + 2, ARROW_WIDTH, LINE_COLOR)
+        add_stroke(vertices, x, top + 2, x + 7, top + 10, ARROW_WIDTH, LINE_COLOR)
+        add_stroke(vertices, x, top + 25, x, top + 2, ARROW_WIDTH, LINE_COLOR)
+    else:
+        add_collapsed(vertices, x, y, ARROW_VERTICES)
+
+    return vertices
+
+
+class MeshChunk:
+
+    def __init__(self, context):
+        self.slots = FIRST_CHUNK_SLOTS
+        self.free_slots = list(range(self.slots - 1, -1, -1))
+        self.vertices = [0.0] * (self.slots * SLOT_VERTICES * VERTEX_SIZE)
+        self.indices = []
+        self.add_indices(0, self.slots)
+        self.dirty = False
+        self.mesh = Mesh(fmt=VERTEX_FORMAT, mode='triangles', vertices=self.vertices,
+                         indices=self.indices)
+        context.add(self.mesh)
+
+    def add_indices(self, first_slot, last_slot):
+        for slot in range(first_slot, last_slot):
+            base = slot * SLOT_VERTICES
+            self.indices.extend([base + index for index in SLOT_INDICES])
+
+    def has_space(self):
+        return len(self.free_slots) != 0 or self.slots < MAX_SLOTS
+
+    def take_slot(self):
+        if not self.free_slots:
+            # Double the chunk, up to what the indices can address.
+            new_slots = min(self.slots * 2, MAX_SLOTS)
+            self.vertices.extend([0.0] * ((new_slots - self.slots) * SLOT_VERTICES * VERTEX_SIZE))
+            self.free_slots = list(range(new_slots - 1, self.slots - 1, -1))
+            self.add_indices(self.slots, new_slots)
+            self.slots = new_slots
+            self.mesh.indices = self.indices
+            self.dirty = True
+        return self.free_slots.pop()
+
+    def free_slot(self, slot):
+        start = slot * SLOT_VERTICES * VERTEX_SIZE
+        self.vertices[start:start + SLOT_VERTICES * VERTEX_SIZE] = [0.0] * (SLOT_VERTICES * VERTEX_SIZE)
+        self.free_slots.append(slot)
+        self.dirty = True
+
+    def write_slot(self, slot, vertices):
+        start = slot * SLOT_VERTICES * VERTEX_SIZE
+        self.vertices[start:start + SLOT_VERTICES * VERTEX_SIZE] = vertices
+        self.dirty = True
+
+    """
+    @desc: Changes the colour of a slot's outline without touching anything else.
+    """
+    def write_outline_color(self, slot, r, g, b):
+        start = (slot * SLOT_VERTICES + OUTLINE_START) * VERTEX_SIZE
+        end = start + RING_VERTICES * VERTEX_SIZE
+        self.vertices[start + 2:end:VERTEX_SIZE] = [r] * RING_VERTICES
+        self.vertices[start + 3:end:VERTEX_SIZE] = [g] * RING_VERTICES
+        self.vertices[start + 4:end:VERTEX_SIZE] = [b] * RING_VERTICES
+        self.dirty = True
+
+    def flush(self):
+        if self.dirty:
+            self.mesh.vertices = self.vertices
+            self.dirty = False
+
+
+class StateMesh:
+
+    """
+    @param: request_redraw - called whenever the meshes change, so they get flushed and drawn.
+                             (MachineScreen.request_redraw)
+    """
+
+    def __init__(self, request_redraw):
+        self.request_redraw = request_redraw
+
+        # Add this to the fbo, between the transitions and the states' labels.
+        self.context = RenderContext(use_parent_projection=True, use_parent_modelview=True)
+        shader = self.context.shader
+        shader.vs = SHADER_VS
+        shader.fs = SHADER_FS
+        # False if the shader didn't compile, in which case the renderer can't be used.
+        self.ready = bool(shader.success)
+
+        self.chunks = []
+        # state -> [chunk, slot, highlight (r, g, b)]
+        self.slots = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, state):
+        return state in self.slots
+
+    def clear(self):
+        self.context.clear()
+        self.chunks = []
+        self.slots = {}
+        self.request_redraw()
+
+    def add(self, state):
+        if state in self.slots:
+            self.update(state)
+            return
+
+        chunk = None
+        for existing in self.chunks:
+            if existing.has_space():
+                chunk = existing
+                break
+        if chunk is None:
+            chunk = MeshChunk(self.context)
+            self.chunks.append(chunk)
+
+        slot = chunk.take_slot()
+        self.slots[state] = [chunk, slot, HIGHLIGHT_COLOR]
+        chunk.write_slot(slot, get_state_vertices(state, HIGHLIGHT_COLOR))
+        self.request_redraw()
+
+    def remove(self, state):
+        record = self.slots.pop(state, None)
+        if record is not None:
+            record[0].free_slot(record[1])
+            self.request_redraw()
+
+    """
+    @desc: Rewrites a state's vertices after it has moved or changed what it shows.
+    """
+    def update(self, state):
+        record = self.slots.get(state)
+        if record is not None:
+            record[0].write_slot(record[1], get_state_vertices(state, record[2]))
+            self.request_redraw()
+
+    def set_highlight(self, state, r, g, b):
+        record = self.slots.get(state)
+        if record is not None:
+            record[2] = (r, g, b)
+            record[0].write_outline_color(record[1], r, g, b)
+            self.request_redraw()
+
+    """
+    @desc: Uploads the chunks changed since the last flush. (Called once a frame, before drawing)
+    """
+    def flush(self):
+        for chunk in self.chunks:
+            chunk.flush()
+
+    """
+    @return: the number of meshes (draw calls) the states take.
+    """
+    def get_mesh_count(self):
+        return len(self.chunks)
@@ -0,0 +1,168 @@
+"""
+@Desc: A compact record of every step a machine has taken in run mode.
+       Steps are kept in packed arrays rather than one object per step, and the
+       tape is snapshotted periodically so any step can be reached by restoring
+       the nearest snapshot and replaying at most snapshot_interval steps.
+
+       A run too long to record (such as a background run) is kept as a jump from one step
+       to the next, with a checkpoint snapshot either side of it. Checkpoints are never
+       thinned out, so replaying never has to cross a jump.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class StepHistory:
+
+    """
+    @param: snapshot_interval - the initial number of steps between tape snapshots.
+    @param: memory_budget - the number of bytes of tape snapshots to keep. Once this is
+                            exceeded every second snapshot is dropped and the interval doubles.
+    """
+
+    def __init__(self, snapshot_interval=256, memory_budget=8 * 1024 * 1024):
+        self.snapshot_interval = snapshot_interval
+        self.memory_budget = memory_budget
+
+        # Step n is the configuration before the n'th move: the state the machine is in,
+        # the transition about to fire (-1 if it halts), the symbol under the head and
+        # the head movement (-1, 0 or 1).
+        self.state_ids = array('i')
+        self.trans_ids = array('i')
+        self.read_codes = array('i')
+        self.moves = array('b')
+
+        # Parallel lists, sorted by step.
+        self.snapshot_steps = []
+        self.snapshots = []
+        self.snapshot_bytes = 0
+        # Steps whose snapshots are kept however many are thinned out.
+        self.checkpoints = set()
+
+        # Steps followed by a jump, sorted, and the machine steps skipped by all the jumps up to
+        # and including each one. (A jump of n machine steps skips n - 1)
+        self.jump_steps = []
+        self.jump_skipped = []
+
+    def __len__(self):
+        return len(self.state_ids)
+
+    def append(self, state_id, trans_id, read_code, move):
+        self.state_ids.append(state_id)
+        self.trans_ids.append(trans_id)
+        self.read_codes.append(read_code)
+        self.moves.append(move)
+
+    """
+    @return: (state_id, trans_id, read_code, move) for the given step.
+    """
+    def get_step(self, step_no):
+        return (self.state_ids[step_no], self.trans_ids[step_no],
+                self.read_codes[step_no], self.moves[step_no])
+
+    def snapshot_due(self, step_no):
+        if step_no % self.snapshot_interval != 0:
+            return False
+        return not self.snapshot_steps or self.snapshot_steps[-1] < step_no
+
+    """
+    @desc: Stores a snapshot of the machine at the given step.
+    @param: tape_snapshot - whatever the tape's snapshot() returned. It is handed back untouched.
+    @param: size - roughly how many bytes the snapshot uses.
+    """
+    def add_snapshot(self, step_no, state_id, tape_snapshot, size):
+        self.snapshot_steps.append(step_no)
+        self.snapshots.append((state_id, tape_snapshot, size))
+        self.snapshot_bytes += size
+
+        while self.snapshot_bytes > self.memory_budget and self.can_thin():
+            self.thin_snapshots()
+
+    """
+    @desc: Stores a snapshot at the given step which is never thinned out. (The step must be
+           the last step with a snapshot, or after it)
+    """
+    def add_checkpoint(self, step_no, state_id, tape_snapshot, size):
+        self.checkpoints.add(step_no)
+        if not self.snapshot_steps or self.snapshot_steps[-1] < step_no:
+            self.add_snapshot(step_no, state_id, tape_snapshot, size)
+
+    # Only step 0 and the checkpoints are left once nothing more can be thinned.
+    def can_thin(self):
+        kept = len(self.checkpoints)
+        if 0 not in self.checkpoints:
+            kept += 1
+        return len(self.snapshots) > kept
+
+    """
+    @desc: Doubles the snapshot interval, keeping only snapshots on the new interval.
+           (Step 0 is always kept, so every step can still be reached)
+    """
+    def thin_snapshots(self):
+        self.snapshot_interval *= 2
+
+        kept_steps = []
+        kept = []
+        self.snapshot_bytes = 0
+        for step_no, snapshot in zip(self.snapshot_steps, self.snapshots):
+            if step_no % self.snapshot_interval == 0 or step_no in self.checkpoints:
+                kept_steps.append(step_no)
+                kept.append(snapshot)
+                self.snapshot_bytes += snapshot[2]
+
+        self.snapshot_steps = kept_steps
+        self.snapshots = kept
+
+    """
+    @return: (step_no, state_id, tape_snapshot) of the last snapshot at or before step_no,
+             or None if there isn't one.
+    """
+    def nearest_snapshot(self, step_no):
+        index = bisect_right(self.snapshot_steps, step_no) - 1
+        if index < 0:
+            return None
+        state_id, tape_snapshot, size = self.snapshots[index]
+        return (self.snapshot_steps[index], state_id, tape_snapshot)
+
+    """
+    @desc: Records that the machine took steps machine steps to get from step_no to the next step.
+           Both steps should have checkpoints.
+    """
+    def add_jump(self, step_no, steps):
+        skipped = self.jump_skipped[-1] if self.jump_skipped else 0
+        self.jump_steps.append(step_no)
+        self.jump_skipped.append(skipped + steps - 1)
+
+    def is_jump(self, step_no):
+        index = bisect_left(self.jump_steps, step_no)
+        return index < len(self.jump_steps) and self.jump_steps[index] == step_no
+
+    """
+    @return: the number of steps the machine had taken by step_no, counting every step of the jumps before it.
+    """
+    def get_machine_step(self, step_no):
+        index = bisect_left(self.jump_steps, step_no)
+        if index == 0:
+            return step_no
+        return step_no + self.jump_skipped[index - 1]
+
+    """
+    @desc: Forgets every step from length on, so a different run can be recorded from there.
+    """
+    def truncate(self, length):
+        del self.state_ids[length:]
+        del self.trans_ids[length:]
+        del self.read_codes[length:]
+        del self.moves[length:]
+
+        index = bisect_left(self.snapshot_steps, length)
+        del self.snapshot_steps[index:]
+        del self.snapshots[index:]
+        self.snapshot_bytes = sum(snapshot[2] for snapshot in self.snapshots)
+        self.checkpoints = set(step_no for step_no in self.checkpoints if step_no < length)
+
+        # A jump from the last step kept would lead to a step which is gone.
+        index = bisect_left(self.jump_steps, length - 1)
+        del self.jump_steps[index:]
+        del self.jump_skipped[index:]
@@ -35,9 +35,18 @@ class TouchHandler(Widget):
 
     curr_time = 0
 
+    def __init__(self, **kwargs):
+        super(TouchHandler, self).__init__(**kwargs)
+
+        # Touches which have moved since move_triggered was last fired. (See flush_moves)
+        self.moved_touches = []
+
     def on_touch_down(self, touch):
         super(TouchHandler, self).on_touch_down(touch)
 
+        # Moves made before this touch are handled first.
+        self.flush_moves()
+
         self.curr_touch_down = touch
 
         if self.touch_stray == 0:
@@ -71,6 +80,9 @@ class TouchHandler(Widget):
             Clock.unschedule(self.hold_routine)
 
     def on_touch_up(self, touch):
+        # A drag must reach its last position before it is let go.
+        self.flush_moves()
+
         # We have a single touch, handle single click, double click.
         if not self.multitouch and self.initial_touch:
             if self.curr_time < self.animation_wait and not touch.is_double_tap and not self.strayed:
@@ -95,15 +107,33 @@ class TouchHandler(Widget):
             self.multitouch = False
 
     def on_touch_move(self, touch):
-        # Bit of a hacky way to see a move event, but it works.
-        self.move_triggered = not self.move_triggered
         if self.initial_touch == touch:
             if Vector(self.initial_touch.opos).distance(Vector(touch.pos)) > self.touch_stray:
                 touch.strayed = True
                 self.strayed = True
                 self.canvas.clear()
                 Clock.unschedule(self.hold_routine)
-        self.curr_touch_move = touch
+
+        # Fast digitizers send several moves a frame. Only the latest position of each
+        # touch matters, so they are passed on once, just before the frame is drawn.
+        if touch not in self.moved_touches:
+            self.moved_touches.append(touch)
+            if len(self.moved_touches) == 1:
+                Clock.schedule_once(self.flush_moves, -1)
+
+    """
+    Desc: Fires move_triggered once for each touch which has moved since the last flush.
+    """
+    def flush_moves(self, dt=None):
+        if not self.moved_touches:
+            return
+        touches = self.moved_touches
+        self.moved_touches = []
+
+        for touch in touches:
+            self.curr_touch_move = touch
+            # Bit of a hacky way to see a move event, but it works.
+            self.move_triggered = not self.move_triggered
 
     def hold_routine(self, dt):
 
@@ -0,0 +1,477 @@
+"""
+@Desc: A headless turing machine engine. Machines are compiled into integer
+       state/symbol tables and run on a plain array tape. Nothing in here
+       depends on kivy so it can be used for batch runs as well as by the
+       simulator (see turingsimulator.py).
+"""
+
+from array import array
+
+from turingtape_array import TuringTape
+
+# Reasons for a run stopping. (See TuringEngine.halt_reason)
+HALT_ACCEPT = 'accept'
+HALT_REJECT = 'reject'
+HALT_STEP_LIMIT = 'step_limit'
+
+# Reasons for the engine giving up on a machine which may never halt.
+HALT_CONFIG_REPEAT = 'config_repeat'
+HALT_TRANSLATED_CYCLE = 'translated_cycle'
+HALT_STEP_CEILING = 'step_ceiling'
+HALT_MEMORY_CEILING = 'memory_ceiling'
+
+MOVES = {'L': -1, 'R': 1}
+
+
+class CompiledMachine:
+
+    """
+    @desc: Compiles a set of states into flat integer tables.
+           Symbols are given dense codes (the blank is always code 0) and
+           every (state, symbol) pair maps to a transition index or -1.
+    @param: states - a list of state objects. Anything with name, final_state and
+                     out_transitions (read_sym, write_sym, direction, to_state) works.
+    @param: start_state - the state object the machine begins in.
+    @param: blank_char - the character used to represent a blank cell.
+    @param: symbols, codes - an optional symbol table to share, such as a tape's
+                             (see turingtape_array.TuringTape).
+    """
+
+    def __init__(self, states, start_state, blank_char, symbols=None, codes=None):
+        self.blank_char = blank_char
+
+        if symbols is None:
+            symbols = []
+            codes = {}
+        self.symbols = symbols
+        self.codes = codes
+        self.encode_symbol(blank_char)
+
+        self.states = list(states)
+        self.state_ids = {}
+        for state_id, state in enumerate(self.states):
+            self.state_ids[state] = state_id
+
+        self.start_id = self.state_ids[start_state]
+        self.final = bytearray(len(self.states))
+
+        # One entry per transition, indexed by the transition id.
+        self.transitions = []
+        self.transition_ids = {}
+        self.trans_state = array('i')
+        self.trans_read = array('i')
+        self.trans_write = array('i')
+        self.trans_move = array('i')
+        self.trans_next = array('i')
+
+        for state_id, state in enumerate(self.states):
+            if state.final_state:
+                self.final[state_id] = 1
+            for transition in state.out_transitions:
+                self.transition_ids[transition] = len(self.transitions)
+                self.transitions.append(transition)
+                self.trans_state.append(state_id)
+                self.trans_read.append(self.encode_symbol(transition.read_sym))
+                self.trans_write.append(self.encode_symbol(transition.write_sym))
+                self.trans_move.append(MOVES.get(transition.direction, 0))
+                self.trans_next.append(self.state_ids[transition.to_state])
+
+        self.build_tables()
+
+    """
+    @desc: Returns the code of a symbol, giving it a new code if it hasn't been seen.
+           The dispatch table needs rebuilding if new symbols are added after compiling.
+    """
+    def encode_symbol(self, sym):
+        code = self.codes.get(sym)
+        if code is None:
+            code = len(self.symbols)
+            self.codes[sym] = code
+            self.symbols.append(sym)
+        return code
+
+    """
+    @desc: (Re)builds the dispatch table. Row r holds the transitions of state r,
+           so the transition for a state and symbol is table[r * stride + code].
+           When a state has several transitions on the same symbol the first one wins,
+           the same as TuringState.get_transition.
+    """
+    def build_tables(self):
+        self.stride = len(self.symbols)
+        self.table = array('i', [-1]) * (len(self.states) * self.stride)
+
+        for trans_id in range(len(self.transitions)):
+            index = self.trans_state[trans_id] * self.stride + self.trans_read[trans_id]
+            if self.table[index] == -1:
+                self.table[index] = trans_id
+
+        # The engine keeps states as row offsets to save a multiply per step.
+        self.trans_next_row = array('i', [state_id * self.stride for state_id in self.trans_next])
+
+    def get_transition_id(self, state_id, code):
+        if code >= self.stride:
+            return -1
+        return self.table[state_id * self.stride + code]
+
+    """
+    @desc: Used by the gui simulator to dispatch on the compiled tables.
+    @param: state - a state object given when compiling.
+    @param: read_sym - the symbol under the tape head.
+    @return: the transition object to fire, or None if the machine halts.
+    """
+    def next_transition(self, state, read_sym):
+        code = self.codes.get(read_sym)
+        if code is None:
+            return None
+        trans_id = self.get_transition_id(self.state_ids[state], code)
+        if trans_id == -1:
+            return None
+        return self.transitions[trans_id]
+
+
+class TuringEngine:
+
+    """
+    @desc: Runs a compiled machine on an array tape (see turingtape_array.py).
+           The tape is materialised the same way as turingtape_deque.TuringTape, one cell
+           at a time as the head walks off either end, so tape strings match the gui exactly.
+    @param: machine - a CompiledMachine.
+    @param: tape_str - the initial contents of the tape. The head starts on the first character.
+    @param: tape - an existing array tape to run on instead, which must share the machine's
+                   symbol table.
+    """
+
+    def __init__(self, machine, tape_str, tape=None):
+        self.machine = machine
+
+        # See set_limits
+        self.step_ceiling = None
+        self.cell_ceiling = None
+        self.detector = None
+
+        self.set_tape(tape_str, tape)
+
+    def set_tape(self, tape_str, tape=None):
+        machine = self.machine
+        # The tape shares the machine's symbol table so cells hold machine codes.
+        if tape is None:
+            tape = TuringTape(tape_str, machine.blank_char, True, machine.symbols, machine.codes)
+        self.tape = tape
+        if machine.stride != len(machine.symbols):
+            machine.build_tables()
+
+        self.state = machine.start_id
+        self.steps = 0
+        self.halted = False
+        self.halt_reason = ''
+
+        if self.detector:
+            self.detector.reset()
+
+    """
+    @desc: Bounds the run of a machine that might never halt. Each limit stops the machine
+           with its own halt reason.
+    @param: step_ceiling - the most steps the machine may take in total. (HALT_STEP_CEILING)
+    @param: cell_ceiling - the most tape cells the machine may use. (HALT_MEMORY_CEILING)
+    @param: detect_repeats - stop when a whole configuration repeats. (HALT_CONFIG_REPEAT)
+    @param: detect_translation - stop when the machine repeats itself while sweeping off
+                                 into blank tape. (HALT_TRANSLATED_CYCLE)
+    Note: Detection checks every step, so it runs a lot slower than the plain engine.
+    """
+    def set_limits(self, step_ceiling=None, cell_ceiling=None, detect_repeats=False, detect_translation=False):
+        self.step_ceiling = step_ceiling
+        self.cell_ceiling = cell_ceiling
+        if detect_repeats or detect_translation:
+            self.detector = LoopDetector(detect_repeats, detect_translation)
+        else:
+            self.detector = None
+
+    def stop(self, halt_reason):
+        self.halted = True
+        self.halt_reason = halt_reason
+        return halt_reason
+
+    """
+    @desc: Runs the machine until it halts or max_steps steps have been taken.
+    @param: max_steps - the most steps to run for, or None to run until halting.
+    @return: the halt reason, HALT_STEP_LIMIT if the step limit was reached first.
+    """
+    def run(self, max_steps=None):
+        if self.halted:
+            return self.halt_reason
+
+        max_steps = self.cap_steps(max_steps)
+        if max_steps == 0:
+            return self.stop(HALT_STEP_CEILING)
+
+        if self.detector:
+            halt_reason = self.run_detecting(max_steps)
+        else:
+            halt_reason = self.run_fast(max_steps)
+        return self.check_step_ceiling(halt_reason)
+
+    # Shortens a run so it can't pass the step ceiling.
+    def cap_steps(self, max_steps):
+        if self.step_ceiling is None:
+            return max_steps
+        remaining = max(self.step_ceiling - self.steps, 0)
+        if max_steps is None or max_steps > remaining:
+            return remaining
+        return max_steps
+
+    def check_step_ceiling(self, halt_reason):
+        if halt_reason == HALT_STEP_LIMIT and self.step_ceiling is not None and self.steps >= self.step_ceiling:
+            return self.stop(HALT_STEP_CEILING)
+        return halt_reason
+
+    def run_fast(self, max_steps):
+        machine = self.machine
+        table = machine.table
+        stride = machine.stride
+        write = machine.trans_write
+        move = machine.trans_move
+        next_row = machine.trans_next_row
+
+        tape = self.tape
+        cells = tape.cells
+        head = tape.head
+        start = tape.start
+        end = tape.end
+        row = self.state * stride
+
+        limit = -1 if max_steps is None else max_steps
+        cell_limit = self.cell_ceiling if self.cell_ceiling is not None else float('inf')
+        out_of_cells = False
+        steps = 0
+
+        while steps != limit:
+            trans_id = table[row + cells[head]]
+            if trans_id < 0:
+                self.halted = True
+                break
+
+            cells[head] = write[trans_id]
+            head += move[trans_id]
+
+            if head < start:
+                start = head
+                if head < 0:
+                    tape.head = head
+                    tape.start = start
+                    tape.end = end
+                    tape.grow_left()
+                    cells = tape.cells
+                    head = tape.head
+                    start = tape.start
+                    end = tape.end
+                if end - start > cell_limit:
+                    # Finish this step then stop.
+                    out_of_cells = True
+                    limit = steps + 1
+            elif head >= end:
+                end = head + 1
+                if end > len(cells):
+                    tape.grow_right()
+                    cells = tape.cells
+                if end - start > cell_limit:
+                    out_of_cells = True
+                    limit = steps + 1
+
+            row = next_row[trans_id]
+            steps += 1
+
+        tape.head = head
+        tape.start = start
+        tape.end = end
+        self.state = row // stride
+        self.steps += steps
+
+        if self.halted:
+            if machine.final[self.state]:
+                self.halt_reason = HALT_ACCEPT
+            else:
+                self.halt_reason = HALT_REJECT
+            return self.halt_reason
+        if out_of_cells:
+            return self.stop(HALT_MEMORY_CEILING)
+        return HALT_STEP_LIMIT
+
+    # Steps one at a time so the loop detector sees every configuration.
+    def run_detecting(self, max_steps):
+        detector = self.detector
+        limit = -1 if max_steps is None else max_steps
+        steps = 0
+        halt_reason = HALT_STEP_LIMIT
+
+        while steps != limit:
+            halt_reason = self.run_fast(1)
+            if halt_reason != HALT_STEP_LIMIT:
+                break
+            steps += 1
+
+            loop_reason = detector.check(self.state, self.tape)
+            if loop_reason:
+                return self.stop(loop_reason)
+
+        return halt_reason
+
+    def step(self):
+        return self.run(1)
+
+    def get_curr_letter(self):
+        return self.tape.get_curr_letter()
+
+    """
+    @desc: Returns the head position relative to the first character of the initial tape.
+    """
+    def get_head_position(self):
+        return self.tape.head - self.tape.origin
+
+    def get_state(self):
+        return self.machine.states[self.state]
+
+    """
+    @desc: Returns the tape from the first non blank character in string form.
+           (Identical to turingtape_deque.TuringTape.get_tape_str)
+    """
+    def get_tape_str(self):
+        return self.tape.get_tape_str()
+
+
+"""
+@desc: Returns the non blank part of a tape as (position of the first non blank cell, cells).
+       Positions are relative to the tape's origin so they survive the buffer growing.
+"""
+def get_tape_contents(tape):
+    cells = bytes(tape.cells[tape.start:tape.end])
+    stripped = cells.lstrip(b'\x00')
+    if not stripped:
+        return (0, b'')
+    first = tape.start - tape.origin + len(cells) - len(stripped)
+    return (first, stripped.rstrip(b'\x00'))
+
+
+"""
+@desc: Returns cells lo to hi (inclusive) of saved tape contents, padded with blanks.
+"""
+def get_segment(contents, lo, hi):
+    first, cells = contents
+    size = hi + 1 - lo
+    segment = b'\x00' * min(max(first - lo, 0), size) + cells[max(lo - first, 0):max(hi + 1 - first, 0)]
+    return segment + b'\x00' * (size - len(segment))
+
+
+class LoopDetector:
+
+    """
+    @desc: Spots machines that will never halt by watching every configuration they reach.
+           Repeats: Brent's cycle finding. A reference configuration is saved at power of two
+           intervals and compared against each step (the tape is only compared once the state
+           and head position match) so memory use stays constant.
+           Translated cycles: a machine sweeping off into blank tape never repeats exactly.
+           Instead, when the head reaches new tape in the same state as a saved reference
+           (with only blanks beyond it both times), and the cells the head has been over since
+           are the same as at the reference, shifted along, it will keep doing so forever.
+    @param: detect_repeats, detect_translation - which checks to make.
+    """
+
+    def __init__(self, detect_repeats=True, detect_translation=True):
+        self.detect_repeats = detect_repeats
+        self.detect_translation = detect_translation
+        self.reset()
+
+    """
+    @desc: Forgets everything seen. Call this whenever the tape is replaced or restored,
+           as positions aren't comparable across the change.
+    """
+    def reset(self):
+        self.repeat_ref = None
+        self.repeat_age = 0
+        self.repeat_power = 1
+
+        # One reference per direction of travel. [1] is sweeping right, [-1] sweeping left.
+        self.sweep_refs = {1: None, -1: None}
+        self.sweep_age = {1: 0, -1: 0}
+        self.sweep_power = {1: 1, -1: 1}
+        # The furthest the head has been on each side, and the furthest back it has
+        # been (against the direction of travel) since each reference.
+        self.record = None
+        self.furthest_back = {1: None, -1: None}
+
+    """
+    @param: state_id - the state the machine is in.
+    @param: tape - the array tape it is running on.
+    @return: a halt reason if the machine will never halt, otherwise None.
+    """
+    def check(self, state_id, tape):
+        pos = tape.head - tape.origin
+
+        if self.detect_repeats and self.check_repeat(state_id, tape):
+            return HALT_CONFIG_REPEAT
+
+        if self.detect_translation:
+            if self.record is None:
+                self.record = {1: pos, -1: pos}
+
+            for side in (1, -1):
+                back = self.furthest_back[side]
+                if back is not None and (pos - back) * side < 0:
+                    self.furthest_back[side] = pos
+                self.sweep_age[side] += 1
+
+                if (pos - self.record[side]) * side > 0:
+                    self.record[side] = pos
+                    if self.check_sweep(side, state_id, pos, tape):
+                        return HALT_TRANSLATED_CYCLE
+
+        return None
+
+    """
+    @desc: Only checks for repeats. Unlike check, this doesn't need to see every step. Any
+           configurations of a single run can be passed in (macroengine.py checks once a block)
+    @return: True if the configuration has been seen before.
+    """
+    def check_repeat(self, state_id, tape):
+        pos = tape.head - tape.origin
+        ref = self.repeat_ref
+        if ref is not None and ref[0] == state_id and ref[1] == pos:
+            if ref[2] == get_tape_contents(tape):
+                return True
+
+        self.repeat_age += 1
+        if self.repeat_age >= self.repeat_power:
+            self.repeat_ref = (state_id, pos, get_tape_contents(tape))
+            self.repeat_power *= 2
+            self.repeat_age = 0
+        return False
+
+    # Called when the head reaches new tape in the direction of side.
+    def check_sweep(self, side, state_id, pos, tape):
+        # Everything past the head must be blank.
+        if side == 1:
+            beyond = tape.cells[tape.head + 1:tape.end]
+        else:
+            beyond = tape.cells[tape.start:tape.head]
+        if beyond.strip(b'\x00'):
+            return False
+
+        ref = self.sweep_refs[side]
+        if ref is not None and ref[0] == state_id:
+            ref_pos = ref[1]
+            shift = pos - ref_pos
+            back = self.furthest_back[side]
+
+            # The cells from furthest back up to the head, then and now.
+            then = get_segment(ref[2], min(back, ref_pos), max(back, ref_pos))
+            lo = min(back, ref_pos) + shift + tape.origin
+            hi = max(back, ref_pos) + shift + tape.origin
+            if then == bytes(tape.cells[lo:hi + 1]):
+                return True
+
+        if self.sweep_age[side] >= self.sweep_power[side]:
+            self.sweep_refs[side] = (state_id, pos, get_tape_contents(tape))
+            self.furthest_back[side] = pos
+            self.sweep_power[side] *= 2
+            self.sweep_age[side] = 0
+
+        return False
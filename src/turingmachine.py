@@ -0,0 +1,141 @@
+"""
+@Desc: A plain data model of a turing machine, with no kivy in sight.
+       XmlParser reads .tm files into a TuringMachine, and the gui builds its
+       TuringStates and TuringTransitions (and so their graphics) from one.
+       Batch tools can load and run machines from the model alone.
+       (Anything expecting states with name, final_state and out_transitions,
+       such as turingengine.CompiledMachine, works with it directly)
+"""
+
+
+class MachineState:
+
+    """
+    @param: name - the name of the state (needs to be unique)
+    @param: pos - the world position the gui draws the state at.
+    """
+
+    def __init__(self, name, pos=(0, 0)):
+        self.name = name
+        self.pos = (pos[0], pos[1])
+        self.start_state = False
+        self.final_state = False
+        self.out_transitions = []
+
+    def set_start_state(self, start_state):
+        self.start_state = start_state
+
+    def set_final_state(self, final_state):
+        self.final_state = final_state
+
+
+class MachineTransition:
+
+    """
+    @param: from_state, to_state - MachineStates.
+    @param: direction - 'L' for left or 'R' for right.
+    @param: read_sym, write_sym - single characters.
+    @param: anchor_offset - where the gui puts the transition's bezier anchor.
+    """
+
+    def __init__(self, from_state, to_state, direction, read_sym, write_sym, anchor_offset=(20, 20)):
+        self.from_state = from_state
+        self.to_state = to_state
+        self.direction = direction
+        self.read_sym = read_sym
+        self.write_sym = write_sym
+        self.anchor_offset = (anchor_offset[0], anchor_offset[1])
+
+
+class TuringMachine:
+
+    """
+    @param: alphabet - the symbols of the machine as a string (as stored in .tm files)
+    @param: blank_char - the character used to represent a blank cell.
+    @param: initial_tape - the tape the machine starts on.
+    """
+
+    def __init__(self, alphabet='', blank_char='_', initial_tape=''):
+        self.alphabet = alphabet
+        self.blank_char = blank_char
+        self.initial_tape = initial_tape
+
+        self.states = []
+        self.states_by_name = {}
+        self.transitions = []
+        self.start_state = None
+
+    """
+    @desc: Adds a new state. Where names clash, get_state_by_name finds the first state added.
+    @return: the new MachineState.
+    """
+    def add_state(self, name, pos=(0, 0)):
+        state = MachineState(name, pos)
+        self.states.append(state)
+        if name not in self.states_by_name:
+            self.states_by_name[name] = state
+        return state
+
+    def get_state_by_name(self, name):
+        return self.states_by_name.get(name)
+
+    """
+    @return: the new MachineTransition.
+    """
+    def add_transition(self, from_state, to_state, direction, read_sym, write_sym, anchor_offset=(20, 20)):
+        transition = MachineTransition(from_state, to_state, direction, read_sym, write_sym, anchor_offset)
+        from_state.out_transitions.append(transition)
+        self.transitions.append(transition)
+        return transition
+
+    def remove_transition(self, transition):
+        transition.from_state.out_transitions.remove(transition)
+        self.transitions.remove(transition)
+
+    def set_start_state(self, state):
+        if self.start_state:
+            self.start_state.set_start_state(False)
+        self.start_state = state
+        if state:
+            state.set_start_state(True)
+
+    def get_final_states(self):
+        return [state for state in self.states if state.final_state]
+
+    """
+    @desc: Returns every symbol the machine or its tape uses, the blank first.
+    """
+    def get_symbols(self):
+        symbols = [self.blank_char]
+        for sym in self.alphabet + (self.initial_tape or ''):
+            if sym not in symbols:
+                symbols.append(sym)
+        for transition in self.transitions:
+            for sym in (transition.read_sym, transition.write_sym):
+                if sym not in symbols:
+                    symbols.append(sym)
+        return symbols
+
+    """
+    @desc: Builds a model from what is on screen, for saving.
+    @param: tm_gui - the machine gui (see machinescreen.py)
+    @param: tape_gui - the tape gui (see turingtape.py)
+    """
+    def from_gui(tm_gui, tape_gui):
+        machine = TuringMachine('ab', '_', tape_gui.get_tape_str())
+
+        model_states = {}
+        for state in tm_gui.states:
+            model_state = machine.add_state(state.name, state.pos)
+            model_state.set_final_state(state.final_state)
+            model_states[state] = model_state
+            if state is tm_gui.start_state:
+                machine.set_start_state(model_state)
+
+        for state in tm_gui.states:
+            for transition in state.out_transitions:
+                machine.add_transition(model_states[state], model_states[transition.to_state], transition.direction,
+                                       transition.read_sym, transition.write_sym, transition.anchor_offset)
+        return machine
+
+    from_gui = staticmethod(from_gui)
@@ -1,13 +1,22 @@
 from kivy.clock import Clock
+from kivy.config import Config
 from kivy.uix.widget import Widget
 from kivy.properties import BooleanProperty
 from kivy.properties import NumericProperty
 
+from turingengine import CompiledMachine, HALT_ACCEPT, HALT_REJECT, HALT_STEP_LIMIT
+from turingengine import HALT_STEP_CEILING, HALT_MEMORY_CEILING
+from stephistory import StepHistory
+from turingtape_rle import TuringTape as TuringTape_RLE
+from simulationworker import SimulationWorker, HALT_CANCELLED
+
 # Note that this class contains no graphics. We subclass widget here to use kivy Properties.
 class TuringSimulator(Widget):
 
 	machine_halted = BooleanProperty()
 	curr_step = NumericProperty()
+	# Steps taken since entering run mode, as last reported by a background run.
+	background_steps = NumericProperty()
 
 	def __init__(self, tm_gui, tape_gui):
 		self.tm_gui = tm_gui
@@ -19,9 +28,27 @@ class TuringSimulator(Widget):
 		self.curr_state = None
 		self.curr_transition = None
 
+		# The machine compiled on entering run mode. (see turingengine.py)
+		self.machine = None
+
 		self.curr_run = 0
 		self.run_speed = 1
 
+		# Turbo runs the machine flat out on a worker thread, rather than at most one step a frame.
+		self.turbo = False
+
+		# The worker thread of a background run (see simulationworker.py)
+		self.worker = None
+		self.worker_on_progress = None
+		# The state highlighted while a background run is shown going.
+		self.worker_state = None
+		# Set when play is pressed in turbo while a cancelled run is still stopping.
+		self.background_restart = False
+		# Turbo runs use macro steps when 'macro_steps = 1' is in the [turing] section of the kivy config.
+		# (see macroengine.py)
+		self.macro_steps = Config.getdefaultint('turing', 'macro_steps', 0) == 1
+		self.macro_block_size = 32
+
 		self.halt_successful = False
 
 		# Watch this value to see when the machine has stopped running
@@ -30,7 +57,22 @@ class TuringSimulator(Widget):
 		# Read this for the reason of the stop
 		self.halt_reason = ''
 
-		self.turing_steps = []
+		# Machines which never halt are stopped by these. (see turingengine.TuringEngine.set_limits)
+		# The step ceiling counts every step since entering run mode, background runs included.
+		self.step_ceiling = 100000000
+		self.cell_ceiling = 10000000
+		# Loops are only detected on background runs. (See check_limits)
+		self.detect_loops = True
+
+		# Bytes of tape snapshots the step history may keep (see stephistory.py)
+		self.history_budget = 8 * 1024 * 1024
+		# Snapshots of tapes longer than this are run length encoded, if that makes them smaller.
+		# (see snapshot_tape)
+		self.rle_cells = 4096
+		# Roughly the bytes a run takes in a list of (symbol, length) pairs.
+		self.rle_run_bytes = 64
+
+		self.history = None
 		self.curr_step = 0
 		self.total_steps = 0
 
@@ -45,32 +87,96 @@ class TuringSimulator(Widget):
 
 			self.curr_step = 0
 			self.total_steps = 0
-			self.turing_steps = []
+			self.history = StepHistory(memory_budget=self.history_budget)
+
+			# Editing is disabled in run mode, so the machine only needs compiling once.
+			# It shares the tape's symbol table so steps can be recorded as the tape's codes.
+			tape = self.tape_gui.tape
+			self.machine = CompiledMachine(self.tm_gui.states, self.tm_gui.start_state, self.tape_gui.blank_char,
+											tape.symbols, tape.codes)
 
 			self.curr_state = self.tm_gui.start_state
-			self.curr_transition = self.curr_state.get_transition(self.tape_gui.get_curr_letter())
+			self.curr_transition = self.machine.next_transition(self.curr_state, self.tape_gui.get_curr_letter())
 			self.highlight_curr_step()
 
-			if self.curr_transition:
-				self.add_turing_step(self.tape_gui.get_curr_letter(), self.curr_transition.write_sym, self.curr_transition.direction)
-			else:
-				self.add_turing_step(self.tape_gui.get_curr_letter(), None, None)
+			self.add_turing_step()
 			return True
 
 		return False
 
 	def exit_run_mode(self):
-		# Stop the machine running before exiting run mode.
-		if self.running:
-			self.running = False
-			Clock.unschedule(self.run_machine_clocked)
+		# Stop the machine running before exiting run mode. (This cancels any background run too,
+		# whose callbacks are ignored once it is no longer self.worker)
+		self.pause_machine()
+		self.worker = None
+		self.clear_worker_state()
 		self.de_highlight_curr_step()
 		self.run_mode = False
+		self.machine = None
+		self.history = None
+
+	"""
+	Desc: Applies the simulator's ceilings and loop detection to an engine.
+	@param: steps_taken - steps already taken, which count towards the step ceiling.
+	"""
+	def set_engine_limits(self, engine, steps_taken):
+		step_ceiling = self.step_ceiling
+		if step_ceiling is not None:
+			step_ceiling -= steps_taken
+		engine.set_limits(step_ceiling, self.cell_ceiling, self.detect_loops, self.detect_loops)
+
+	"""
+	Desc: Checks the newest step against the ceilings. Loops aren't looked for when stepping
+		  one step at a time, only on background runs (through the engine), where a machine
+		  stuck in a loop would otherwise run on unnoticed.
+	Return: The halt reason if the machine should be stopped, otherwise None.
+	"""
+	def check_limits(self):
+		tape = self.tape_gui.tape
+		if self.step_ceiling is not None and self.history.get_machine_step(self.curr_step) >= self.step_ceiling:
+			return HALT_STEP_CEILING
+		if self.cell_ceiling is not None and tape.end - tape.start > self.cell_ceiling:
+			return HALT_MEMORY_CEILING
+		return None
+
+	"""
+	Desc: Records the current configuration as the newest step in the history.
+		  The tape is snapshotted every so often so steps can be sought to quickly.
+	"""
+	def add_turing_step(self):
+		state_id = self.machine.state_ids[self.curr_state]
+		read_code = self.machine.encode_symbol(self.tape_gui.get_curr_letter())
 
-	def add_turing_step(self, read_sym, write_sym, direction):
-		self.turing_steps.append(TuringStep(self.curr_state, self.curr_transition, read_sym, write_sym, direction))
+		if self.curr_transition:
+			trans_id = self.machine.transition_ids[self.curr_transition]
+			move = self.machine.trans_move[trans_id]
+		else:
+			trans_id = -1
+			move = 0
+
+		if self.history.snapshot_due(self.total_steps):
+			tape_snapshot, size = self.snapshot_tape()
+			self.history.add_snapshot(self.total_steps, state_id, tape_snapshot, size)
+
+		self.history.append(state_id, trans_id, read_code, move)
 		self.total_steps += 1
 
+	"""
+	Desc: Snapshots the tape gui's tape for the history. A long tape which is mostly long runs of
+		  the same symbol (such as the blanks a machine leaves behind as it wanders) is kept as a
+		  run length encoded snapshot, so it costs a little per run rather than a byte per cell.
+	Return: (snapshot, roughly how many bytes it takes)
+	"""
+	def snapshot_tape(self):
+		tape = self.tape_gui.tape
+		cells = tape.end - tape.start
+		if cells > self.rle_cells:
+			runs = tape.get_runs(cells // self.rle_run_bytes)
+			if runs is not None:
+				return (runs, tape.tape_index), len(runs) * self.rle_run_bytes
+		tape_snapshot = tape.snapshot()
+		return tape_snapshot, len(tape_snapshot[0])
+
 	def highlight_curr_step(self):
 		if self.curr_transition:
 			self.curr_transition.set_highlight(1,1,0)
@@ -89,22 +195,93 @@ class TuringSimulator(Widget):
 		return False
 
 	def change_step(self, step_no):
+		# Wait for a cancelled background run to stop, it moves the machine when it has.
+		if self.worker:
+			return
 		if step_no < self.total_steps:
 			self.de_highlight_curr_step()
-
-			while self.curr_step < step_no:
-				self.step_machine_forward(False)
-
-			while self.curr_step > step_no:
-				self.step_machine_back(False)
-
+			self.seek_step(step_no)
 			self.tape_gui.update_tape()
 			self.highlight_curr_step() 
 		else:
 			print('Step out of bounds')
 
+	"""
+	Desc: Jumps straight to a step already in the history. The nearest tape snapshot is
+		  restored and only the steps after it are replayed, on a plain list (or a run length
+		  encoded tape) rather than through the tape gui. (The tape gui still needs updating afterwards)
+	"""
+	def seek_step(self, step_no):
+		snap_step, state_id, tape_snapshot = self.history.nearest_snapshot(step_no)
+		if isinstance(tape_snapshot[0], list):
+			self.replay_runs(tape_snapshot, snap_step, step_no)
+		else:
+			self.replay_tape_str(tape_snapshot, snap_step, step_no)
+
+		machine = self.machine
+		state_id, trans_id, read_code, move = self.history.get_step(step_no)
+		self.curr_state = machine.states[state_id]
+		if trans_id == -1:
+			self.curr_transition = None
+		else:
+			self.curr_transition = machine.transitions[trans_id]
+		self.curr_step = step_no
+
+	# Replays steps from a (tape_str, tape_index) snapshot on a plain list of characters.
+	def replay_tape_str(self, tape_snapshot, snap_step, step_no):
+		tape_str, tape_index = tape_snapshot
+		replay = step_no - snap_step
+
+		# Pad both sides by the replay length so the head can't fall off.
+		blank = self.tape_gui.blank_char
+		cells = [blank] * replay + list(tape_str) + [blank] * replay
+		head = replay + tape_index
+		lo = replay
+		hi = replay + len(tape_str)
+
+		machine = self.machine
+		symbols = machine.symbols
+		for step in range(snap_step, step_no):
+			trans_id = self.history.trans_ids[step]
+			cells[head] = symbols[machine.trans_write[trans_id]]
+			head += machine.trans_move[trans_id]
+			if head < lo:
+				lo = head
+			elif head >= hi:
+				hi = head + 1
+
+		self.tape_gui.tape.restore((''.join(cells[lo:hi]), head - lo))
+		self.tape_gui.curr_index = head - lo
+
+	# Replays steps from a run length encoded snapshot (see snapshot_tape) on a run length encoded tape,
+	# so the tape is only expanded to a cell per symbol once, by the tape gui.
+	def replay_runs(self, tape_snapshot, snap_step, step_no):
+		machine = self.machine
+		tape = TuringTape_RLE('', self.tape_gui.blank_char, True)
+		tape.restore(tape_snapshot)
+		for step in range(snap_step, step_no):
+			trans_id = self.history.trans_ids[step]
+			tape.write(machine.symbols[machine.trans_write[trans_id]])
+			move = machine.trans_move[trans_id]
+			if move == -1:
+				tape.move_left()
+			elif move == 1:
+				tape.move_right()
+
+		self.tape_gui.tape.set_runs(tape.get_runs(), tape.tape_index)
+		self.tape_gui.curr_index = tape.tape_index
+
 	# Start the machine running by itself (using kivy clock)
 	def run_machine(self):
+		# Flat out runs go on a worker thread, so the gui stays responsive however long they take.
+		if self.turbo:
+			if self.worker:
+				# A cancelled run is still stopping, so start again once it has. (see background_finished)
+				self.running = True
+				self.background_restart = True
+			else:
+				self.run_machine_background(None, None, self.macro_steps)
+			return
 		self.running = True
 		self.curr_run = 60
 		Clock.schedule_interval(self.run_machine_clocked, 1/60)
@@ -114,6 +291,120 @@ class TuringSimulator(Widget):
 		if self.running:
 			self.running = False
 			Clock.unschedule(self.run_machine_clocked)
+		# A background run stops at the end of its current chunk of steps. The gui catches up
+		# with it when its finish callback arrives, rather than waiting for it here.
+		self.background_restart = False
+		self.cancel_background()
+
+	"""
+	Desc: Runs the machine on a worker thread, so the gui stays responsive however long it runs.
+		  The step count, state and tape around the head are shown every so often while it runs,
+		  and the gui catches up with the machine once the run finishes (or is cancelled).
+	@param: max_steps - the number of steps to run, or None to run until the machine halts.
+	@param: on_progress - also called on the main thread with (steps run, head position, state name).
+	@param: macro_steps - run a block of cells at a time, which is much faster for machines that sweep
+						  back and forth. Only exact repeats are detected as loops though. (see macroengine.py)
+	"""
+	def run_machine_background(self, max_steps=None, on_progress=None, macro_steps=False):
+		if self.worker:
+			return False
+
+		self.running = True
+		self.de_highlight_curr_step()
+
+		# The worker gets its own machine so nothing is shared with the gui between threads.
+		machine = CompiledMachine(self.machine.states, self.machine.states[self.machine.start_id],
+								  self.tape_gui.blank_char)
+		state_id = self.machine.state_ids[self.curr_state]
+
+		# The run's steps are never recorded (there could be far too many), so the history jumps
+		# from a checkpoint here to one where it stops. (see background_finished)
+		self.history.truncate(self.curr_step + 1)
+		self.total_steps = len(self.history)
+		checkpoint, size = self.snapshot_tape()
+		self.history.add_checkpoint(self.curr_step, state_id, checkpoint, size)
+
+		self.worker_on_progress = on_progress
+		block_size = self.macro_block_size if macro_steps else None
+		self.worker = SimulationWorker(machine, self.tape_gui.tape.snapshot(), state_id, max_steps,
+									   self.background_progress, self.background_finished, block_size)
+		self.set_engine_limits(self.worker.engine, self.history.get_machine_step(self.curr_step))
+		# Enough of the worker's tape to fill the tape gui, with the head in the middle.
+		self.worker.set_window(self.tape_gui.middle_index, self.tape_gui.total_elements)
+		self.worker.start()
+		return True
+
+	def pause_background(self):
+		if self.worker:
+			self.worker.pause()
+
+	def resume_background(self):
+		if self.worker:
+			self.worker.resume()
+
+	def cancel_background(self):
+		if self.worker:
+			self.worker.cancel()
+
+	def background_progress(self, worker):
+		if worker is not self.worker:
+			return
+		self.background_steps = self.history.get_machine_step(self.curr_step) + worker.steps
+
+		state = self.machine.states[worker.state_id]
+		if state is not self.worker_state:
+			self.clear_worker_state()
+			state.set_highlight(1,1,0)
+			self.worker_state = state
+
+		if worker.window is not None:
+			self.tape_gui.show_characters(worker.window)
+
+		if self.worker_on_progress:
+			self.worker_on_progress(worker.steps, worker.head, state.name)
+
+	def clear_worker_state(self):
+		if self.worker_state:
+			self.worker_state.set_highlight(.8,.8,.8)
+			self.worker_state = None
+
+	def background_finished(self, worker):
+		if worker is not self.worker:
+			return
+		self.worker = None
+		self.clear_worker_state()
+		# A cancelled run was paused, so running is either already False or the machine has been played again.
+		if not worker.cancelled:
+			self.running = False
+		restart = self.background_restart and worker.halt_reason == HALT_CANCELLED
+		self.background_restart = False
+
+		# Run mode may have been left while the worker was stopping.
+		if not self.run_mode:
+			return
+
+		if worker.steps:
+			tape_snapshot = worker.get_tape_snapshot()
+			self.tape_gui.tape.restore(tape_snapshot)
+			self.tape_gui.curr_index = tape_snapshot[1]
+
+			# The whole run becomes one step in the history, from the checkpoint it started at to this one.
+			self.history.add_jump(self.curr_step, worker.steps)
+			checkpoint, size = self.snapshot_tape()
+			self.history.add_checkpoint(self.total_steps, worker.state_id, checkpoint, size)
+			self.curr_state = self.machine.states[worker.state_id]
+			self.curr_transition = self.machine.next_transition(self.curr_state, self.tape_gui.get_curr_letter())
+			self.add_turing_step()
+			self.curr_step += 1
+			self.background_steps = self.history.get_machine_step(self.curr_step)
+
+		self.tape_gui.update_tape()
+		self.highlight_curr_step()
+
+		if worker.halt_reason not in (HALT_STEP_LIMIT, HALT_CANCELLED):
+			self.halt_machine(worker.halt_reason)
+		elif restart:
+			self.run_machine_background(None, None, self.macro_steps)
 
 	# Runs the machine visually.
 	def run_machine_clocked(self, dt):
@@ -128,10 +419,19 @@ class TuringSimulator(Widget):
 				self.running = False
 
 	def step_machine_forward(self, update_gfx):
+		# Nothing to do until a cancelled background run has stopped. (see change_step)
+		if self.worker:
+			return True
 		self.machine_halted = False
 		if update_gfx:
 			self.de_highlight_curr_step()
-		if self.curr_transition:
+		if self.history.is_jump(self.curr_step):
+			# Over a background run, to the checkpoint where it stopped.
+			self.seek_step(self.curr_step + 1)
+			if update_gfx:
+				self.tape_gui.update_tape()
+				self.highlight_curr_step()
+		elif self.curr_transition:
 			self.curr_step += 1
 			self.tape_gui.write(self.curr_transition.write_sym)
 
@@ -142,48 +442,69 @@ class TuringSimulator(Widget):
 				self.tape_gui.move_right()
 
 			self.curr_state = self.curr_transition.to_state
-			self.curr_transition = self.curr_state.get_transition(self.tape_gui.get_curr_letter())
+			self.curr_transition = self.machine.next_transition(self.curr_state, self.tape_gui.get_curr_letter())
 			
 			if update_gfx:
 				self.tape_gui.update_tape() 
 				self.highlight_curr_step() 
 
 			if self.curr_step >= self.total_steps:
-				if self.curr_transition:
-					self.add_turing_step(self.tape_gui.get_curr_letter(), self.curr_transition.write_sym, self.curr_transition.direction)
-				else:
-					self.add_turing_step(self.tape_gui.get_curr_letter(), None, None)
+				self.add_turing_step()
+
+			halt_reason = self.check_limits()
+			if halt_reason:
+				self.halt_machine(halt_reason)
+				return False
 
 		else:
-			self.highlight_curr_step()
 			if self.curr_state.final_state:
-				self.halt_successful = True
+				self.halt_machine(HALT_ACCEPT)
 			else:
-				self.halt_successful = False
-			self.machine_halted = True
+				self.halt_machine(HALT_REJECT)
 			return False
 		return True
 
 	"""
-	Desc: Uses the turing_steps stack to move the machine backwards.
+	Desc: Stops the machine where it is, and lets anything watching machine_halted know why.
+	@param: halt_reason - one of the halt reasons in turingengine.py.
+	"""
+	def halt_machine(self, halt_reason):
+		self.highlight_curr_step()
+		self.halt_reason = halt_reason
+		self.halt_successful = halt_reason == HALT_ACCEPT
+		self.machine_halted = True
+
+	"""
+	Desc: Uses the step history to move the machine backwards.
 	Returns: Boolean - Whether we cannot move left any further.
 	"""
 	def step_machine_back(self, update_gfx):
+		if self.worker:
+			return False
+		if self.curr_step > 0 and self.history.is_jump(self.curr_step - 1):
+			# Back over a background run, to the checkpoint where it started.
+			if update_gfx:
+				self.de_highlight_curr_step()
+			self.seek_step(self.curr_step - 1)
+			if update_gfx:
+				self.tape_gui.update_tape()
+				self.highlight_curr_step()
+			return self.curr_step == 0
 		if self.curr_step > 0:
 			self.curr_step -= 1
 			if update_gfx:
 				self.de_highlight_curr_step()
 			
-			turing_step = self.turing_steps[self.curr_step]
-			if turing_step.direction == 'L':
+			state_id, trans_id, read_code, move = self.history.get_step(self.curr_step)
+			if move == -1:
 				self.tape_gui.move_right()
-			if turing_step.direction == 'R':
+			if move == 1:
 				self.tape_gui.move_left()
 
-			self.tape_gui.write(turing_step.read_sym)
+			self.tape_gui.write(self.machine.symbols[read_code])
 
-			self.curr_state = turing_step.state
-			self.curr_transition = turing_step.transition
+			self.curr_state = self.machine.states[state_id]
+			self.curr_transition = self.machine.transitions[trans_id]
 
 			if update_gfx:
 				self.tape_gui.update_tape()
@@ -193,24 +514,3 @@ class TuringSimulator(Widget):
 				return True
 			return False
 		return True
-
-			
-"""
-Desc: Used in simulator stack to run the machine forwards and backwards.
-"""
-class TuringStep:
-	"""
-	@param: state - a turingstate instance. (used for highlighting)
-	@param: transition - a turingtransition instance. (used for highlighting)
-
-	Note: These are stored here so the use of wildcards is possible in the future.
-	@param: read_sym - the symbol read (moving forwards)
-	@param: write_sym - the symbol written (moving forwards)
-	@param: read_sym - movement of the tape (moving forwards)
-	"""
-	def __init__(self, state, transition, read_sym, write_sym, direction):
-		self.state = state
-		self.transition = transition
-		self.read_sym = read_sym
-		self.write_sym = write_sym
-		self.direction = direction
\ No newline at end of file
@@ -9,6 +9,7 @@ kivy.require('1.7.0')
 
 """
     Desc: Stores a Turing State and its graphical components. 
+          The graphics are only built once get_instruction_group is first called.
 """
 class TuringState():
 
@@ -24,6 +25,16 @@ class TuringState():
     radius = 25
     name = ''
 
+    # The SpatialGrid (see spatialgrid.py) the tm_gui finds states with.
+    spatial_grid = None
+
+    # Drawn as a plain dot when True. (Set by the tm_gui when zoomed right out)
+    low_detail = False
+
+    # The StateMesh (see statemesh.py) drawing the state's shapes, if the tm_gui uses one.
+    # The instruction group then only holds the label.
+    state_mesh = None
+
     """
     Desc: Initialises the turing state.
     @param: new_pos - the world position to place the state at.
@@ -41,11 +52,15 @@ class TuringState():
         self.final_state = False
         self.start_state = False
         self.unique_id = unique_id
-        self.setUpCanvas()
 
         self.out_transitions = []
         self.in_transitions = []
 
+        # Indexes over out_transitions, keyed by read symbol and by unique id.
+        # (Where several transitions read the same symbol, the first one is indexed)
+        self.transitions_by_read = {}
+        self.transitions_by_id = {}
+
     """
     Desc: Sets up an instruction group for the turing state (pretty ugly but not a lot can be done)
     """
@@ -80,18 +95,71 @@ class TuringState():
         self.initial_state_tail.points = (self.pos[0], self.pos[
                                           1] + self.radius + 25, self.pos[0], self.pos[1] + self.radius + 2)
 
-        self.instructionGroup.add(self.state_circle_color)
-        self.instructionGroup.add(self.state_circle)
-        self.instructionGroup.add(self.state_highlight_color)
-        self.instructionGroup.add(self.state_highlight)
-        self.instructionGroup.add(self.state_label_color)
-        self.instructionGroup.add(self.state_label_rect)
-        self.instructionGroup.add(self.line_color)
+        self.populate_group()
+
+    """
+    Desc: Fills the instruction group with what should be drawn for the state's flags and detail.
+    """
+    def populate_group(self):
+        group = self.instructionGroup
+        group.clear()
+        if self.state_mesh is not None:
+            if not self.low_detail:
+                group.add(self.state_label_color)
+                group.add(self.state_label_rect)
+            return
+
+        self.state_circle.segments = 12 if self.low_detail else 180
+
+        group.add(self.state_circle_color)
+        group.add(self.state_circle)
+        group.add(self.state_highlight_color)
+        group.add(self.state_highlight)
+        if self.low_detail:
+            return
+
+        group.add(self.state_label_color)
+        group.add(self.state_label_rect)
+        group.add(self.line_color)
+
+        if self.final_state:
+            group.add(self.final_state_circle)
+        if self.start_state:
+            group.add(self.initial_state_arrow)
+            group.add(self.initial_state_tail)
+
+    """
+    Desc: Switches between the full drawing and a dot (no label or decorations).
+    """
+    def set_detail(self, low_detail):
+        if low_detail != self.low_detail:
+            self.low_detail = low_detail
+            if self.instructionGroup is not None:
+                self.populate_group()
+            if self.state_mesh is not None:
+                self.state_mesh.update(self)
 
     def set_position(self, new_pos):
         self.pos = (new_pos[0], new_pos[1])
         self.offset_pos = (new_pos[0] - self.radius, new_pos[1] - self.radius)
 
+        if self.instructionGroup is not None:
+            self.update_canvas_positions()
+
+        if self.state_mesh is not None:
+            self.state_mesh.update(self)
+
+        if self.spatial_grid is not None:
+            self.spatial_grid.update(self, self.get_bounds())
+
+        # Update all connected transition positions
+        for transition in self.out_transitions:
+            transition.update_positions()
+
+        for transition in self.in_transitions:
+            transition.update_positions()
+
+    def update_canvas_positions(self):
         self.state_circle.pos = self.offset_pos
         self.state_label_rect.pos = Vector(self.offset_pos) + Vector(3, 0)
         self.state_highlight.ellipse = (self.offset_pos[0],
@@ -105,31 +173,93 @@ class TuringState():
         self.initial_state_tail.points = (self.pos[0], self.pos[
                                           1] + self.radius + 25, self.pos[0], self.pos[1] + self.radius + 2)
 
-        # Update all connected transition positions
-        for transition in self.out_transitions:
-            transition.update_positions()
-
-        for transition in self.in_transitions:
-            transition.update_positions()
-
     def get_position(self):
         return (self.pos[0], self.pos[1])
 
+    def get_bounds(self):
+        return (self.pos[0] - self.radius, self.pos[1] - self.radius,
+                self.pos[0] + self.radius, self.pos[1] + self.radius)
+
+    # Everything drawn, including the start arrow above the state.
+    def get_draw_bounds(self):
+        return (self.pos[0] - self.radius, self.pos[1] - self.radius,
+                self.pos[0] + self.radius, self.pos[1] + self.radius + 27)
+
+    def collide_point(self, point):
+        dx = point[0] - self.pos[0]
+        dy = point[1] - self.pos[1]
+        return dx * dx + dy * dy < self.radius * self.radius
+
+    """
+    Desc: Puts the state in a spatial grid (or takes it out with None), which is then kept
+          up to date as the state moves.
+    """
+    def set_spatial_grid(self, grid):
+        if self.spatial_grid is not None:
+            self.spatial_grid.remove(self)
+        self.spatial_grid = grid
+        if grid is not None:
+            grid.update(self, self.get_bounds())
+
+    """
+    Desc: Draws the state in a StateMesh (or takes it out with None, going back to its own instructions)
+    """
+    def set_state_mesh(self, state_mesh):
+        if state_mesh is self.state_mesh:
+            return
+        if self.state_mesh is not None:
+            self.state_mesh.remove(self)
+        self.state_mesh = state_mesh
+        if state_mesh is not None:
+            state_mesh.add(self)
+            if self.state_highlight_color is not None:
+                state_mesh.set_highlight(self, self.state_highlight_color.r, self.state_highlight_color.g,
+                                         self.state_highlight_color.b)
+        if self.instructionGroup is not None:
+            self.populate_group()
+
     def set_highlight(self, r, g, b):
+        if self.state_mesh is not None:
+            self.state_mesh.set_highlight(self, r, g, b)
+        if self.instructionGroup is None:
+            self.setUpCanvas()
         self.state_highlight_color.r = r
         self.state_highlight_color.g = g
         self.state_highlight_color.b = b
 
     def add_out_transition(self, transition):
-        if transition not in self.out_transitions:
+        if self.transitions_by_id.get(transition.unique_id) is not transition:
             self.out_transitions.append(transition)
+            self.transitions_by_id[transition.unique_id] = transition
+            if transition.read_sym not in self.transitions_by_read:
+                self.transitions_by_read[transition.read_sym] = transition
 
     def remove_out_transition(self, transition):
         if transition in self.out_transitions:
             self.out_transitions.remove(transition)
+            if self.transitions_by_id.get(transition.unique_id) is transition:
+                del self.transitions_by_id[transition.unique_id]
+            if self.transitions_by_read.get(transition.read_sym) is transition:
+                self.reindex_read_sym(transition.read_sym)
             return
         print('Warning: Transition not in state')
 
+    """
+    Desc: Called by a transition when its read symbol changes so the read index stays valid.
+    """
+    def update_read_sym(self, transition, prev_read_sym):
+        if transition.read_sym != prev_read_sym:
+            self.reindex_read_sym(prev_read_sym)
+            self.reindex_read_sym(transition.read_sym)
+
+    # Points the read index at the first transition reading the symbol.
+    def reindex_read_sym(self, read_sym):
+        self.transitions_by_read.pop(read_sym, None)
+        for transition in self.out_transitions:
+            if transition.read_sym == read_sym:
+                self.transitions_by_read[read_sym] = transition
+                return
+
     def add_in_transition(self, transition):
         if transition not in self.in_transitions:
             self.in_transitions.append(transition)
@@ -143,20 +273,14 @@ class TuringState():
     # Used to find the next transition when simulating. 
     # Finds the transition based on the given read symbol.
     def get_transition(self, read_sym):
-        for transition in self.out_transitions:
-            if transition.read_sym == read_sym:
-                return transition
-        return None
+        return self.transitions_by_read.get(read_sym)
 
     """
     Desc: Used when undoing/redoing the creation of transitions. (allows us to find
         non-unique property-wise transitions)
     """
     def get_transition_by_id(self, unique_id):
-        for transition in self.out_transitions:
-            if transition.unique_id == unique_id:
-                return transition
-        return None
+        return self.transitions_by_id.get(unique_id)
 
     # Call this when deleting the state. Removes connected transition references.
     # Returns the invalid transitions to be deleted.
@@ -171,27 +295,27 @@ class TuringState():
 
     def set_start_state(self, start_state):
         self.start_state = start_state
-        if self.start_state:
-            self.instructionGroup.add(self.initial_state_arrow)
-            self.instructionGroup.add(self.initial_state_tail)
-        else:
-            self.instructionGroup.remove(self.initial_state_arrow)
-            self.instructionGroup.remove(self.initial_state_tail)
+        if self.instructionGroup is not None:
+            self.populate_group()
+        if self.state_mesh is not None:
+            self.state_mesh.update(self)
 
     def set_final_state(self, final_state):
         self.final_state = final_state
-        if self.final_state:
-            self.instructionGroup.add(self.final_state_circle)
-        else:
-            self.instructionGroup.remove(self.final_state_circle)
+        if self.instructionGroup is not None:
+            self.populate_group()
+        if self.state_mesh is not None:
+            self.state_mesh.update(self)
 
     def change_name(self, new_name):
         self.name = new_name[0:7]
-        if self.name != '':
+        if self.name != '' and self.instructionGroup is not None:
             self.state_label.label = self.name
             self.state_label.refresh()
 
     def get_instruction_group(self):
+        if self.instructionGroup is None:
+            self.setUpCanvas()
         return self.instructionGroup
 
     def get_unique_id(self):
@@ -1,9 +1,10 @@
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+from kivy.core.text import Label as CoreLabel
 from kivy.properties import ListProperty
 from kivy.metrics import *
 from kivy.graphics import *
-from turingtape_deque import TuringTape as TuringTape_Deque
+from turingtape_array import TuringTape as TuringTape_Array
 
 class TuringTape(BoxLayout):
 
@@ -14,8 +15,10 @@ class TuringTape(BoxLayout):
         self.tape_elements = []
 
         self.blank_char = '_'
-        self.tape = TuringTape_Deque('', self.blank_char, True)
+        self.tape = TuringTape_Array('', self.blank_char, True)
         self.curr_index = 0
+        # The tape as the user set it. (Running the machine changes self.tape)
+        self.initial_tape = ''
 
         self.turing_simulator = None
 
@@ -42,9 +45,11 @@ class TuringTape(BoxLayout):
             self.add_widget(tape_element)
             self.tape_elements.append(tape_element)
 
+        self.tape.clear_window()
         self.update_tape()
 
     def set_initial_tape(self, tape_str):
+        self.initial_tape = tape_str
         self.tape.set_tape(tape_str)
         self.curr_index = 0
         self.update_tape()
@@ -62,11 +67,24 @@ class TuringTape(BoxLayout):
                 self.move_right()
             self.update_tape()
 
+    # Only elements whose character changed since the last update are touched.
     def update_tape(self):
-        tape_chars = self.tape.get_characters(self.curr_index-self.middle_index, self.total_elements)
+        tape_chars, changed = self.tape.get_window(self.curr_index-self.middle_index, self.total_elements)
 
-        for index, tape_char in enumerate(tape_chars):
-            self.tape_elements[index].text = tape_char
+        if changed is None:
+            changed = range(len(tape_chars))
+
+        for index in changed:
+            self.tape_elements[index].set_symbol(tape_chars[index])
+
+    """
+    Desc: Shows a list of characters in place of the tape, such as a background run's tape.
+          (update_tape goes back to showing the tape)
+    """
+    def show_characters(self, tape_chars):
+        for index in range(min(len(tape_chars), len(self.tape_elements))):
+            self.tape_elements[index].set_symbol(tape_chars[index])
+        self.tape.clear_window()
 
     def get_tape_str(self):
         return self.tape.get_tape_str()
@@ -101,12 +119,20 @@ class TuringTape(BoxLayout):
         """
         self.curr_index = self.tape.move_right()
 
-class TapeElement(Label):
+"""
+    Desc: A single cell of the tape. Rather than being a Label (which lays out and renders
+          its text every time it changes) each symbol is rendered once into a texture that
+          is shared by every element, and an element just swaps which texture it draws.
+"""
+class TapeElement(Widget):
 
-    def __init__(self, **kwargs):
+    # Symbol -> texture, shared by all elements.
+    glyph_cache = {}
+
+    def __init__(self, text='_', color=(1, 1, 1, 1), **kwargs):
         super(TapeElement, self).__init__(**kwargs)
 
-        self.bind(size=self.resize)
+        self.bind(size=self.resize, pos=self.resize)
 
         self.bg_color = Color(.3,.3,.3)
         self.bg_rect = Rectangle()
@@ -114,6 +140,40 @@ class TapeElement(Label):
         self.canvas.before.add(self.bg_color)
         self.canvas.before.add(self.bg_rect)
 
+        # Glyphs are rendered white and tinted here.
+        self.glyph_color = Color(*color)
+        self.glyph_rect = Rectangle()
+
+        self.canvas.add(self.glyph_color)
+        self.canvas.add(self.glyph_rect)
+
+        self.symbol = None
+        self.set_symbol(text)
+
+    """
+    Desc: Changes the symbol shown. Nothing is redrawn if the symbol is the same.
+    """
+    def set_symbol(self, symbol):
+        if symbol != self.symbol:
+            self.symbol = symbol
+            self.glyph_rect.texture = self.get_glyph(symbol)
+            self.glyph_rect.size = self.glyph_rect.texture.size
+            self.place_glyph()
+
+    def get_glyph(self, symbol):
+        texture = TapeElement.glyph_cache.get(symbol)
+        if texture is None:
+            label = CoreLabel(text=symbol, font_size=sp(15))
+            label.refresh()
+            texture = label.texture
+            TapeElement.glyph_cache[symbol] = texture
+        return texture
+
+    def place_glyph(self):
+        self.glyph_rect.pos = (int(self.pos[0] + (self.size[0] - self.glyph_rect.size[0])/2),
+                               int(self.pos[1] + (self.size[1] - self.glyph_rect.size[1])/2))
+
     def resize(self, instance, size):
         self.bg_rect.size = (self.size[0], self.size[1]*.6)
-        self.bg_rect.pos = (self.pos[0], self.pos[1]+self.size[1]*.2)
\ No newline at end of file
+        self.bg_rect.pos = (self.pos[0], self.pos[1]+self.size[1]*.2)
+        self.place_glyph()
@@ -0,0 +1,278 @@
+"""
+@Desc: Stores a turing tape as a bytearray of symbol codes which can expand
+       infinitely left or right. Spare blank cells are kept at both ends of
+       the buffer, and the buffer doubles when the head runs into either end,
+       so growth is amortized O(1). Has the same public methods as
+       turingtape_deque.TuringTape.
+"""
+
+import re
+
+# Matches a run of the same cell code.
+RUN_PATTERN = re.compile(b'(.)\\1*', re.DOTALL)
+
+class TuringTape:
+
+    """
+    @desc: Initialises a new tape by encoding the initial tape string.
+    @param: tape_str - A string containing only characters defined in the alphabet.
+    @param: blank_char - The character used to represent a blank character.
+    @param: infinite_left - An option to enable/disable the tape moving infinitely left
+    @param: symbols, codes - An optional symbol table to share (see turingengine.CompiledMachine).
+                             symbols is a list of symbols indexed by code, codes maps them back.
+                             The blank character must be code 0.
+    """
+
+    def __init__(self, tape_str, blank_char, infinite_left, symbols=None, codes=None):
+
+        self.blank_char = blank_char
+        self.infinite_left = infinite_left
+
+        if symbols is None:
+            symbols = []
+            codes = {}
+        self.symbols = symbols
+        self.codes = codes
+        if self.encode_symbol(blank_char) != 0:
+            raise ValueError('The blank character must be symbol code 0')
+
+        # Lazily built table used to decode cells straight into a string.
+        self.decode_table = None
+        self.decode_len = 0
+
+        # The last string returned by get_window, to work out what changed.
+        self.last_window = None
+
+        self.set_tape(tape_str)
+
+    def set_tape(self, tape_str):
+        if not tape_str:
+            tape_str = self.blank_char
+        self.set_codes(bytearray([self.encode_symbol(sym) for sym in tape_str]))
+
+    def set_codes(self, codes):
+        # The materialised tape is cells[start:end], the rest is spare.
+        spare = max(len(codes), 16)
+        self.cells = bytearray(spare) + codes + bytearray(spare)
+        self.start = spare
+        self.end = spare + len(codes)
+        self.head = spare
+        self.last_window = None
+        # Where the first character of tape_str is, for absolute head positions.
+        self.origin = spare
+
+    """
+    @desc: The index of the head from the leftmost materialised cell.
+           (The same meaning as tape_index in turingtape_deque.TuringTape)
+    """
+    @property
+    def tape_index(self):
+        return self.head - self.start
+
+    @tape_index.setter
+    def tape_index(self, index):
+        if index < 0:
+            index += self.end - self.start
+        self.head = self.start + index
+
+    def encode_symbol(self, sym):
+        code = self.codes.get(sym)
+        if code is None:
+            code = len(self.symbols)
+            if code > 255:
+                raise ValueError('Too many tape symbols: ' + str(sym))
+            self.codes[sym] = code
+            self.symbols.append(sym)
+        return code
+
+    """
+    @desc: Decodes a run of cells (a bytearray) into a string.
+    """
+    def decode(self, cells):
+        if self.decode_len != len(self.symbols):
+            self.build_decode_table()
+        if self.decode_table is not None:
+            return cells.translate(self.decode_table).decode('latin-1')
+        symbols = self.symbols
+        return ''.join([symbols[code] for code in cells])
+
+    # The fast path only works when every symbol is a single latin-1 character.
+    def build_decode_table(self):
+        self.decode_len = len(self.symbols)
+        table = bytearray(256)
+        for code, sym in enumerate(self.symbols):
+            if len(sym) != 1 or ord(sym) > 255:
+                self.decode_table = None
+                return
+            table[code] = ord(sym)
+        self.decode_table = table
+
+    # Doubles the buffer. Every index shifts when growing to the left.
+    def grow_left(self):
+        spare = len(self.cells)
+        self.cells = bytearray(spare) + self.cells
+        self.start += spare
+        self.end += spare
+        self.head += spare
+        self.origin += spare
+
+    def grow_right(self):
+        self.cells.extend(bytearray(len(self.cells)))
+
+    def get_curr_letter(self):
+        return self.symbols[self.cells[self.head]]
+
+    """
+    @desc: Used by the simulator to write a character to the current element.
+    """
+
+    def write(self, str):
+        self.cells[self.head] = self.encode_symbol(str)
+
+    """
+    @desc: Used by the simulator to move the tape left.
+           If the next element doesn't exist a new blank element will be created.
+    @return: Returns the new tape index
+    """
+
+    def move_left(self):
+        if self.head == self.start:
+            if self.start == 0:
+                self.grow_left()
+            self.start -= 1
+        self.head -= 1
+        return self.head - self.start
+
+    """
+    @desc: Used by the simulator to move the tape right.
+           If the next element doesn't exist a new blank element will be created.
+    @return: Returns the new tape index
+    """
+
+    def move_right(self):
+        self.head += 1
+        if self.head == self.end:
+            if self.end == len(self.cells):
+                self.grow_right()
+            self.end += 1
+        return self.head - self.start
+
+    """
+    @desc: Returns a list of characters from the given index and total_chars requested.
+           blank_char's are filled in for empty/non-existent elements on the tape.
+    @param: from_index - an integer to begin at
+    @param: total_chars - the total charaters wanted
+    @return: Returns a list of characters from the tape.
+    """
+    def get_characters(self, from_index, total_chars):
+        first = self.start + from_index
+        last = first + total_chars
+        lo = max(first, self.start)
+        hi = min(last, self.end)
+
+        if lo >= hi:
+            return [self.blank_char] * total_chars
+        return ([self.blank_char] * (lo - first) + list(self.decode(self.cells[lo:hi])) +
+                [self.blank_char] * (last - hi))
+
+    """
+    @desc: Reads the visible part of the tape as one string, padded with blank_char's.
+           The caller can use the changed list to only redraw cells that differ from the
+           previous read. (This includes cells which changed because the window moved)
+    @param: from_index - an integer to begin at
+    @param: total_chars - the total charaters wanted
+    @return: (window, changed) - changed is a list of indicies into the window which differ
+             from the last read, or None if there is nothing to compare against.
+    """
+    def get_window(self, from_index, total_chars):
+        first = self.start + from_index
+        last = first + total_chars
+        lo = max(first, self.start)
+        hi = min(last, self.end)
+
+        if lo >= hi:
+            window = self.blank_char * total_chars
+        else:
+            window = (self.blank_char * (lo - first) + self.decode(self.cells[lo:hi]) +
+                      self.blank_char * (last - hi))
+
+        prev_window = self.last_window
+        self.last_window = window
+
+        if prev_window is None or len(prev_window) != len(window):
+            return window, None
+        if prev_window == window:
+            return window, []
+        return window, [index for index in range(len(window)) if window[index] != prev_window[index]]
+
+    """
+    @desc: Forgets the last window read, so the next get_window reports every cell as changed.
+    """
+    def clear_window(self):
+        self.last_window = None
+
+    """
+    @desc: Returns the index of the first non blank character.
+    """
+    def get_first_index(self):
+        tape = self.cells[self.start:self.end]
+        first = len(tape) - len(tape.lstrip(b'\x00'))
+        if first == len(tape):
+            return -1
+        return first
+
+    """
+    @desc: Returns the tape from the first non blank character in string form.
+    """
+    def get_tape_str(self):
+        first_index = self.get_first_index()
+        if first_index == -1:
+            return ''
+        return self.decode(self.cells[self.start + first_index:self.end])
+
+    """
+    @desc: Returns a copy of the tape and head which can be handed back to restore().
+           (Used by the simulator's step history)
+    """
+    def snapshot(self):
+        return (self.decode(self.cells[self.start:self.end]), self.head - self.start)
+
+    def restore(self, snapshot):
+        self.set_tape(snapshot[0])
+        self.head = self.start + snapshot[1]
+
+    """
+    @desc: Run length encodes the tape. (See turingtape_rle.TuringTape.get_runs)
+    @param: max_runs - give up once the tape has more runs than this.
+    @return: a list of (symbol, length) pairs, or None if there were too many.
+    """
+    def get_runs(self, max_runs=None):
+        symbols = self.symbols
+        cells = self.cells
+        runs = []
+        for match in RUN_PATTERN.finditer(cells, self.start, self.end):
+            if len(runs) == max_runs:
+                return None
+            runs.append((symbols[cells[match.start()]], match.end() - match.start()))
+        return runs
+
+    """
+    @desc: Builds the tape from runs, such as a run length encoded tape's. (See get_runs)
+    """
+    def set_runs(self, runs, tape_index=0):
+        codes = bytearray()
+        for sym, length in runs:
+            codes.extend(bytearray([self.encode_symbol(sym)]) * length)
+        if not codes:
+            codes.append(0)
+        self.set_codes(codes)
+        self.head = self.start + tape_index
+
+    """
+    @desc: Returns the whole materialised tape as a single string.
+           Puts * * around where the head of the tape is currently at.
+    """
+    def __str__(self):
+        before = self.decode(self.cells[self.start:self.head])
+        after = self.decode(self.cells[self.head + 1:self.end])
+        return before + '*' + self.get_curr_letter() + '*' + after
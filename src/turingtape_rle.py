@@ -0,0 +1,304 @@
+"""
+@Desc: Stores a turing tape as runs of the same character, which can expand
+       infinitely left or right. A machine that wanders a long way over blank
+       tape only costs a run or two, rather than a cell per blank visited.
+       Runs are kept as sorted run start positions with a symbol for each,
+       and neighbouring runs never share a symbol. Head moves are O(1)
+       (the run under the head is tracked), writes are O(runs) at worst and
+       serialising is O(runs). Has the same public methods as
+       turingtape_deque.TuringTape (plus get_window from turingtape_array).
+"""
+
+from bisect import bisect_right
+
+
+class TuringTape:
+
+    """
+    @desc: Initialises a new tape by run length encoding the initial tape string.
+    @param: tape_str - A string containing only characters defined in the alphabet.
+    @param: blank_char - The character used to represent a blank character.
+    @param: infinite_left - An option to enable/disable the tape moving infinitely left
+    """
+
+    def __init__(self, tape_str, blank_char, infinite_left):
+
+        self.blank_char = blank_char
+        self.infinite_left = infinite_left
+
+        # The last string returned by get_window, to work out what changed.
+        self.last_window = None
+
+        self.set_tape(tape_str)
+
+    def set_tape(self, tape_str):
+        if not tape_str:
+            tape_str = self.blank_char
+
+        # Run i covers positions starts[i] up to starts[i + 1] (or end for the last run).
+        # Positions are fixed, so the leftmost position goes negative as the tape grows left.
+        self.starts = []
+        self.syms = []
+        for pos, sym in enumerate(tape_str):
+            if not self.syms or self.syms[-1] != sym:
+                self.starts.append(pos)
+                self.syms.append(sym)
+        self.end = len(tape_str)
+
+        self.head = 0
+        # The index of the run the head is in.
+        self.run = 0
+        self.last_window = None
+
+    """
+    @desc: Builds the tape straight from runs. (See get_runs)
+    @param: runs - a list of (symbol, length) pairs.
+    @param: tape_index - where to put the head.
+    """
+    def set_runs(self, runs, tape_index=0):
+        self.starts = []
+        self.syms = []
+        pos = 0
+        for sym, length in runs:
+            if length <= 0:
+                continue
+            if self.syms and self.syms[-1] == sym:
+                pos += length
+                continue
+            self.starts.append(pos)
+            self.syms.append(sym)
+            pos += length
+
+        if not self.syms:
+            self.starts.append(0)
+            self.syms.append(self.blank_char)
+            pos = 1
+        self.end = pos
+        self.last_window = None
+        self.tape_index = tape_index
+
+    """
+    @return: the whole materialised tape as a list of (symbol, length) pairs.
+    """
+    def get_runs(self):
+        ends = self.starts[1:] + [self.end]
+        return [(sym, run_end - run_start) for sym, run_start, run_end in zip(self.syms, self.starts, ends)]
+
+    """
+    @desc: The index of the head from the leftmost materialised cell.
+           (The same meaning as tape_index in turingtape_deque.TuringTape)
+    """
+    @property
+    def tape_index(self):
+        return self.head - self.starts[0]
+
+    @tape_index.setter
+    def tape_index(self, index):
+        if index < 0:
+            index += self.end - self.starts[0]
+        self.head = self.starts[0] + index
+        self.run = self.find_run(self.head)
+
+    # Returns the index of the run containing pos.
+    def find_run(self, pos):
+        return max(bisect_right(self.starts, pos) - 1, 0)
+
+    def get_run_end(self, run):
+        if run + 1 < len(self.starts):
+            return self.starts[run + 1]
+        return self.end
+
+    """
+    @desc: Decodes the cells from lo up to hi into a string.
+    """
+    def decode(self, lo, hi):
+        starts = self.starts
+        syms = self.syms
+        pieces = []
+        run = self.find_run(lo)
+        pos = lo
+        while pos < hi:
+            length = min(self.get_run_end(run), hi) - pos
+            pieces.append(syms[run] * length)
+            pos += length
+            run += 1
+        return ''.join(pieces)
+
+    def get_curr_letter(self):
+        return self.syms[self.run]
+
+    """
+    @desc: Used by the simulator to write a character to the current element.
+           The run under the head is split, and merged with its neighbours if they match.
+    """
+
+    def write(self, str):
+        starts = self.starts
+        syms = self.syms
+        run = self.run
+        if syms[run] == str:
+            return
+
+        head = self.head
+        run_start = starts[run]
+        run_end = self.get_run_end(run)
+        has_next = run + 1 < len(starts)
+
+        if run_end - run_start == 1:
+            syms[run] = str
+            if has_next and syms[run + 1] == str:
+                del starts[run + 1]
+                del syms[run + 1]
+            if run > 0 and syms[run - 1] == str:
+                del starts[run]
+                del syms[run]
+                run -= 1
+
+        elif head == run_start:
+            if run > 0 and syms[run - 1] == str:
+                starts[run] += 1
+                run -= 1
+            else:
+                starts.insert(run + 1, head + 1)
+                syms.insert(run + 1, syms[run])
+                syms[run] = str
+
+        elif head == run_end - 1:
+            if has_next and syms[run + 1] == str:
+                starts[run + 1] -= 1
+            else:
+                starts.insert(run + 1, head)
+                syms.insert(run + 1, str)
+            run += 1
+
+        else:
+            starts[run + 1:run + 1] = [head, head + 1]
+            syms[run + 1:run + 1] = [str, syms[run]]
+            run += 1
+
+        self.run = run
+
+    """
+    @desc: Used by the simulator to move the tape left.
+           If the next element doesn't exist a new blank element will be created.
+    @return: Returns the new tape index
+    """
+
+    def move_left(self):
+        self.head -= 1
+        if self.head < self.starts[0]:
+            if self.syms[0] == self.blank_char:
+                self.starts[0] = self.head
+            else:
+                self.starts.insert(0, self.head)
+                self.syms.insert(0, self.blank_char)
+            self.run = 0
+        elif self.head < self.starts[self.run]:
+            self.run -= 1
+        return self.head - self.starts[0]
+
+    """
+    @desc: Used by the simulator to move the tape right.
+           If the next element doesn't exist a new blank element will be created.
+    @return: Returns the new tape index
+    """
+
+    def move_right(self):
+        self.head += 1
+        if self.head == self.end:
+            self.end += 1
+            if self.syms[-1] != self.blank_char:
+                self.starts.append(self.head)
+                self.syms.append(self.blank_char)
+            self.run = len(self.starts) - 1
+        elif self.run + 1 < len(self.starts) and self.head >= self.starts[self.run + 1]:
+            self.run += 1
+        return self.head - self.starts[0]
+
+    """
+    @desc: Returns a list of characters from the given index and total_chars requested.
+           blank_char's are filled in for empty/non-existent elements on the tape.
+    @param: from_index - an integer to begin at
+    @param: total_chars - the total charaters wanted
+    @return: Returns a list of characters from the tape.
+    """
+    def get_characters(self, from_index, total_chars):
+        return list(self.read_window(from_index, total_chars))
+
+    def read_window(self, from_index, total_chars):
+        first = self.starts[0] + from_index
+        last = first + total_chars
+        lo = max(first, self.starts[0])
+        hi = min(last, self.end)
+
+        if lo >= hi:
+            return self.blank_char * total_chars
+        return self.blank_char * (lo - first) + self.decode(lo, hi) + self.blank_char * (last - hi)
+
+    """
+    @desc: Reads the visible part of the tape as one string, padded with blank_char's.
+           (See turingtape_array.TuringTape.get_window)
+    @return: (window, changed) - changed is a list of indicies into the window which differ
+             from the last read, or None if there is nothing to compare against.
+    """
+    def get_window(self, from_index, total_chars):
+        window = self.read_window(from_index, total_chars)
+
+        prev_window = self.last_window
+        self.last_window = window
+
+        if prev_window is None or len(prev_window) != len(window):
+            return window, None
+        if prev_window == window:
+            return window, []
+        return window, [index for index in range(len(window)) if window[index] != prev_window[index]]
+
+    def clear_window(self):
+        self.last_window = None
+
+    """
+    @desc: Returns the index of the first non blank character.
+           (Neighbouring runs never match, so it's at the start of the first or second run)
+    """
+    def get_first_index(self):
+        if self.syms[0] != self.blank_char:
+            return 0
+        if len(self.syms) > 1:
+            return self.starts[1] - self.starts[0]
+        return -1
+
+    """
+    @desc: Returns the tape from the first non blank character in string form.
+    """
+    def get_tape_str(self):
+        first_index = self.get_first_index()
+        if first_index == -1:
+            return ''
+        return self.decode(self.starts[0] + first_index, self.end)
+
+    """
+    @desc: Returns the runs and head, which can be handed back to restore(). O(runs), however
+           many cells the tape covers. (Used by the simulator's step history)
+    """
+    def snapshot(self):
+        return (self.get_runs(), self.head - self.starts[0])
+
+    """
+    @desc: Restores a snapshot, either from snapshot() or a (tape_str, tape_index) snapshot
+           from the other tapes.
+    """
+    def restore(self, snapshot):
+        if isinstance(snapshot[0], list):
+            self.set_runs(snapshot[0], snapshot[1])
+        else:
+            self.set_tape(snapshot[0])
+            self.tape_index = snapshot[1]
+
+    """
+    @desc: Returns the whole materialised tape as a single string.
+           Puts * * around where the head of the tape is currently at.
+    """
+    def __str__(self):
+        before = self.decode(self.starts[0], self.head)
+        after = self.decode(self.head + 1, self.end)
+        return before + '*' + self.get_curr_letter() + '*' + after
@@ -9,6 +9,11 @@ from kivy.properties import *
 kivy.require('1.7.0')
 
 
+"""
+    Desc: Stores a transition and its graphical components.
+          The graphics are only built once get_instruction_group is first called,
+          but positions (used for hit tests) are always kept up to date.
+"""
 class TuringTransition():
 
     instruction_group = None
@@ -19,6 +24,12 @@ class TuringTransition():
     trans_label = None
     trans_label_rect = None
 
+    # The SpatialGrid (see spatialgrid.py) the tm_gui finds transitions with.
+    spatial_grid = None
+
+    # Drawn without its label and with a rougher curve when True. (Set by the tm_gui when zoomed right out)
+    low_detail = False
+
     """
     @Desc: Initialises a transition for use by the simulator.
     @param: from_state - A TuringState object defining the state the transition begins.
@@ -47,11 +58,10 @@ class TuringTransition():
         else:
             self.loop = False
 
-        self.setUpCanvas()
-
-    def setUpCanvas(self):
         self.tb_size = (50,20)
+        self.update_positions()
 
+    def setUpCanvas(self):
         self.instruction_group = InstructionGroup(group=self.get_unique_id())
 
         self.trans_line_color = Color(.9, .9, .9)
@@ -69,19 +79,39 @@ class TuringTransition():
         self.trans_label_color = Color(1, 1, 1, 1)
         self.trans_label_rect = Rectangle(size=self.tb_size, texture=self.trans_label.texture)
 
-        self.instruction_group.add(self.trans_line_color)
-        self.instruction_group.add(self.trans_bezier)
-        self.instruction_group.add(self.trans_arrow_color)
-        self.instruction_group.add(self.trans_arrow)
+        self.populate_group()
+        self.update_canvas_positions()
 
-        self.instruction_group.add(self.trans_label_bg_color)
-        self.instruction_group.add(self.trans_label_bg)
-        self.instruction_group.add(self.trans_label_highlight_color)
-        self.instruction_group.add(self.trans_label_highlight)
-        self.instruction_group.add(self.trans_label_color)
-        self.instruction_group.add(self.trans_label_rect)
+    """
+    Desc: Fills the instruction group with what should be drawn at the current detail.
+    """
+    def populate_group(self):
+        group = self.instruction_group
+        group.clear()
+        self.trans_bezier.bezier_precision = 12 if self.low_detail else 75
+
+        group.add(self.trans_line_color)
+        group.add(self.trans_bezier)
+        group.add(self.trans_arrow_color)
+        group.add(self.trans_arrow)
+        if self.low_detail:
+            return
+
+        group.add(self.trans_label_bg_color)
+        group.add(self.trans_label_bg)
+        group.add(self.trans_label_highlight_color)
+        group.add(self.trans_label_highlight)
+        group.add(self.trans_label_color)
+        group.add(self.trans_label_rect)
 
-        self.update_positions()
+    """
+    Desc: Switches between the full drawing and just the curve and arrow.
+    """
+    def set_detail(self, low_detail):
+        if low_detail != self.low_detail:
+            self.low_detail = low_detail
+            if self.instruction_group is not None:
+                self.populate_group()
 
     def update_positions(self):
         if self.loop:
@@ -92,15 +122,15 @@ class TuringTransition():
             loop_start_pt = start_pt-dir_orth_anchor*20
             loop_end_pt = start_pt+dir_orth_anchor*20
 
-            self.trans_bezier.bezier = (loop_start_pt[0], loop_start_pt[1], self.anchor_pt[0], self.anchor_pt[1],
-                                        loop_end_pt[0], loop_end_pt[1])
+            self.bezier = (loop_start_pt[0], loop_start_pt[1], self.anchor_pt[0], self.anchor_pt[1],
+                           loop_end_pt[0], loop_end_pt[1])
             self.bez_mid = self.get_bezier_mid(loop_start_pt, self.anchor_pt, loop_end_pt)-dir_orth_anchor*5
             dir_vec = dir_orth_anchor
             dir_orth_vec = dir_to_anchor
         else:
             self.anchor_pt = (Vector(self.from_state.pos)+Vector(self.to_state.pos))/2+self.anchor_offset
-            self.trans_bezier.bezier = (self.from_state.pos[0], self.from_state.pos[1], self.anchor_pt[0], self.anchor_pt[1],
-                                        self.to_state.pos[0], self.to_state.pos[1])
+            self.bezier = (self.from_state.pos[0], self.from_state.pos[1], self.anchor_pt[0], self.anchor_pt[1],
+                           self.to_state.pos[0], self.to_state.pos[1])
 
             dir_vec = (Vector(self.from_state.pos)-Vector(self.to_state.pos)).normalize()
             dir_orth_vec = Vector(-dir_vec[1], dir_vec[0])
@@ -109,8 +139,18 @@ class TuringTransition():
         arrow_left = self.bez_mid+dir_vec*12+dir_orth_vec*10
         arrow_right = self.bez_mid+dir_vec*12-dir_orth_vec*10
     
-        self.trans_arrow.points = (arrow_left[0], arrow_left[1], self.bez_mid[0], self.bez_mid[1], arrow_right[0], arrow_right[1])
+        self.arrow_points = (arrow_left[0], arrow_left[1], self.bez_mid[0], self.bez_mid[1], arrow_right[0], arrow_right[1])
         self.label_pos = self.bez_mid - Vector(self.tb_size[0],-self.tb_size[1])/2 + dir_vec*6
+
+        if self.instruction_group is not None:
+            self.update_canvas_positions()
+
+        if self.spatial_grid is not None:
+            self.spatial_grid.update(self, self.get_bounds())
+
+    def update_canvas_positions(self):
+        self.trans_bezier.bezier = self.bezier
+        self.trans_arrow.points = self.arrow_points
         self.trans_label_bg.pos = self.label_pos
         self.trans_label_highlight.rectangle = (self.label_pos[0],self.label_pos[1],self.tb_size[0],self.tb_size[1])
         self.trans_label_rect.pos = self.label_pos
@@ -139,6 +179,30 @@ class TuringTransition():
     def get_position(self):
         return (self.anchor_offset[0], self.anchor_offset[1])
 
+    # The area collide_point hits.
+    def get_bounds(self):
+        return (self.label_pos[0], self.label_pos[1] - 10,
+                self.label_pos[0] + self.tb_size[0], self.label_pos[1] + self.tb_size[1])
+
+    # Everything drawn. (The curve stays inside its control points, the arrow can poke out a little)
+    def get_draw_bounds(self):
+        bounds = self.get_bounds()
+        xs = self.bezier[0::2]
+        ys = self.bezier[1::2]
+        return (min(bounds[0], min(xs) - 15), min(bounds[1], min(ys) - 15),
+                max(bounds[2], max(xs) + 15), max(bounds[3], max(ys) + 15))
+
+    """
+    Desc: Puts the transition in a spatial grid (or takes it out with None), which is then kept
+          up to date as the transition moves.
+    """
+    def set_spatial_grid(self, grid):
+        if self.spatial_grid is not None:
+            self.spatial_grid.remove(self)
+        self.spatial_grid = grid
+        if grid is not None:
+            grid.update(self, self.get_bounds())
+
     def collide_point(self, point):
         if point[0] > self.label_pos[0] and point[0] < self.label_pos[0] + self.tb_size[0]:
             if point[1] > self.label_pos[1] - 10 and point[1] < self.label_pos[1] + self.tb_size[1]:
@@ -146,6 +210,8 @@ class TuringTransition():
         return False
 
     def set_highlight(self, r, g, b):
+        if self.instruction_group is None:
+            self.setUpCanvas()
         self.trans_line_color.r = r
         self.trans_line_color.g = g
         self.trans_line_color.b = b
@@ -158,12 +224,15 @@ class TuringTransition():
         if direction:
             self.direction = direction
         if read_sym:
+            prev_read_sym = self.read_sym
             self.read_sym = read_sym
+            self.from_state.update_read_sym(self, prev_read_sym)
         if write_sym:
             self.write_sym = write_sym
 
-        self.trans_label.label = str(self.direction)+': '+str(self.read_sym)+', '+str(self.write_sym)
-        self.trans_label.refresh()
+        if self.instruction_group is not None:
+            self.trans_label.label = str(self.direction)+': '+str(self.read_sym)+', '+str(self.write_sym)
+            self.trans_label.refresh()
 
     # Deletes the references states has to this transition
     def delete(self):
@@ -177,6 +246,8 @@ class TuringTransition():
 
 
     def get_instruction_group(self):
+        if self.instruction_group is None:
+            self.setUpCanvas()
         return self.instruction_group
 
     def get_unique_id(self):
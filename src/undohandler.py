@@ -14,9 +14,14 @@ class UndoHandler(Widget):
 		self.tm_gui = None
 		self.tape_gui = None
 
+		# Told about every action so it can journal them (see autosave.py)
+		self.autosaver = None
+
 	def reset(self):
 		self.undo_stack = []
 		self.curr_action = -1
+		if self.autosaver:
+			self.autosaver.reset()
 
 	def get_total_actions(self):
 		return len(self.undo_stack)
@@ -26,18 +31,26 @@ class UndoHandler(Widget):
 			self.undo_stack = self.undo_stack[:self.curr_action+1]
 		self.undo_stack.append(action)
 		self.curr_action += 1
+		if self.autosaver:
+			self.autosaver.add_action(action)
 
 	def undo_action(self):
 		if self.curr_action > -1:
-			self.undo_stack[self.curr_action].undo_action(self.tm_gui, self.tape_gui)
+			action = self.undo_stack[self.curr_action]
+			action.undo_action(self.tm_gui, self.tape_gui)
 			self.curr_action -= 1
+			if self.autosaver:
+				self.autosaver.undo_action(action)
 		else:
 			print('Undo out of range')
 
 	def redo_action(self):
 		if self.curr_action < len(self.undo_stack) - 1 and len(self.undo_stack) is not 0:
 			self.curr_action += 1
-			self.undo_stack[self.curr_action].redo_action(self.tm_gui, self.tape_gui)
+			action = self.undo_stack[self.curr_action]
+			action.redo_action(self.tm_gui, self.tape_gui)
+			if self.autosaver:
+				self.autosaver.redo_action(action)
 		else:
 			print('Redo out of range')
 		
@@ -53,6 +66,12 @@ class MachineAction:
 	def redo_action(self, tm_gui, tape_gui):
 		pass
 
+	# Returns (redo ops, undo ops): what the action does to the machine as tuples of plain data,
+	# which the autosave journal can replay without the guis (see autosave.apply_ops).
+	# None if the action can't be journaled.
+	def get_journal_ops(self):
+		return None
+
 class Action_AddState(MachineAction):
 
 	def __init__(self, state_name, pos, unique_id):
@@ -67,6 +86,10 @@ class Action_AddState(MachineAction):
 	def redo_action(self, tm_gui, tape_gui):
 		tm_gui.add_state(self.pos, True, self.state_name, True, self.unique_id)
 
+	def get_journal_ops(self):
+		return ([('add_state', self.state_name, self.pos, False, False, self.unique_id)],
+				[('delete_state', self.state_name)])
+
 class Action_DeleteState(MachineAction):
 
 	def __init__(self, state_name, pos, final, start, out_transitions, in_transitions, unique_id):
@@ -106,6 +129,12 @@ class Action_DeleteState(MachineAction):
 		state = tm_gui.get_state_by_name(self.state_name)
 		tm_gui.delete_state(state, True)
 
+	def get_journal_ops(self):
+		add_ops = [('add_state', self.state_name, self.pos, self.final, self.start, self.unique_id)]
+		for transition in self.out_transitions + self.in_transitions:
+			add_ops.append(transition.get_journal_op())
+		return [('delete_state', self.state_name)], add_ops
+
 class Action_AddTransition(MachineAction):
 	def __init__(self, transition):
 		self.transition_str = TuringTransition_Str(transition)
@@ -120,6 +149,10 @@ class Action_AddTransition(MachineAction):
 		tm_gui.add_transition(from_state, to_state, self.transition_str.anchor_offset, self.transition_str.direction, self.transition_str.read_sym, 
 								self.transition_str.write_sym, self.transition_str.unique_id, True)
 
+	def get_journal_ops(self):
+		return ([self.transition_str.get_journal_op()],
+				[('delete_transition', self.transition_str.from_state, self.transition_str.unique_id)])
+
 class Action_DeleteTransition(MachineAction):
 	def __init__(self, transition):
 		self.transition_str = TuringTransition_Str(transition)
@@ -134,6 +167,10 @@ class Action_DeleteTransition(MachineAction):
 		transition = tm_gui.get_state_by_name(self.transition_str.from_state).get_transition_by_id(self.transition_str.unique_id)
 		tm_gui.delete_transition(transition, True)
 
+	def get_journal_ops(self):
+		return ([('delete_transition', self.transition_str.from_state, self.transition_str.unique_id)],
+				[self.transition_str.get_journal_op()])
+
 class Action_ChangeStateName(MachineAction):
 
 	def __init__(self, prev_name, curr_name):
@@ -142,13 +179,14 @@ class Action_ChangeStateName(MachineAction):
 
 	def undo_action(self, tm_gui, tape_gui):
 		state = tm_gui.get_state_by_name(self.curr_name)
-		tm_gui.update_graphic_ins(state.change_name,
-                                                      [self.prev_name])
+		tm_gui.rename_state(state, self.prev_name)
 	
 	def redo_action(self, tm_gui, tape_gui):
 		state = tm_gui.get_state_by_name(self.prev_name)
-		tm_gui.update_graphic_ins(state.change_name,
-                                                      [self.curr_name])
+		tm_gui.rename_state(state, self.curr_name)
+
+	def get_journal_ops(self):
+		return [('rename_state', self.prev_name, self.curr_name)], [('rename_state', self.curr_name, self.prev_name)]
 
 class Action_ChangeStateFinal(MachineAction):
 
@@ -167,6 +205,9 @@ class Action_ChangeStateFinal(MachineAction):
 		tm_gui.update_graphic_ins(state.set_final_state,
                                                   [self.curr_bool])
 
+	def get_journal_ops(self):
+		return [('set_final', self.state_name, self.curr_bool)], [('set_final', self.state_name, self.prev_bool)]
+
 class Action_ChangeStateStart(MachineAction):
 
 	def __init__(self, state_name, prev_bool, curr_bool, prev_state_name):
@@ -210,6 +251,22 @@ class Action_ChangeStateStart(MachineAction):
                                                           [False])
 			tm_gui.start_state = None
 
+	def get_journal_ops(self):
+		if self.curr_bool:
+			redo_ops = [('set_start', self.state_name, True)]
+			if self.prev_state_name:
+				redo_ops.insert(0, ('set_start', self.prev_state_name, False))
+		else:
+			redo_ops = [('set_start', self.state_name, False)]
+
+		if self.prev_bool:
+			undo_ops = [('set_start', self.state_name, True)]
+		else:
+			undo_ops = [('set_start', self.state_name, False)]
+			if self.prev_state_name:
+				undo_ops.append(('set_start', self.prev_state_name, True))
+		return redo_ops, undo_ops
+
 class Action_MoveObject(MachineAction):
 
 	def __init__(self, unique_id, prev_pos, curr_pos):
@@ -223,6 +280,7 @@ class Action_MoveObject(MachineAction):
 			tm_gui.update_graphic_ins(obj.set_anchor, [self.prev_pos])
 		else:
 			tm_gui.update_graphic_ins(obj.set_position, [self.prev_pos])
+		tm_gui.refresh_visibility(obj)
 
 	def redo_action(self, tm_gui, tape_gui):
 		obj = tm_gui.get_obj_by_id(self.unique_id)
@@ -230,6 +288,11 @@ class Action_MoveObject(MachineAction):
 			tm_gui.update_graphic_ins(obj.set_anchor, [self.curr_pos])
 		else:
 			tm_gui.update_graphic_ins(obj.set_position, [self.curr_pos])
+		tm_gui.refresh_visibility(obj)
+
+	def get_journal_ops(self):
+		return ([('move', self.unique_id, (self.curr_pos[0], self.curr_pos[1]))],
+				[('move', self.unique_id, (self.prev_pos[0], self.prev_pos[1]))])
 
 class Action_TransDir(MachineAction):
 
@@ -246,6 +309,10 @@ class Action_TransDir(MachineAction):
 		transition = tm_gui.get_obj_by_id(self.unique_id)
 		tm_gui.update_graphic_ins(transition.update_transition_vals, [self.curr_dir, None, None])
 
+	def get_journal_ops(self):
+		return ([('set_transition', self.unique_id, self.curr_dir, None, None)],
+				[('set_transition', self.unique_id, self.prev_dir, None, None)])
+
 class Action_TransRead(MachineAction):
 
 	def __init__(self, unique_id, prev_read, curr_read):
@@ -261,6 +328,10 @@ class Action_TransRead(MachineAction):
 		transition = tm_gui.get_obj_by_id(self.unique_id)
 		tm_gui.update_graphic_ins(transition.update_transition_vals, [None, self.curr_read, None])
 
+	def get_journal_ops(self):
+		return ([('set_transition', self.unique_id, None, self.curr_read, None)],
+				[('set_transition', self.unique_id, None, self.prev_read, None)])
+
 class Action_TransWrite(MachineAction):
 
 	def __init__(self, unique_id, prev_write, curr_write):
@@ -276,6 +347,10 @@ class Action_TransWrite(MachineAction):
 		transition = tm_gui.get_obj_by_id(self.unique_id)
 		tm_gui.update_graphic_ins(transition.update_transition_vals, [None, None, self.curr_write])
 
+	def get_journal_ops(self):
+		return ([('set_transition', self.unique_id, None, None, self.curr_write)],
+				[('set_transition', self.unique_id, None, None, self.prev_write)])
+
 class Action_ChangeTape(MachineAction):
 	def __init__(self, prev_tape, curr_tape):
 		self.prev_tape = prev_tape
@@ -287,6 +362,9 @@ class Action_ChangeTape(MachineAction):
 	def redo_action(self, tm_gui, tape_gui):
 		tape_gui.set_initial_tape(self.curr_tape)
 
+	def get_journal_ops(self):
+		return [('set_tape', self.curr_tape)], [('set_tape', self.prev_tape)]
+
 class TuringTransition_Str():
 
 	def __init__(self, transition):
@@ -297,4 +375,8 @@ class TuringTransition_Str():
 		self.direction = transition.direction
 		self.read_sym = transition.read_sym
 		self.write_sym = transition.write_sym
-		self.unique_id = transition.unique_id
\ No newline at end of file
+		self.unique_id = transition.unique_id
+
+	def get_journal_op(self):
+		return ('add_transition', self.from_state, self.to_state, self.anchor_offset, self.direction,
+				self.read_sym, self.write_sym, self.unique_id)
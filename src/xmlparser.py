@@ -4,6 +4,10 @@ except ImportError:
     import xml.etree.ElementTree as ET
 
 import os
+
+from turingmachine import TuringMachine
+from binaryparser import BinaryParser
+from atomicfile import write_file
 """
 @Author: Lachlan Smith
 @Modified: 9/05/2015
@@ -19,103 +23,204 @@ class XmlParser:
 	@desc: Loads, from an XML file, a turing machine as specified on the
 		   spec sheet. The xml file is then converted to a TuringMachine
 		   (see turingmachine.py)
+		   The file is streamed through iterparse and each state is thrown away once read,
+		   so big machines never sit in memory as a whole tree.
 	@param: path - path of a valid XML file.
-	@param: tm_gui - the turing machine gui which we can add states/transitions to
-	@param: tape_gui - the turing tape gui which we can load the tape into.
+	@return: the TuringMachine, or None if the file couldn't be read.
 	"""
-	def load_machine(path, tm_gui, tape_gui):
+	def parse_machine(path):
 		try:
-			with open(path) as stream:
-				tm_str = stream.read()
+			events = ET.iterparse(path, events=('start', 'end'))
 		except IOError:
 			print('Invalid path:' + str(path))
-			return False
+			return None
+
+		# TODO: PROPER ERROR CHECKING.
+		machine = TuringMachine()
+		initial_state_name = None
+		end_states = set()
+
+		# Transitions are added as they are read (keeping their order) and pointed at
+		# their new state at the end, as it may not have been read yet.
+		transitions = []
+		curr_state = None
+		states_XML = None
 
 		try:
-		    turingXML = ET.fromstring(tm_str)
+			for event, elem in events:
+				tag = elem.tag
+
+				if event == 'start':
+					if tag == 'state':
+						pos = (float(elem.attrib['xpos']), float(elem.attrib['ypos']))
+						curr_state = machine.add_state(elem.attrib['name'], pos)
+					elif tag == 'states':
+						states_XML = elem
+					continue
+
+				if tag == 'transition':
+					transition = machine.add_transition(curr_state, None, elem.attrib['move'], elem.attrib['seensym'],
+														elem.attrib['writesym'], (float(elem.attrib['ctlx']),
+														float(elem.attrib['ctly'])))
+					transitions.append((transition, elem.attrib['newstate']))
+
+				elif tag == 'state':
+					curr_state = None
+					# Drop the state (and its transitions) now they have been read.
+					elem.clear()
+					if states_XML is not None:
+						states_XML.clear()
+
+				elif tag == 'finalstate':
+					end_states.add(elem.attrib['name'])
+
+				elif tag == 'initialstate':
+					initial_state_name = elem.attrib['name']
+
+				elif tag == 'initialtape':
+					machine.initial_tape = elem.text
+
+				elif tag == 'alphabet':
+					machine.alphabet = elem.text or ''
+
+				elif tag == 'blank':
+					machine.blank_char = elem.attrib['char']
+
 		except ET.ParseError:
 		    print ('Invalid xml file: ' + str(path))
-		    return False
-
-		# TODO: PROPER ERROR CHECKING.
-		# TODO: ALPHABET AND BLANK CHARACTER.
-		tm_gui.create_new_machine()
+		    return None
 
-		xmlRoot = turingXML
+		machine.set_start_state(machine.get_state_by_name(initial_state_name))
 
-		tape_gui.set_initial_tape(xmlRoot.find('initialtape').text)
-		# alphabet = xmlRoot.find('alphabet').text
-		# blankChar = xmlRoot.find('blank').attrib['char']
-		initial_state_name = xmlRoot.find('initialstate').attrib['name']
+		for state in machine.states:
+			if state.name in end_states:
+				state.set_final_state(True)
 
-		# Parsing final states
-		end_states = []
+		# Resolving transitions
+		for transition, to_state_name in transitions:
+			transition.to_state = machine.get_state_by_name(to_state_name)
+			if transition.to_state is None:
+				print('Warning: Transition to unknown state ' + str(to_state_name))
+				machine.remove_transition(transition)
 
-		final_states_XML = xmlRoot.find('finalstates')
+		return machine
 
-		for stateXML in final_states_XML:
-		    end_states.append(stateXML.attrib['name'])
+	parse_machine = staticmethod(parse_machine)
 
-		statesXML = xmlRoot.find('states')
-		transitions = []
+	"""
+	STATIC METHOD
+	@desc: Loads a machine file of either format, going by its extension.
+		   (.tmb files are binary, see binaryparser.py. Everything else is XML)
+	@return: the TuringMachine, or None if the file couldn't be read.
+	"""
+	def read_machine_file(path):
+		if BinaryParser.is_binary_path(path):
+			return BinaryParser.parse_machine(path)
+		return XmlParser.parse_machine(path)
 
-		for stateXML in statesXML:
-		    state_name = stateXML.attrib['name']
-		    pos = (float(stateXML.attrib['xpos']), float(stateXML.attrib['ypos']))
-		    new_state = tm_gui.add_state(pos, True, state_name)
+	read_machine_file = staticmethod(read_machine_file)
 
-		    if state_name == initial_state_name:
-		    	new_state.set_start_state(True)
-		    	tm_gui.start_state = new_state
+	"""
+	STATIC METHOD
+	@desc: Saves a machine in the format its extension asks for. (See read_machine_file)
+	"""
+	def write_machine_file(path, machine):
+		if BinaryParser.is_binary_path(path):
+			return BinaryParser.write_machine(path, machine)
+		return XmlParser.write_machine(path, machine)
 
-		    if state_name in end_states:
-		    	new_state.set_final_state(True)
+	write_machine_file = staticmethod(write_machine_file)
 
-		    for transitionXML in stateXML:
-		        newTransition = (new_state, transitionXML.attrib['newstate'], (float(transitionXML.attrib['ctlx']), 
-		        				float(transitionXML.attrib['ctly'])), transitionXML.attrib['move'],
-		        				transitionXML.attrib['seensym'], transitionXML.attrib['writesym'])
-		        transitions.append(newTransition)
+	"""
+	STATIC METHOD
+	@desc: Loads a .tm (or .tmb) file into the guis.
+	@param: path - path of a valid machine file.
+	@param: tm_gui - the turing machine gui which we can add states/transitions to
+	@param: tape_gui - the turing tape gui which we can load the tape into.
+	"""
+	def load_machine(path, tm_gui, tape_gui):
+		machine = XmlParser.read_machine_file(path)
+		if machine is None:
+			return False
 
-		# Creating transitions
-		for t_xml in transitions:
-			to_state = tm_gui.get_state_by_name(t_xml[1])
-			tm_gui.add_transition(t_xml[0], to_state, t_xml[2], t_xml[3], t_xml[4], t_xml[5])
-		tm_gui.undo_handler.reset()
-		
+		XmlParser.build_machine(machine, tm_gui, tape_gui)
 		return True
 
 	load_machine = staticmethod(load_machine)
 
 	"""
 	STATIC METHOD
-	@desc: Uses the two guis to save a .tm file 
+	@desc: Replaces the machine in the guis with the given TuringMachine.
+	"""
+	def build_machine(machine, tm_gui, tape_gui):
+		tm_gui.create_new_machine()
+
+		tape_gui.set_initial_tape(machine.initial_tape)
+
+		# The undo history is reset after loading, so nothing is recorded.
+		tm_gui.begin_batch()
+		try:
+			gui_states = {}
+			for state in machine.states:
+				new_state = tm_gui.add_state(state.pos, True, state.name, True)
+				gui_states[state] = new_state
+
+				if state is machine.start_state:
+					new_state.set_start_state(True)
+					tm_gui.start_state = new_state
+
+				if state.final_state:
+					new_state.set_final_state(True)
+
+			for transition in machine.transitions:
+				tm_gui.add_transition(gui_states[transition.from_state], gui_states[transition.to_state],
+									  transition.anchor_offset, transition.direction, transition.read_sym,
+									  transition.write_sym, -1, True)
+		finally:
+			tm_gui.end_batch()
+		tm_gui.undo_handler.reset()
+
+	build_machine = staticmethod(build_machine)
+
+	"""
+	STATIC METHOD
+	@desc: Uses the two guis to save a .tm (or .tmb) file 
 	@param: path - path to save the machine at.
 	@param: tm_gui - the turing machine gui which we can read states/transitions from
 	@param: tape_gui - the turing tape gui which we can read the tape from.
 	"""
 	def save_machine(path, tm_gui, tape_gui) :
+		return XmlParser.write_machine_file(path, TuringMachine.from_gui(tm_gui, tape_gui))
+
+	save_machine = staticmethod(save_machine)
+
+	"""
+	STATIC METHOD
+	@desc: Saves a TuringMachine as a .tm file
+	@param: path - path to save the machine at.
+	@param: machine - the TuringMachine to save.
+	"""
+	def write_machine(path, machine):
 		root = ET.Element('turingmachine')
 
-		ET.SubElement(root, 'alphabet').text = 'ab'
-		ET.SubElement(root, 'blank', {'char':'_'})
-		tape_str = tape_gui.get_tape_str()
+		ET.SubElement(root, 'alphabet').text = machine.alphabet
+		ET.SubElement(root, 'blank', {'char':machine.blank_char})
 		
-		if tape_str == '':
-			ET.SubElement(root, 'initialtape').text = '_'
+		if not machine.initial_tape:
+			ET.SubElement(root, 'initialtape').text = machine.blank_char
 		else:
-			ET.SubElement(root, 'initialtape').text = tape_gui.get_tape_str()
+			ET.SubElement(root, 'initialtape').text = machine.initial_tape
 		
 
-		if tm_gui.start_state:
-			ET.SubElement(root, 'initialstate', {'name':tm_gui.start_state.name})
+		if machine.start_state:
+			ET.SubElement(root, 'initialstate', {'name':machine.start_state.name})
 		else:
 			ET.SubElement(root, 'initialstate', {'name':'no_initial_state'})
 
 		finalstates = ET.SubElement(root, 'finalstates')
 		states = ET.SubElement(root, 'states')
 
-		for state in tm_gui.states:
+		for state in machine.states:
 
 			if state.final_state:
 				ET.SubElement(finalstates, 'finalstate', {'name':state.name})
@@ -131,13 +236,14 @@ class XmlParser:
 					
 		machine_str = ET.tostring(root, encoding='utf8', method='xml')
 
+		# tostring gives bytes when given an encoding.
+		# Written to a temp file first, so a crash mid-save can't truncate the old file.
 		try:
-			with open(path, 'w') as stream:
-				stream.write(machine_str)
-		except IOError:
+			write_file(path, machine_str)
+		except (IOError, OSError):
 			print('Invalid path:' + str(path))
 			return False
 
 		return True
 
-	save_machine = staticmethod(save_machine)
+	write_machine = staticmethod(write_machine)
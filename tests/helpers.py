@@ -0,0 +1,79 @@
+"""
+@Desc: Machines and a plain reference simulator shared by the tests.
+       The reference steps the kivy-free machine model on the original deque tape, one
+       transition at a time, the way the gui's simulator did before any of the engines.
+"""
+
+from turingmachine import TuringMachine
+from turingtape_deque import TuringTape
+
+
+"""
+@desc: Builds a random machine (with some states missing transitions, so some runs halt).
+@param: rng - a random.Random.
+@return: (machine, initial tape)
+"""
+def random_machine(rng, state_count=4, symbols='_ab'):
+    machine = TuringMachine(symbols[1:], symbols[0])
+    states = [machine.add_state('q' + str(index)) for index in range(state_count)]
+    for state in states:
+        state.set_final_state(rng.random() < .3)
+        for read_sym in symbols:
+            if rng.random() < .8:
+                machine.add_transition(state, rng.choice(states), rng.choice('LR'), read_sym, rng.choice(symbols))
+    machine.set_start_state(states[0])
+
+    tape_str = ''.join(rng.choice(symbols[1:]) for index in range(rng.randrange(8)))
+    return machine, tape_str
+
+
+"""
+@desc: A machine which adds one to a binary number forever, so it never halts or repeats.
+"""
+def counter_machine():
+    machine = TuringMachine('01', '_')
+    right = machine.add_state('right')
+    carry = machine.add_state('carry')
+    for sym in '01':
+        machine.add_transition(right, right, 'R', sym, sym)
+    machine.add_transition(right, carry, 'L', '_', '_')
+    machine.add_transition(carry, carry, 'L', '1', '0')
+    machine.add_transition(carry, right, 'R', '0', '1')
+    machine.add_transition(carry, right, 'R', '_', '1')
+    machine.set_start_state(right)
+    return machine
+
+
+"""
+@desc: Runs a machine model on the deque tape.
+@return: (halt reason, steps, final state name, tape string, head position from the first
+          character of the initial tape)
+"""
+def run_reference(machine, tape_str, max_steps):
+    tape = TuringTape(tape_str, machine.blank_char, True)
+    state = machine.start_state
+    origin = 0
+    steps = 0
+
+    while steps < max_steps:
+        transition = None
+        for candidate in state.out_transitions:
+            if candidate.read_sym == tape.get_curr_letter():
+                transition = candidate
+                break
+        if transition is None:
+            halt_reason = 'accept' if state.final_state else 'reject'
+            return halt_reason, steps, state.name, tape.get_tape_str(), tape.tape_index - origin
+
+        tape.write(transition.write_sym)
+        if transition.direction == 'L':
+            # The deque grows on the left by pushing everything along.
+            if tape.tape_index == 0:
+                origin += 1
+            tape.move_left()
+        else:
+            tape.move_right()
+        state = transition.to_state
+        steps += 1
+
+    return 'step_limit', steps, state.name, tape.get_tape_str(), tape.tape_index - origin
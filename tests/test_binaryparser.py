@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+
+from helpers import random_machine
+from binaryparser import BinaryParser
+from xmlparser import XmlParser
+
+SUBTRACTOR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'subtractor.tm')
+
+
+# Everything a .tm file keeps about a machine. (Positions are whole numbers in both formats)
+def describe(machine):
+    states = []
+    for state in machine.states:
+        transitions = [(transition.read_sym, transition.write_sym, transition.direction, transition.to_state.name,
+                        int(transition.anchor_offset[0]), int(transition.anchor_offset[1]))
+                       for transition in state.out_transitions]
+        states.append((state.name, int(state.pos[0]), int(state.pos[1]), state.final_state, transitions))
+    start_name = machine.start_state.name if machine.start_state else None
+    return machine.alphabet, machine.blank_char, machine.initial_tape, start_name, states
+
+
+def test_round_trip_subtractor(tmp_path):
+    machine = XmlParser.read_machine_file(SUBTRACTOR_PATH)
+    path = str(tmp_path / 'subtractor.tmb')
+
+    assert XmlParser.write_machine_file(path, machine)
+    assert describe(XmlParser.read_machine_file(path)) == describe(machine)
+
+    # And back to xml.
+    xml_path = str(tmp_path / 'subtractor.tm')
+    assert XmlParser.write_machine_file(xml_path, XmlParser.read_machine_file(path))
+    assert describe(XmlParser.read_machine_file(xml_path)) == describe(machine)
+
+
+def test_round_trip_random_machines():
+    rng = random.Random(40)
+    for seed in range(100):
+        machine, tape_str = random_machine(rng, rng.randrange(1, 8), '_ab1')
+        machine.initial_tape = tape_str
+        for state in machine.states:
+            state.pos = (rng.randrange(-3000, 3000), rng.randrange(-3000, 3000))
+        for transition in machine.transitions:
+            transition.anchor_offset = (rng.randrange(-100, 100), rng.randrange(-100, 100))
+        if rng.random() < .2:
+            machine.set_start_state(None)
+
+        data = BinaryParser.pack_machine(machine)
+        assert describe(BinaryParser.unpack_machine(data)) == describe(machine), seed
+
+
+def test_round_trip_unicode(tmp_path):
+    machine, tape_str = random_machine(random.Random(41), 3, u'_αβ')
+    machine.states[1].name = u'état'
+    machine.initial_tape = u'αβα'
+    path = str(tmp_path / 'unicode.tmb')
+
+    assert BinaryParser.write_machine(path, machine)
+    assert describe(BinaryParser.parse_machine(path)) == describe(machine)
+
+
+def test_bad_files(tmp_path):
+    machine = XmlParser.read_machine_file(SUBTRACTOR_PATH)
+    data = BinaryParser.pack_machine(machine)
+
+    for name, contents in [('empty.tmb', b''), ('garbage.tmb', b'garbage' * 10), ('cut.tmb', data[:len(data) // 2])]:
+        path = tmp_path / name
+        path.write_bytes(contents)
+        assert BinaryParser.parse_machine(str(path)) is None, name
+
+    assert BinaryParser.parse_machine(str(tmp_path / 'missing.tmb')) is None
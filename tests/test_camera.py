@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+# camera.py builds the fbo's kivy Matrix.
+pytest.importorskip('kivy.graphics.transformation')
+
+from camera import Camera
+
+
+def close(a, b, tolerance=1e-6):
+    return abs(a[0] - b[0]) <= tolerance * max(1, abs(b[0])) and abs(a[1] - b[1]) <= tolerance * max(1, abs(b[1]))
+
+
+def random_camera(rng):
+    camera = Camera()
+    for move in range(200):
+        if rng.random() < .5:
+            camera.pan((rng.uniform(-50, 50), rng.uniform(-50, 50)))
+        else:
+            camera.zoom((rng.uniform(-500, 500), rng.uniform(-500, 500)), rng.uniform(.8, 1.25))
+    return camera
+
+
+def test_round_trip():
+    rng = random.Random(60)
+    for seed in range(50):
+        camera = random_camera(rng)
+        for point in range(50):
+            pos = (rng.uniform(-2000, 2000), rng.uniform(-2000, 2000))
+            assert close(camera.to_world(camera.to_screen(pos)), pos)
+            assert close(camera.to_screen(camera.to_world(pos)), pos)
+
+
+def test_points_match_single_conversions():
+    rng = random.Random(61)
+    camera = random_camera(rng)
+    points = [(rng.uniform(0, 800), rng.uniform(0, 600)) for point in range(1000)]
+
+    world_points = camera.to_world_points(points)
+    assert world_points == [camera.to_world(pos) for pos in points]
+    assert camera.to_screen_points(world_points) == [camera.to_screen(pos) for pos in world_points]
+    assert all(close(a, b) for a, b in zip(camera.to_screen_points(world_points), points))
+
+
+def test_zoom_keeps_origin_on_screen():
+    rng = random.Random(62)
+    camera = random_camera(rng)
+    for zoom in range(100):
+        origin = (rng.uniform(-500, 500), rng.uniform(-500, 500))
+        before = camera.to_screen(origin)
+        camera.zoom_to(origin, rng.uniform(.2, 3))
+        assert close(camera.to_screen(origin), before)
+
+
+def test_view_bounds_and_matrix():
+    camera = random_camera(random.Random(63))
+    left, bottom, right, top = camera.get_view_bounds((800, 600))
+    assert close((left, bottom), camera.to_world((0, 0))) and close((right, top), camera.to_world((800, 600)))
+
+    matrix = camera.get_matrix()
+    assert camera.get_matrix() is matrix
+    for pos in [(0, 0), (123.5, -40), (-900, 700)]:
+        assert close(matrix.transform_point(pos[0], pos[1], 0)[:2], camera.to_screen(pos))
+
+    camera.pan((1, 1))
+    assert camera.get_matrix() is not matrix
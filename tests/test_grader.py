@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+
+import pytest
+
+from helpers import counter_machine
+from grader import grade, grade_machine, write_report, REPORT_FIELDS, STATUS_ERROR, STATUS_TIMEOUT
+from turingmachine import TuringMachine
+from turingengine import HALT_ACCEPT, HALT_REJECT, HALT_STEP_LIMIT
+from xmlparser import XmlParser
+
+
+# Moves right over 1s, then halts on the first blank. Ends in an accepting state if final.
+def scan_machine(final):
+    machine = TuringMachine('1', '_')
+    state = machine.add_state('scan')
+    state.set_final_state(final)
+    machine.add_transition(state, state, 'R', '1', '1')
+    machine.set_start_state(state)
+    return machine
+
+
+def save(tmp_path, name, machine):
+    path = str(tmp_path / name)
+    assert XmlParser.write_machine_file(path, machine)
+    return path
+
+
+def get_statuses(rows):
+    return [row[2] for row in rows]
+
+
+@pytest.mark.parametrize('block_size', [None, 4])
+def test_halt_statuses(tmp_path, block_size):
+    accept_path = save(tmp_path, 'accept.tm', scan_machine(True))
+    reject_path = save(tmp_path, 'reject.tm', scan_machine(False))
+    counter_path = save(tmp_path, 'counter.tm', counter_machine())
+
+    rows = grade_machine((accept_path, ['111', ''], 1000, None, block_size))
+    assert get_statuses(rows) == [HALT_ACCEPT, HALT_ACCEPT]
+    # The final tape runs from the first non blank to the furthest cell visited, as in the gui.
+    assert rows[0][:5] == ['accept.tm', '111', HALT_ACCEPT, '111_', 3]
+    assert rows[0][6] == ''
+
+    assert get_statuses(grade_machine((reject_path, ['11'], 1000, None, block_size))) == [HALT_REJECT]
+
+    rows = grade_machine((counter_path, ['0'], 1000, None, block_size))
+    assert get_statuses(rows) == [HALT_STEP_LIMIT] and rows[0][4] == 1000
+
+
+def test_timeout(tmp_path):
+    counter_path = save(tmp_path, 'counter.tm', counter_machine())
+    # The timeout is checked between chunks of steps, so any timeout stops after the first.
+    rows = grade_machine((counter_path, ['0'], None, 1e-9, None))
+    assert get_statuses(rows) == [STATUS_TIMEOUT] and rows[0][4] > 0
+
+
+def test_errors(tmp_path):
+    no_start = scan_machine(True)
+    no_start.set_start_state(None)
+    no_start_path = save(tmp_path, 'no_start.tm', no_start)
+
+    rows = grade_machine((no_start_path, ['1', '11'], 1000, None, None))
+    assert get_statuses(rows) == [STATUS_ERROR, STATUS_ERROR]
+    assert rows[0][6] == 'ValueError: no start state'
+
+    bad_path = tmp_path / 'bad.tm'
+    bad_path.write_text(u'<notamachine>')
+    rows = grade_machine((str(bad_path), ['1'], 1000, None, None))
+    assert get_statuses(rows) == [STATUS_ERROR]
+
+    # A tape with more symbols than the engine can hold only fails that tape.
+    too_many = u''.join(chr(0x100 + index) for index in range(300))
+    accept_path = save(tmp_path, 'accept.tm', scan_machine(True))
+    rows = grade_machine((accept_path, ['1', too_many, '11'], 1000, None, None))
+    assert get_statuses(rows) == [HALT_ACCEPT, STATUS_ERROR, HALT_ACCEPT]
+    assert rows[1][6].startswith('ValueError: Too many tape symbols')
+
+
+def test_grade_and_report(tmp_path):
+    machine_dir = tmp_path / 'machines'
+    machine_dir.mkdir()
+    save(machine_dir, 'b_reject.tm', scan_machine(False))
+    save(machine_dir, 'a_accept.tm', scan_machine(True))
+    (machine_dir / 'notes.txt').write_text(u'not a machine')
+
+    rows = grade(str(machine_dir), ['1', '11'], 1000, None, processes=1)
+    assert [(row[0], row[1], row[2]) for row in rows] == [
+        ('a_accept.tm', '1', HALT_ACCEPT), ('a_accept.tm', '11', HALT_ACCEPT),
+        ('b_reject.tm', '1', HALT_REJECT), ('b_reject.tm', '11', HALT_REJECT)]
+
+    json_path = str(tmp_path / 'report.json')
+    write_report(json_path, rows)
+    with open(json_path) as stream:
+        report = json.load(stream)
+    assert [entry['status'] for entry in report] == get_statuses(rows)
+    assert sorted(report[0]) == sorted(REPORT_FIELDS)
+
+    csv_path = str(tmp_path / 'report.csv')
+    write_report(csv_path, rows)
+    with open(csv_path) as stream:
+        report = list(csv.reader(stream))
+    assert report[0] == REPORT_FIELDS
+    assert [entry[2] for entry in report[1:]] == get_statuses(rows)
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from helpers import counter_machine, random_machine, run_reference
+from turingmachine import TuringMachine
+from turingengine import CompiledMachine, TuringEngine, HALT_STEP_LIMIT
+from turingengine import HALT_CONFIG_REPEAT, HALT_TRANSLATED_CYCLE
+from macroengine import MacroEngine
+
+
+def make_engine(machine, tape_str, engine_class=TuringEngine, **limits):
+    compiled = CompiledMachine(machine.states, machine.start_state, machine.blank_char)
+    if engine_class is MacroEngine:
+        engine = MacroEngine(compiled, tape_str, block_size=4)
+    else:
+        engine = engine_class(compiled, tape_str)
+    engine.set_limits(**limits)
+    return engine
+
+
+# Steps back and forth between two cells forever.
+def shuttle_machine():
+    machine = TuringMachine('a', '_')
+    left = machine.add_state('left')
+    right = machine.add_state('right')
+    machine.add_transition(left, right, 'R', '_', '_')
+    machine.add_transition(right, left, 'L', '_', '_')
+    machine.set_start_state(left)
+    return machine
+
+
+# Writes the pattern into fresh blank tape forever, heading the given way.
+def sweep_machine(direction, pattern='ab'):
+    machine = TuringMachine(pattern, '_')
+    states = [machine.add_state('q' + str(index)) for index in range(len(pattern))]
+    for index, state in enumerate(states):
+        machine.add_transition(state, states[(index + 1) % len(states)], direction, '_', pattern[index])
+    machine.set_start_state(states[0])
+    return machine
+
+
+def test_repeat_detected():
+    engine = make_engine(shuttle_machine(), '', detect_repeats=True)
+    assert engine.run(1000) == HALT_CONFIG_REPEAT
+    assert engine.halted
+
+
+@pytest.mark.parametrize('direction', ['L', 'R'])
+@pytest.mark.parametrize('pattern', ['a', 'ab', 'aab'])
+def test_translated_cycle_detected(direction, pattern):
+    engine = make_engine(sweep_machine(direction, pattern), '', detect_translation=True)
+    assert engine.run(10000) == HALT_TRANSLATED_CYCLE
+
+
+def test_sweep_needs_translation_detection():
+    # Without translation detection a sweep is only stopped by the step limit.
+    engine = make_engine(sweep_machine('R'), '', detect_repeats=True)
+    assert engine.run(5000) == HALT_STEP_LIMIT
+
+
+def test_counter_not_flagged():
+    engine = make_engine(counter_machine(), '', detect_repeats=True, detect_translation=True)
+    assert engine.run(50000) == HALT_STEP_LIMIT
+    assert engine.steps == 50000
+
+
+def test_sweep_over_input_not_flagged():
+    # Heads right over a long input, then halts at the first blank.
+    machine = TuringMachine('a', '_')
+    state = machine.add_state('q0')
+    machine.add_transition(state, state, 'R', 'a', 'b')
+    machine.set_start_state(state)
+
+    engine = make_engine(machine, 'a' * 500, detect_repeats=True, detect_translation=True)
+    assert engine.run(10000) == 'reject'
+    assert engine.steps == 500
+
+
+@pytest.mark.parametrize('engine_class', [TuringEngine, MacroEngine])
+def test_random_machines(engine_class):
+    rng = random.Random(10)
+    flagged = 0
+    for seed in range(300):
+        machine, tape_str = random_machine(rng)
+        expected = run_reference(machine, tape_str, 20000)
+
+        engine = make_engine(machine, tape_str, engine_class, detect_repeats=True,
+                             detect_translation=engine_class is TuringEngine)
+        halt_reason = engine.run(20000)
+        if halt_reason in (HALT_CONFIG_REPEAT, HALT_TRANSLATED_CYCLE):
+            # Only machines which really never halt may be flagged.
+            assert expected[0] == HALT_STEP_LIMIT, seed
+            flagged += 1
+        else:
+            assert (halt_reason, engine.steps, engine.get_tape_str()) == \
+                (expected[0], expected[1], expected[3]), seed
+
+    assert flagged > 0
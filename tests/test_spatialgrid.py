@@ -0,0 +1,81 @@
+import random
+
+from spatialgrid import SpatialGrid
+
+
+def random_bounds(rng):
+    left = rng.uniform(-1000, 1000)
+    bottom = rng.uniform(-1000, 1000)
+    return (left, bottom, left + rng.uniform(0, 250), bottom + rng.uniform(0, 250))
+
+
+def contains(bounds, pos):
+    return bounds[0] <= pos[0] <= bounds[2] and bounds[1] <= pos[1] <= bounds[3]
+
+
+def check_queries(grid, bounds_by_obj, rng):
+    for query in range(500):
+        pos = (rng.uniform(-1100, 1300), rng.uniform(-1100, 1300))
+        candidates = grid.query(pos)
+        # Every object under the point is a candidate, and no object is there twice.
+        assert len(candidates) == len(set(candidates))
+        for obj, bounds in bounds_by_obj.items():
+            if contains(bounds, pos):
+                assert obj in candidates
+
+
+def test_query_finds_every_object_under_a_point():
+    rng = random.Random(50)
+    grid = SpatialGrid(cell_size=100)
+    bounds_by_obj = {}
+    for obj in range(300):
+        bounds_by_obj[obj] = random_bounds(rng)
+        grid.update(obj, bounds_by_obj[obj])
+
+    assert len(grid) == 300
+    check_queries(grid, bounds_by_obj, rng)
+
+
+def test_moves_and_removes():
+    rng = random.Random(51)
+    grid = SpatialGrid(cell_size=64)
+    bounds_by_obj = {}
+    for obj in range(200):
+        bounds_by_obj[obj] = random_bounds(rng)
+        grid.update(obj, bounds_by_obj[obj])
+
+    for change in range(2000):
+        obj = rng.randrange(200)
+        if obj in bounds_by_obj and rng.random() < .2:
+            grid.remove(obj)
+            del bounds_by_obj[obj]
+            assert obj not in grid
+        else:
+            bounds_by_obj[obj] = random_bounds(rng)
+            grid.update(obj, bounds_by_obj[obj])
+            assert obj in grid
+
+    assert len(grid) == len(bounds_by_obj)
+    check_queries(grid, bounds_by_obj, rng)
+
+    # Nothing is left behind in cells it moved out of.
+    for cell, objs in grid.cells.items():
+        assert objs
+        for obj in objs:
+            first_x, first_y, last_x, last_y = grid.object_cells[obj]
+            assert first_x <= cell[0] <= last_x and first_y <= cell[1] <= last_y
+
+
+def test_empty_and_cleared():
+    grid = SpatialGrid()
+    assert list(grid.query((0, 0))) == []
+
+    grid.update('state', (-10, -10, 10, 10))
+    assert list(grid.query((-5, -5))) == ['state'] and list(grid.query((5, 5))) == ['state']
+    grid.remove('state')
+    grid.remove('state')
+    assert list(grid.query((0, 0))) == [] and not grid.cells
+
+    grid.update('state', (0, 0, 10, 10))
+    grid.clear()
+    assert len(grid) == 0 and list(grid.query((5, 5))) == []
@@ -0,0 +1,117 @@
+import random
+
+from helpers import random_machine
+from stephistory import StepHistory
+from turingengine import CompiledMachine, TuringEngine
+
+
+"""
+@desc: Runs a machine, recording every step into a history the way the simulator does.
+@return: (compiled machine, history, the tape snapshot at every step)
+"""
+def record_run(machine, tape_str, history, max_steps):
+    compiled = CompiledMachine(machine.states, machine.start_state, machine.blank_char)
+    engine = TuringEngine(compiled, tape_str)
+    tape = engine.tape
+    tapes = []
+
+    for step_no in range(max_steps):
+        state_id = engine.state
+        trans_id = compiled.get_transition_id(state_id, tape.cells[tape.head])
+        move = compiled.trans_move[trans_id] if trans_id != -1 else 0
+
+        tape_snapshot = tape.snapshot()
+        if history.snapshot_due(step_no):
+            history.add_snapshot(step_no, state_id, tape_snapshot, len(tape_snapshot[0]))
+        history.append(state_id, trans_id, tape.cells[tape.head], move)
+        tapes.append(tape_snapshot)
+
+        if trans_id == -1:
+            break
+        engine.step()
+
+    return compiled, history, tapes
+
+
+# Restores the nearest snapshot and replays up to the step, as TuringSimulator.seek_step does.
+def seek(compiled, history, step_no):
+    snap_step, state_id, (tape_str, tape_index) = history.nearest_snapshot(step_no)
+    replay = step_no - snap_step
+    cells = [compiled.blank_char] * replay + list(tape_str) + [compiled.blank_char] * replay
+    head = replay + tape_index
+    lo = replay
+    hi = replay + len(tape_str)
+
+    for step in range(snap_step, step_no):
+        trans_id = history.trans_ids[step]
+        cells[head] = compiled.symbols[compiled.trans_write[trans_id]]
+        head += compiled.trans_move[trans_id]
+        lo = min(lo, head)
+        hi = max(hi, head + 1)
+
+    return ''.join(cells[lo:hi]), head - lo
+
+
+def test_step_back_across_snapshots():
+    rng = random.Random(20)
+    for seed in range(60):
+        machine, tape_str = random_machine(rng)
+        history = StepHistory(snapshot_interval=4)
+        compiled, history, tapes = record_run(machine, tape_str, history, 300)
+        assert len(history) == len(tapes)
+
+        # Back one step at a time from the end, as the step back button does.
+        for step_no in reversed(range(len(tapes))):
+            assert seek(compiled, history, step_no) == tapes[step_no], (seed, step_no)
+            assert history.get_step(step_no)[0] == history.state_ids[step_no]
+
+
+def test_step_back_after_thinning():
+    rng = random.Random(21)
+    thinned = 0
+    for seed in range(40):
+        machine, tape_str = random_machine(rng)
+        # A budget of a few dozen snapshots, so they are thinned out several times over.
+        history = StepHistory(snapshot_interval=2, memory_budget=400)
+        compiled, history, tapes = record_run(machine, tape_str, history, 500)
+
+        assert history.snapshot_steps[0] == 0
+        assert all(step_no % history.snapshot_interval == 0 for step_no in history.snapshot_steps)
+        for step_no in range(len(tapes) - 1, -1, -7):
+            assert seek(compiled, history, step_no) == tapes[step_no], (seed, step_no)
+        if history.snapshot_interval > 2 and len(history.snapshot_steps) > 2:
+            thinned += 1
+
+    assert thinned > 0
+
+
+def test_jumps():
+    history = StepHistory(snapshot_interval=2, memory_budget=10)
+    for step_no in range(4):
+        history.append(0, 0, 0, 1)
+    history.add_snapshot(0, 0, ('a', 0), 1)
+    history.add_checkpoint(3, 0, ('abc', 2), 3)
+
+    # Step 3 to step 4 took 1000 machine steps.
+    history.add_jump(3, 1000)
+    history.add_checkpoint(4, 0, ('abcd', 3), 4)
+    history.append(0, 0, 0, 1)
+    history.append(0, 0, 0, 1)
+
+    assert history.is_jump(3) and not history.is_jump(2) and not history.is_jump(4)
+    assert [history.get_machine_step(step_no) for step_no in range(6)] == [0, 1, 2, 3, 1003, 1004]
+
+    # Thinning never drops the checkpoints either side of the jump.
+    for step_no in range(6, 40):
+        history.append(0, 0, 0, 1)
+        if history.snapshot_due(step_no):
+            history.add_snapshot(step_no, 0, ('x' * 10, 0), 10)
+    assert 3 in history.snapshot_steps and 4 in history.snapshot_steps
+    assert history.nearest_snapshot(4)[2] == ('abcd', 3)
+
+    # Keeping step 4 keeps the jump to it, dropping it drops the jump too.
+    history.truncate(5)
+    assert history.is_jump(3) and history.get_machine_step(4) == 1003
+    history.truncate(4)
+    assert not history.is_jump(3) and history.get_machine_step(3) == 3
+    assert history.snapshot_steps[-1] == 3 and history.checkpoints == set([3])
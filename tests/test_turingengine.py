@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from helpers import random_machine, run_reference
+from turingengine import CompiledMachine, TuringEngine, HALT_STEP_LIMIT
+from macroengine import MacroEngine
+
+
+def make_engine(engine_class, machine, tape_str):
+    compiled = CompiledMachine(machine.states, machine.start_state, machine.blank_char)
+    if engine_class is MacroEngine:
+        # Small blocks, so the runs cross plenty of block edges.
+        return MacroEngine(compiled, tape_str, block_size=4)
+    return engine_class(compiled, tape_str)
+
+
+def get_result(engine, halt_reason):
+    return halt_reason, engine.steps, engine.get_state().name, engine.get_tape_str(), engine.get_head_position()
+
+
+@pytest.mark.parametrize('engine_class', [TuringEngine, MacroEngine])
+def test_matches_reference(engine_class):
+    rng = random.Random(1)
+    for seed in range(400):
+        machine, tape_str = random_machine(rng)
+        expected = run_reference(machine, tape_str, 2000)
+
+        engine = make_engine(engine_class, machine, tape_str)
+        assert get_result(engine, engine.run(2000)) == expected, seed
+
+
+@pytest.mark.parametrize('engine_class', [TuringEngine, MacroEngine])
+def test_matches_reference_in_chunks(engine_class):
+    rng = random.Random(2)
+    for seed in range(200):
+        machine, tape_str = random_machine(rng)
+        expected = run_reference(machine, tape_str, 1000)
+
+        engine = make_engine(engine_class, machine, tape_str)
+        halt_reason = HALT_STEP_LIMIT
+        while engine.steps < 1000 and halt_reason == HALT_STEP_LIMIT:
+            halt_reason = engine.run(min(rng.randrange(1, 60), 1000 - engine.steps))
+        assert get_result(engine, halt_reason) == expected, seed
+
+
+def test_single_steps_match_reference():
+    rng = random.Random(3)
+    for seed in range(100):
+        machine, tape_str = random_machine(rng)
+        engine = make_engine(TuringEngine, machine, tape_str)
+        for steps in range(1, 60):
+            halt_reason = engine.step()
+            expected = run_reference(machine, tape_str, steps)
+            assert get_result(engine, halt_reason) == expected, (seed, steps)
+            if halt_reason != HALT_STEP_LIMIT:
+                break
+
+
+def test_halted_engine_stays_halted():
+    rng = random.Random(4)
+    machine, tape_str = random_machine(rng)
+    machine.states[0].out_transitions = []
+    engine = make_engine(TuringEngine, machine, tape_str)
+
+    halt_reason = engine.run(10)
+    assert engine.halted and engine.steps == 0
+    assert engine.run(10) == halt_reason and engine.steps == 0
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from turingtape_deque import TuringTape as TuringTape_Deque
+from turingtape_array import TuringTape as TuringTape_Array
+from turingtape_rle import TuringTape as TuringTape_RLE
+
+
+def get_view(tape, rng):
+    from_index = rng.randrange(-5, 15)
+    total_chars = rng.randrange(0, 12)
+    return (tape.get_curr_letter(), tape.tape_index, tape.get_first_index(), tape.get_tape_str(), str(tape),
+            list(tape.get_characters(from_index, total_chars)))
+
+
+@pytest.mark.parametrize('tape_class', [TuringTape_Array, TuringTape_RLE])
+def test_matches_deque(tape_class):
+    rng = random.Random(30)
+    for seed in range(200):
+        tape_str = ''.join(rng.choice('_ab') for index in range(rng.randrange(6)))
+        expected = TuringTape_Deque(tape_str, '_', True)
+        tape = tape_class(tape_str, '_', True)
+
+        for op in range(200):
+            choice = rng.random()
+            if choice < .4:
+                sym = rng.choice('_abc')
+                expected.write(sym)
+                tape.write(sym)
+            elif choice < .7:
+                assert tape.move_left() == expected.move_left()
+            else:
+                assert tape.move_right() == expected.move_right()
+
+            # Both views read the same window.
+            assert get_view(tape, random.Random(op)) == get_view(expected, random.Random(op)), (seed, op)
+
+
+def test_rle_keeps_runs_merged():
+    rng = random.Random(31)
+    tape = TuringTape_RLE('', '_', True)
+    for op in range(5000):
+        if rng.random() < .5:
+            tape.write(rng.choice('_a'))
+        elif rng.random() < .5:
+            tape.move_left()
+        else:
+            tape.move_right()
+
+        assert all(tape.syms[index] != tape.syms[index + 1] for index in range(len(tape.syms) - 1))
+        assert tape.starts == sorted(tape.starts) and tape.starts[-1] < tape.end
+
+
+def test_long_blank_sweep_costs_one_run():
+    tape = TuringTape_RLE('ab', '_', True)
+    for index in range(100000):
+        tape.move_right()
+    tape.write('c')
+
+    assert tape.get_runs() == [('a', 1), ('b', 1), ('_', 99998), ('c', 1)]
+    assert tape.get_tape_str() == 'ab' + '_' * 99998 + 'c'
+
+
+def test_snapshots_move_between_tapes():
+    rng = random.Random(32)
+    for seed in range(100):
+        tape_str = ''.join(rng.choice('_ab') for index in range(rng.randrange(1, 30)))
+        tape_index = rng.randrange(len(tape_str))
+
+        array_tape = TuringTape_Array(tape_str, '_', True)
+        array_tape.tape_index = tape_index
+        rle_tape = TuringTape_RLE('', '_', True)
+        rle_tape.restore(array_tape.snapshot())
+        assert str(rle_tape) == str(array_tape)
+
+        # Runs carry a tape both ways, and through the rle tape's own snapshots.
+        copy = TuringTape_RLE('', '_', True)
+        copy.restore(rle_tape.snapshot())
+        assert str(copy) == str(array_tape)
+
+        array_copy = TuringTape_Array('', '_', True)
+        array_copy.set_runs(copy.get_runs(), copy.tape_index)
+        assert str(array_copy) == str(array_tape)
+        assert array_tape.get_runs() == copy.get_runs()